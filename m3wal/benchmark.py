@@ -0,0 +1,401 @@
+"""
+M3WAL benchmarks
+
+Usage:
+    python -m m3wal.benchmark startup [--runs N] [--json results.json]
+    python -m m3wal.benchmark pipeline [--runs N] [--sizes 4k,8k] [--content photo]
+                                       [--formats jpg,png,rgba]
+                                       [--json results.json] [--baseline old.json]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that must not be imported just to start the CLI
+HEAVY_MODULES = ("material_color_utilities", "PIL", "numpy")
+
+# Synthetic wallpaper sizes (name -> width, height)
+SIZES = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+    "ultrawide": (3440, 1440),
+}
+
+CONTENTS = ("photo", "flat", "gray")
+
+# File formats: JPEG (draft decode), PNG (decode + reduce) and RGBA PNG
+# (strip conversion, alpha kept)
+FORMATS = ("jpg", "png", "rgba")
+
+# Pipeline stages, in the order run_pipeline() runs them
+PIPELINE_STAGES = (
+    "load_image",
+    "analyze_wallpaper",
+    "auto_select_variant",
+    "quantize_source",
+    "generate_scheme",
+    "apply_all_templates",
+    "generate_palette_preview",
+    "generate_all_variants_preview",
+)
+
+# Short column names for the results table
+STAGE_LABELS = {
+    "load_image": "decode",
+    "analyze_wallpaper": "analyze",
+    "auto_select_variant": "auto_variant",
+    "quantize_source": "quantize",
+    "generate_scheme": "scheme",
+    "apply_all_templates": "templates",
+    "generate_palette_preview": "palette",
+    "generate_all_variants_preview": "all_variants",
+}
+
+# Same entry point as the console script
+ENTRY_POINT = "import sys; from m3wal.m3wal import main; sys.argv[0] = 'm3wal'; main()"
+
+
+def measure_import_time(module="m3wal.m3wal"):
+    """Parse `python -X importtime` for module
+
+    Returns:
+        Dict with total cumulative import time (ms), the slowest modules by
+        self time and any heavy modules that got imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total_us = next((cum for name, _, cum in entries if name == module), 0)
+    slowest = sorted(entries, key=lambda e: e[1], reverse=True)[:10]
+    heavy = sorted({
+        name for name, _, _ in entries
+        if name.split(".")[0] in HEAVY_MODULES
+    })
+
+    return {
+        "total_ms": total_us / 1000,
+        "slowest": [{"module": name, "self_ms": s / 1000} for name, s, _ in slowest],
+        "heavy_modules": heavy,
+    }
+
+
+def measure_command(args, runs=10, env=None):
+    """Median wall time (ms) of running the CLI with args"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", ENTRY_POINT, *args],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure_cache_hit(runs=10):
+    """Median wall time (ms) of `m3wal <wallpaper> -g` with a warm scheme cache
+
+    Runs in a scratch HOME on a synthetic 1080p wallpaper; the first
+    (uncached) run is not counted.
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix="m3wal-bench-") as workdir:
+        wallpaper = make_wallpaper(os.path.join(workdir, "wall.jpg"), *SIZES["1080p"])
+        env = dict(os.environ, HOME=workdir)
+        measure_command([wallpaper, "-g"], 1, env)
+        return measure_command([wallpaper, "-g"], runs, env)
+
+
+def run_startup(runs=10):
+    """Startup benchmark: import time, --help, argument errors and a cache hit"""
+    baseline = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"])
+        baseline.append((time.perf_counter() - start) * 1000)
+
+    results = {
+        "python": sys.version.split()[0],
+        "interpreter_ms": statistics.median(baseline),
+        "import": measure_import_time(),
+        "help_ms": measure_command(["--help"], runs),
+        "arg_error_ms": measure_command(["--mode", "bogus"], runs),
+        "cache_hit_ms": measure_cache_hit(runs),
+    }
+    return results
+
+
+def print_startup(results):
+    print(f"Python {results['python']}")
+    print(f"Interpreter startup:  {results['interpreter_ms']:.1f} ms")
+    print(f"m3wal --help:         {results['help_ms']:.1f} ms")
+    print(f"m3wal (arg error):    {results['arg_error_ms']:.1f} ms")
+    print(f"m3wal <img> -g (hit): {results['cache_hit_ms']:.1f} ms "
+          f"({results['cache_hit_ms'] - results['interpreter_ms']:.1f} ms over the interpreter)")
+    print(f"import m3wal.m3wal:   {results['import']['total_ms']:.1f} ms")
+
+    heavy = results["import"]["heavy_modules"]
+    if heavy:
+        print(f"⚠ Heavy modules imported at startup: {', '.join(heavy)}")
+
+    print("\nSlowest imports (self time):")
+    for entry in results["import"]["slowest"]:
+        print(f"  {entry['self_ms']:7.2f} ms  {entry['module']}")
+
+
+def make_wallpaper(path, width, height, content="photo", seed=0, fmt="jpg"):
+    """Write a deterministic synthetic wallpaper
+
+    photo: smooth colored shapes + film grain, flat: a few solid color
+    blocks, gray: the photo content without color. fmt is 'jpg', 'png' or
+    'rgba' (PNG with a transparent-to-opaque alpha gradient).
+    """
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+
+    if content == "flat":
+        # 4x3 grid of solid colors from a small palette
+        palette = rng.integers(0, 256, size=(5, 3), dtype=np.uint8)
+        grid = palette[rng.integers(0, len(palette), size=(3, 4))]
+        img = Image.fromarray(grid).resize((width, height), Image.NEAREST)
+    else:
+        # Low-res color field upscaled smoothly, then tiled grain on top
+        field = rng.integers(0, 256, size=(9, 16, 3), dtype=np.uint8)
+        img = Image.fromarray(field).resize((width, height), Image.BICUBIC)
+        grain = rng.normal(0, 12, size=(256, 256, 1)).astype(np.int16)
+        reps = (-(-height // 256), -(-width // 256), 1)
+        pixels = np.asarray(img, dtype=np.int16) + np.tile(grain, reps)[:height, :width]
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+        if content == "gray":
+            img = img.convert("L").convert("RGB")
+
+    if fmt == "rgba":
+        alpha = np.linspace(0, 255 * 2, width).clip(0, 255).astype(np.uint8)
+        img.putalpha(Image.fromarray(np.broadcast_to(alpha, (height, width)).copy()))
+    if fmt == "jpg":
+        img.save(path, quality=90)
+    else:
+        img.save(path, compress_level=1)
+    return path
+
+
+def benchmark_config():
+    """In-memory config: cache off, previews on, nothing read from HOME"""
+    import configparser
+
+    config = configparser.ConfigParser()
+    config.read_dict({
+        "General": {"mode": "auto", "variant": "auto", "brightness_threshold": "128"},
+        "Cache": {"enabled": "false"},
+    })
+    return config
+
+
+def time_stages(wallpaper, output_dir):
+    """Run every pipeline stage once on a fresh instance, return ms per stage"""
+    import contextlib
+    import io
+    from .m3wal import M3WAL
+
+    m3wal = M3WAL(str(wallpaper), benchmark_config(), use_cache=False)
+    # Decode and quantize run on their own first, so analyze and scheme
+    # time only their own work
+    stages = {
+        "load_image": m3wal.load_image,
+        "analyze_wallpaper": m3wal.analyze_wallpaper,
+        "auto_select_variant": m3wal.auto_select_variant,
+        "quantize_source": m3wal.quantize_source,
+        "generate_scheme": lambda: m3wal.generate_scheme("dark", "AUTO"),
+        "apply_all_templates": lambda: m3wal.apply_all_templates(output_dir=output_dir),
+        "generate_palette_preview": lambda: m3wal.generate_palette_preview(
+            os.path.join(output_dir, "palette.png")),
+        "generate_all_variants_preview": lambda: m3wal.generate_all_variants_preview(
+            os.path.join(output_dir, "all_variants.png")),
+    }
+
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in PIPELINE_STAGES:
+            start = time.perf_counter()
+            stages[name]()
+            timings[name] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def run_pipeline_suite(sizes=None, contents=None, runs=3, formats=None):
+    """Time each pipeline stage on synthetic wallpapers
+
+    Every run uses a fresh instance with the scheme cache disabled and HOME
+    pointed at a scratch directory, so only bundled templates are rendered
+    and nothing in the real HOME is touched.
+
+    Returns:
+        Dict with environment info and per-wallpaper median stage timings (ms)
+    """
+    import tempfile
+    from .m3wal import _library_version
+
+    sizes = sizes or list(SIZES)
+    contents = contents or list(CONTENTS)
+    formats = formats or list(FORMATS)
+    results = {
+        "python": sys.version.split()[0],
+        "library_version": _library_version(),
+        "runs": runs,
+        "wallpapers": {},
+    }
+
+    old_home = os.environ.get("HOME")
+    with tempfile.TemporaryDirectory(prefix="m3wal-bench-") as workdir:
+        os.environ["HOME"] = workdir
+        try:
+            cases = [(s, c, f) for s in sizes for c in contents for f in formats]
+            for size, content, fmt in cases:
+                width, height = SIZES[size]
+                # JPEG keeps the plain name, so older baselines still compare
+                name = f"{size}-{content}" if fmt == "jpg" else f"{size}-{content}-{fmt}"
+                seed = sizes.index(size) * len(contents) + contents.index(content)
+                suffix = ".jpg" if fmt == "jpg" else ".png"
+                wallpaper = make_wallpaper(os.path.join(workdir, name + suffix),
+                                           width, height, content, seed, fmt)
+                output_dir = os.path.join(workdir, "out", name)
+
+                samples = [time_stages(wallpaper, output_dir) for _ in range(runs)]
+                stages = {stage: statistics.median(t[stage] for t in samples)
+                          for stage in PIPELINE_STAGES}
+                results["wallpapers"][name] = {
+                    "width": width,
+                    "height": height,
+                    "content": content,
+                    "format": fmt,
+                    "stages": stages,
+                    "total_ms": sum(stages.values()),
+                }
+                print(f"{name:<23} {sum(stages.values()):8.1f} ms", file=sys.stderr)
+        finally:
+            if old_home is None:
+                os.environ.pop("HOME", None)
+            else:
+                os.environ["HOME"] = old_home
+
+    return results
+
+
+def print_pipeline(results):
+    print(f"Python {results['python']}  ({results['library_version']}, median of {results['runs']})\n")
+    header = "".join(f"{STAGE_LABELS[stage]:>13}" for stage in PIPELINE_STAGES)
+    print(f"{'wallpaper':<23}{header}{'total':>10}")
+    for name, entry in results["wallpapers"].items():
+        row = "".join(f"{entry['stages'][stage]:13.1f}" for stage in PIPELINE_STAGES)
+        print(f"{name:<23}{row}{entry['total_ms']:10.1f}")
+
+
+def compare_pipeline(results, baseline, threshold=10.0, min_ms=1.0):
+    """Print per-stage deltas against a baseline result file
+
+    A stage regresses when it is more than threshold percent and more
+    than min_ms slower than the baseline.
+
+    Returns:
+        List of (wallpaper, stage, baseline_ms, current_ms) regressions
+    """
+    regressions = []
+    print(f"\nComparison with baseline (regression: > {threshold:g}% and > {min_ms:g} ms)")
+    for name, entry in results["wallpapers"].items():
+        base_entry = baseline.get("wallpapers", {}).get(name)
+        if not base_entry:
+            print(f"  {name}: not in baseline")
+            continue
+        for stage in PIPELINE_STAGES + ("total_ms",):
+            current = entry["total_ms"] if stage == "total_ms" else entry["stages"][stage]
+            base = base_entry["total_ms"] if stage == "total_ms" else base_entry["stages"].get(stage)
+            if base is None:
+                continue
+            delta = (current - base) / base * 100 if base else 0.0
+            regressed = delta > threshold and current - base > min_ms
+            if regressed and stage != "total_ms":
+                regressions.append((name, stage, base, current))
+            marker = "  ⚠ regression" if regressed else ""
+            print(f"  {name:<23} {stage:<30} {base:9.1f} → {current:9.1f} ms ({delta:+6.1f}%){marker}")
+
+    print(f"\n{len(regressions)} regression(s)")
+    return regressions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m m3wal.benchmark",
+                                     description="M3WAL benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="CLI startup and import time")
+    startup.add_argument("--runs", type=int, default=10, help="Runs per measurement (median)")
+    startup.add_argument("--json", help="Write results to JSON file")
+
+    pipeline = subparsers.add_parser("pipeline", help="Per-stage timings on synthetic wallpapers")
+    pipeline.add_argument("--runs", type=int, default=3, help="Runs per wallpaper (median)")
+    pipeline.add_argument("--sizes", default=",".join(SIZES),
+                          help=f"Comma-separated sizes ({', '.join(SIZES)})")
+    pipeline.add_argument("--content", default=",".join(CONTENTS),
+                          help=f"Comma-separated content types ({', '.join(CONTENTS)})")
+    pipeline.add_argument("--formats", default=",".join(FORMATS),
+                          help=f"Comma-separated file formats ({', '.join(FORMATS)})")
+    pipeline.add_argument("--json", help="Write results to JSON file")
+    pipeline.add_argument("--baseline", help="Compare against a saved results JSON")
+    pipeline.add_argument("--threshold", type=float, default=10.0,
+                          help="Regression threshold in percent (default: 10)")
+
+    args = parser.parse_args(argv)
+    status = 0
+
+    if args.command == "startup":
+        results = run_startup(args.runs)
+        print_startup(results)
+
+    elif args.command == "pipeline":
+        sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+        contents = [c.strip().lower() for c in args.content.split(",") if c.strip()]
+        formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+        unknown = [s for s in sizes if s not in SIZES] + [c for c in contents if c not in CONTENTS] + \
+            [f for f in formats if f not in FORMATS]
+        if unknown:
+            parser.error(f"unknown size/content/format: {', '.join(unknown)}")
+
+        results = run_pipeline_suite(sizes, contents, args.runs, formats)
+        print_pipeline(results)
+
+        if args.baseline:
+            with open(os.path.expanduser(args.baseline)) as f:
+                baseline = json.load(f)
+            if compare_pipeline(results, baseline, args.threshold):
+                status = 1
+
+    if args.json:
+        with open(os.path.expanduser(args.json), "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to: {args.json}")
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,427 +6,947 @@ Install: pip install material-color-utilities Pillow
 """
 
 import os 
-import subprocess
 import json
 import sys
+import math
+import re
+import threading
+from array import array
+from collections.abc import Mapping
 from pathlib import Path
 
-from material_color_utilities import Variant, hex_from_argb, theme_from_image
-from PIL import Image
+# Heavy dependencies (material_color_utilities, PIL, NumPy) are imported
+# lazily by the stages that need them, so --help, argument errors and
+# cache hits don't pay for them.
 
-class M3Color:
-    def __init__(self, wallpaper_path, config=None):
-        self.wallpaper_path = wallpaper_path
-        self.theme = None
-        self.mode = None
-        self.source_color = None
-        self.config = config if config else self.load_config()
-        self.brightness_threshold = int(self.config.get('General', 'brightness_threshold', fallback='128'))
+# Bump when analysis or extraction output changes so stale cache entries are ignored
+CACHE_VERSION = 6
 
-    def load_config(self):
-        """Load configuration from m3-colors.conf"""
-        import configparser
-        
-        config_file = Path.home() / ".config" / "m3-colors" / "m3-colors.conf"
-        
-        # Default config
-        defaults = {
-            'mode': 'auto',
-            'variant': 'auto',
-            'brightness_threshold': '128',
-            'operation_mode': 'full',  
-            'templates_dir': 'templates',
-            'cache_dir': '~/.cache/m3-colors',
-            'config_dir': '~/.config/m3-colors',
-            'set_wallpaper': 'true',
-            'apply_xresources': 'true',
-            'generate_palette_preview': 'true',
-            'run_post_script': 'true',
-            'create_symlink': 'true',
-            'script_path': 'm3wal-post.sh',
-            'scripts_dir': '~/.config/m3-colors/hooks',
-            'hook_scripts_enabled': 'false',
-            'hook_scripts': 'eww.sh'
-        }
-        
-        config = configparser.ConfigParser()
-        
-        if config_file.exists():
-            config.read(config_file)
-            
-            # Update missing options
-            if not config.has_option('General', 'operation_mode'):
-                if not config.has_section('General'):
-                    config.add_section('General')
-                config.set('General', 'operation_mode', defaults['operation_mode'])
-            
-            # Add Hooks section if missing
-            if not config.has_section('Hooks'):
-                config.add_section('Hooks')
-                config.set('Hooks', 'scripts_dir', defaults['scripts_dir'])
-            
-            # Add Hook.Scripts section if missing
-            if not config.has_section('Hook.Scripts'):
-                config.add_section('Hook.Scripts')
-                config.set('Hook.Scripts', 'enabled', defaults['hook_scripts_enabled'])
-                config.set('Hook.Scripts', 'scripts', defaults['hook_scripts'])
-            
-            # Save updated config
-            with open(config_file, 'w') as f:
-                config.write(f)
-        else:
-            # make default config
-            config['General'] = {
-                'mode': defaults['mode'],
-                'variant': defaults['variant'],
-                'brightness_threshold': defaults['brightness_threshold'],
-                'operation_mode': defaults['operation_mode']
-            }
-            config['Paths'] = {
-                'templates_dir': defaults['templates_dir'],
-                'cache_dir': defaults['cache_dir'],
-                'config_dir': defaults['config_dir']
-            }
-            config['Features'] = {
-                'set_wallpaper': defaults['set_wallpaper'],
-                'apply_xresources': defaults['apply_xresources'],
-                'generate_palette_preview': defaults['generate_palette_preview'],
-                'run_post_script': defaults['run_post_script'],
-                'create_symlink': defaults['create_symlink']
-            }
-            config['Hooks'] = {
-                'scripts_dir': defaults['scripts_dir']
-            }
-            config['Hook.Scripts'] = {
-                'enabled': defaults['hook_scripts_enabled'],
-                'scripts': defaults['hook_scripts']
-            }
-            config['PostScript'] = {
-                'script_path': defaults['script_path']
-            }
-            
-            config_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(config_file, 'w') as f:
-                config.write(f)
-        
-        return config
+# theme_from_image() thumbnails its input to 128x128 before quantizing
+QUANTIZE_SIZE = (128, 128)
 
-    def analyze_wallpaper(self):
-        """Extract dominant color & detect brightness"""
-        img = Image.open(self.wallpaper_path)
+# Default decode bound for analysis (0 = always decode full resolution)
+DEFAULT_MAX_ANALYSIS_PIXELS = 1920 * 1080
 
-        # Detect brightness for auto mode
-        grayscale = img.convert("L")
-        pixels = grayscale.tobytes()
-        avg_brightness = sum(pixels) / len(pixels)
+# Pixels in the stratified sample used for brightness/HSV metrics
+ANALYSIS_SAMPLES = 256 * 256
 
-        # Auto select light/dark mode based on threshold
-        self.mode = "dark" if avg_brightness < self.brightness_threshold else "light"
+# Default ceiling for decoded image memory (0 = no limit)
+DEFAULT_MAX_MEMORY_MB = 1024
 
-        return {"brightness": avg_brightness, "mode": self.mode}
+# Pillow stores RGB padded to 4 bytes/pixel; the analysis image and its
+# thumbnail copy live at the same time
+ANALYSIS_BYTES_PER_PIXEL = 2 * 4
 
-    def auto_select_variant(self):
-        """Auto-select best variant - IMPROVED VERSION"""
-        import colorsys
-        from PIL import Image
-        import numpy as np
-        
-        # Analyze wallpaper
-        img = Image.open(self.wallpaper_path)
-        img = img.resize((100, 100))
-        pixels = np.array(img)
-        
-        # Flatten untuk analysis
-        if len(pixels.shape) == 3:
-            if pixels.shape[2] == 4:  # RGBA
-                pixels = pixels[:, :, :3]  # Drop alpha
-            pixels = pixels.reshape(-1, 3)
-        
-        # Calculate metrics
-        saturations = []
-        values = []
-        hues = []
-        
-        for r, g, b in pixels[:1000]:
-            h, s, v = colorsys.rgb_to_hsv(r/255, g/255, b/255)
-            saturations.append(s)
-            values.append(v)
-            hues.append(h)
-        
-        # Metrics
-        avg_sat = np.mean(saturations)
-        avg_val = np.mean(values)
-        sat_std = np.std(saturations)
-        hue_std = np.std(hues)
-        
-        # Decision logic
-        if avg_sat < 0.10:
-            return "MONOCHROME", f"Grayscale wallpaper (sat={avg_sat:.2f})"
-        
-        if avg_sat < 0.30 and sat_std < 0.20:
-            return "NEUTRAL", f"Muted colors (sat={avg_sat:.2f}, consistent tone)"
-        
-        if avg_sat > 0.40 and hue_std > 0.25:
-            return "EXPRESSIVE", f"Diverse colors (sat={avg_sat:.2f}, hue_variety={hue_std:.2f})"
-        
-        if 0.25 < avg_sat < 0.50 and sat_std < 0.25:
-            return "FIDELITY", f"Natural colors (sat={avg_sat:.2f}, preserve original)"
-        
-        if avg_sat > 0.60:
-            return "VIBRANT", f"Bold colors (sat={avg_sat:.2f})"
-        
-        return "CONTENT", f"Balanced (sat={avg_sat:.2f}, safe choice)"
+# Pixels converted at a time when reducing RGBA/palette/CMYK images
+STRIP_PIXELS = 4 * 1024 * 1024
 
-    def generate_scheme(self, mode=None, variant="CONTENT"):
-        """Generate Material 3 color scheme"""
-        if mode:
-            self.mode = mode
+# Perceptual hash: dHash over a 9x8 grayscale thumbnail (64 bits)
+PHASH_SIZE = 8
 
-        # Auto-select variant if requested
-        if variant.upper() == "AUTO":
-            variant, reason = self.auto_select_variant()
-            print(f"[AUTO] Selected variant: {variant}")
-            print(f"[AUTO] Reason: {reason}")
-        
-        self.variant = variant
+# Max per-channel difference of mean colors for a perceptual match, so
+# recolored versions of the same artwork (same structure) don't match
+PHASH_COLOR_TOLERANCE = 12
 
-        # Map string to Variant enum
-        variant_map = {
-            "TONALSPOT": Variant.TONALSPOT,
-            "VIBRANT": Variant.VIBRANT,
-            "EXPRESSIVE": Variant.EXPRESSIVE,
-            "NEUTRAL": Variant.NEUTRAL,
-            "FIDELITY": Variant.FIDELITY,
-            "CONTENT": Variant.CONTENT,
-            "MONOCHROME": Variant.MONOCHROME,
-        }
+VARIANTS = ['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL',
+            'FIDELITY', 'CONTENT', 'MONOCHROME']
+MODES = ['light', 'dark']
 
-        variant_enum = variant_map.get(variant.upper(), Variant.CONTENT)
+# Color roles of a Scheme, in storage (and export) order
+SCHEME_ROLES = (
+    # Primary
+    'm3primary', 'm3onPrimary', 'm3primaryContainer', 'm3onPrimaryContainer',
+    'm3primaryFixed', 'm3primaryFixedDim', 'm3onPrimaryFixed', 'm3onPrimaryFixedVariant',
+    # Secondary
+    'm3secondary', 'm3onSecondary', 'm3secondaryContainer', 'm3onSecondaryContainer',
+    'm3secondaryFixed', 'm3secondaryFixedDim', 'm3onSecondaryFixed', 'm3onSecondaryFixedVariant',
+    # Tertiary
+    'm3tertiary', 'm3onTertiary', 'm3tertiaryContainer', 'm3onTertiaryContainer',
+    'm3tertiaryFixed', 'm3tertiaryFixedDim', 'm3onTertiaryFixed', 'm3onTertiaryFixedVariant',
+    # Error
+    'm3error', 'm3onError', 'm3errorContainer', 'm3onErrorContainer',
+    # Surface
+    'm3surface', 'm3onSurface', 'm3surfaceVariant', 'm3onSurfaceVariant',
+    'm3surfaceDim', 'm3surfaceBright', 'm3surfaceContainerLowest', 'm3surfaceContainerLow',
+    'm3surfaceContainer', 'm3surfaceContainerHigh', 'm3surfaceContainerHighest',
+    # Background (deprecated in M3 but kept for compatibility)
+    'm3background', 'm3onBackground',
+    # Outline
+    'm3outline', 'm3outlineVariant',
+    # Inverse
+    'm3inverseSurface', 'm3inverseOnSurface', 'm3inversePrimary',
+    # Shadow & Scrim
+    'm3shadow', 'm3scrim',
+) + tuple(f'term{i}' for i in range(16))
 
-        # Generate theme from image
-        img = Image.open(self.wallpaper_path)
-        self.theme = theme_from_image(img, 0, variant_enum)
+# Swatch order of the palette previews: every M3 role (except the deprecated
+# background roles, same as surface), then the terminal colors
+PREVIEW_COLOR_KEYS = tuple(role for role in SCHEME_ROLES if role not in ('m3background', 'm3onBackground'))
 
-        # Get source color
-        self.source_color = self.theme.source
+# PNG zlib level for previews: palette images are tiny, favour encode speed
+PNG_COMPRESS_LEVEL = 1
 
-        return self._extract_colors()
 
-    def _extract_colors(self):
-        """Extract all M3 colors + 16 terminal colors"""
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
+def _to_hex(color):
+    """Hex string for an ARGB int (older library versions); hex passes through"""
+    if isinstance(color, int):
+        from material_color_utilities import hex_from_argb
+        return hex_from_argb(color)
+    return color
 
-        # Select scheme based on mode
-        scheme = (
-            self.theme.schemes.dark if self.mode == "dark" else self.theme.schemes.light
-        )
 
-        m3_colors = {
-            # Primary
-            "m3primary": scheme.primary,
-            "m3onPrimary": scheme.on_primary,
-            "m3primaryContainer": scheme.primary_container,
-            "m3onPrimaryContainer": scheme.on_primary_container,
-            "m3primaryFixed": scheme.primary_fixed,
-            "m3primaryFixedDim": scheme.primary_fixed_dim,
-            "m3onPrimaryFixed": scheme.on_primary_fixed,
-            "m3onPrimaryFixedVariant": scheme.on_primary_fixed_variant,
-            # Secondary
-            "m3secondary": scheme.secondary,
-            "m3onSecondary": scheme.on_secondary,
-            "m3secondaryContainer": scheme.secondary_container,
-            "m3onSecondaryContainer": scheme.on_secondary_container,
-            "m3secondaryFixed": scheme.secondary_fixed,
-            "m3secondaryFixedDim": scheme.secondary_fixed_dim,
-            "m3onSecondaryFixed": scheme.on_secondary_fixed,
-            "m3onSecondaryFixedVariant": scheme.on_secondary_fixed_variant,
-            # Tertiary
-            "m3tertiary": scheme.tertiary,
-            "m3onTertiary": scheme.on_tertiary,
-            "m3tertiaryContainer": scheme.tertiary_container,
-            "m3onTertiaryContainer": scheme.on_tertiary_container,
-            "m3tertiaryFixed": scheme.tertiary_fixed,
-            "m3tertiaryFixedDim": scheme.tertiary_fixed_dim,
-            "m3onTertiaryFixed": scheme.on_tertiary_fixed,
-            "m3onTertiaryFixedVariant": scheme.on_tertiary_fixed_variant,
-            # Error
-            "m3error": scheme.error,
-            "m3onError": scheme.on_error,
-            "m3errorContainer": scheme.error_container,
-            "m3onErrorContainer": scheme.on_error_container,
-            # Surface
-            "m3surface": scheme.surface,
-            "m3onSurface": scheme.on_surface,
-            "m3surfaceVariant": scheme.surface_variant,
-            "m3onSurfaceVariant": scheme.on_surface_variant,
-            "m3surfaceDim": scheme.surface_dim,
-            "m3surfaceBright": scheme.surface_bright,
-            "m3surfaceContainerLowest": scheme.surface_container_lowest,
-            "m3surfaceContainerLow": scheme.surface_container_low,
-            "m3surfaceContainer": scheme.surface_container,
-            "m3surfaceContainerHigh": scheme.surface_container_high,
-            "m3surfaceContainerHighest": scheme.surface_container_highest,
-            # Background (deprecated in M3 but kept for compatibility)
-            "m3background": scheme.surface,
-            "m3onBackground": scheme.on_surface,
-            # Outline
-            "m3outline": scheme.outline,
-            "m3outlineVariant": scheme.outline_variant,
-            # Inverse
-            "m3inverseSurface": scheme.inverse_surface,
-            "m3inverseOnSurface": scheme.inverse_on_surface,
-            "m3inversePrimary": scheme.inverse_primary,
-            # Shadow & Scrim
-            "m3shadow": scheme.shadow,
-            "m3scrim": scheme.scrim,
-        }
+_library_version_string = None
 
-        # Generate terminal colors
-        terminal_colors = self._generate_terminal_colors(scheme)
 
-        all_colors = {**m3_colors, **terminal_colors}
-       
-        for key in list(all_colors.keys()):
-            value = all_colors[key]
-            if isinstance(value, int):
-                all_colors[key] = hex_from_argb(value)
+def _library_version():
+    """Version string of m3wal + material-color-utilities, used in cache keys"""
+    global _library_version_string
+    if _library_version_string is None:
+        _library_version_string = _lookup_library_version()
+    return _library_version_string
 
-         # Add RGB format for KDE
-        for key, value in list(all_colors.items()):
-            if not key.endswith('_rgb'):
-                rgb = self._argb_to_rgb(value)
-                all_colors[f"{key}_rgb"] = f"{rgb[0]},{rgb[1]},{rgb[2]}"
 
-        return all_colors                  
+def _lookup_library_version():
+    versions = [
+        _dist_version("m3wal", "m3wal"),
+        _dist_version("material_color_utilities", "material_color_utilities"),
+    ]
+    return f"c{CACHE_VERSION}-" + "-".join(versions)
 
-    def _generate_terminal_colors(self, scheme):
-        """Generate 16 terminal colors from M3 palette with better contrast"""
-        
-        if self.mode == "dark":
-            # Dark mode: tetap gunakan mapping lama
-            return {
-                "term0": scheme.surface_dim,
-                "term1": scheme.on_error,
-                "term2": scheme.outline_variant,
-                "term3": scheme.on_primary_fixed_variant,
-                "term4": scheme.on_primary,
-                "term5": scheme.surface_container_highest,
-                "term6": scheme.secondary_container,
-                "term7": scheme.inverse_primary,
-                "term8": scheme.inverse_surface,
-                "term9": scheme.error,
-                "term10": scheme.tertiary_fixed,
-                "term11": scheme.primary_fixed,
-                "term12": scheme.primary,
-                "term13": scheme.tertiary,
-                "term14": scheme.tertiary_fixed_dim,
-                "term15": scheme.on_surface,
-            }
-        else:
-            # Light mode: gunakan warna yang lebih kontras
-            return {
-                "term0": scheme.surface_container_highest,  
-                "term1": scheme.error,                       
-                "term2": scheme.on_tertiary_fixed_variant,              
-                "term3": scheme.on_secondary_fixed_variant,          
-                "term4": scheme.primary,                  
-                "term5": scheme.secondary,                
-                "term6": scheme.outline,    
-                "term7": scheme.on_surface_variant,       
-                "term8": scheme.tertiary,          
-                "term9": scheme.on_error_container,       
-                "term10": scheme.tertiary_fixed_dim,      
-                "term11": scheme.on_primary_fixed_variant,
-                "term12": scheme.on_primary_container,    
-                "term13": scheme.on_secondary_container,     
-                "term14": scheme.primary_fixed_dim,
-                "term15": scheme.surface_dim,                
-            }
 
-    def _argb_to_rgb(self, argb_color):
-        """Convert ARGB integer to RGB tuple"""
-        if isinstance(argb_color, int):
-            hex_color = hex_from_argb(argb_color)
-        else:
-            hex_color = argb_color
-        
-        color_clean = hex_color.replace('#', '')
-        return tuple(int(color_clean[j:j+2], 16) for j in (0, 2, 4))
+def _dist_version(module_name, dist_name):
+    """Installed version of a distribution
 
-    def preview_colors(self):
-        """Print color preview"""
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
+    Read from the *.dist-info / *.egg-info metadata next to the package or
+    on sys.path (editable installs). importlib.metadata finds the same
+    files but costs ~30 ms to import, more than a whole cache-hit run.
+    """
+    from importlib.util import find_spec
 
-        colors = self._extract_colors()
+    spec = find_spec(module_name)
+    search = [Path(spec.origin).parent.parent] if spec is not None and spec.origin else []
+    search += [Path(entry or ".") for entry in sys.path]
 
-        print(f"\nColor Preview ({self.mode} mode):")
-        print(
-            f"Source: {hex_from_argb(self.source_color) if isinstance(self.source_color, int) else self.source_color}"
+    for site_dir in search:
+        for suffix in (".dist-info", ".egg-info"):
+            for info_dir in site_dir.glob(f"{dist_name}-*{suffix}"):
+                return info_dir.name[len(dist_name) + 1:-len(suffix)].split("-")[0]
+        try:
+            # setup.py develop: <name>.egg-info/PKG-INFO in the source tree
+            with open(site_dir / f"{dist_name}.egg-info" / "PKG-INFO") as f:
+                for line in f:
+                    if line.startswith("Version:"):
+                        return line.split(":", 1)[1].strip()
+        except OSError:
+            pass
+    return "unknown"
+
+
+class Instrumentation:
+    """Per-stage wall/CPU time and peak RSS, plus an optional event stream
+
+    Stage timings are always recorded (cheap). Events (stage start/end,
+    cache hit/miss, files written, hooks) go to sink, a callable taking a
+    dict, when one is set.
+    """
+
+    def __init__(self, sink=None):
+        import time
+
+        self.sink = sink
+        self.timings = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def emit(self, event, **fields):
+        if self.sink is None:
+            return
+        import time
+
+        message = {"event": event, "time": round(time.perf_counter() - self._start, 6), **fields}
+        with self._lock:
+            self.sink(message)
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        return _StageTimer(self, name)
+
+    def print_report(self):
+        """Print the per-stage timing table"""
+        if not self.timings:
+            return
+        print(f"\n[TIMINGS] {'stage':<24} {'wall ms':>9} {'cpu ms':>9} {'peak RSS MB':>12}")
+        for name, wall, cpu, rss in self.timings:
+            print(f"[TIMINGS] {name:<24} {wall * 1000:9.1f} {cpu * 1000:9.1f} {rss:12.1f}")
+        print(f"[TIMINGS] peak RSS: {peak_rss_mb():.1f} MB")
+
+
+class _StageTimer:
+    """Times a stage: wall clock, process + child CPU, peak RSS afterwards
+
+    CPU time is process-wide, so it includes stages running concurrently.
+    """
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    @staticmethod
+    def _cpu():
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def __enter__(self):
+        import time
+
+        self.instrumentation.emit("stage_start", stage=self.name)
+        self._wall = time.perf_counter()
+        self._cpu_start = self._cpu()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import time
+
+        wall = time.perf_counter() - self._wall
+        cpu = self._cpu() - self._cpu_start
+        rss = peak_rss_mb()
+
+        with self.instrumentation._lock:
+            self.instrumentation.timings.append((self.name, wall, cpu, rss))
+        self.instrumentation.emit(
+            "stage_end", stage=self.name, ok=exc_type is None,
+            wall_ms=round(wall * 1000, 3), cpu_ms=round(cpu * 1000, 3), peak_rss_mb=round(rss, 1),
         )
-        print(f"\nPrimary: {colors['m3primary']}")
-        print(f"Secondary: {colors['m3secondary']}")
-        print(f"Tertiary: {colors['m3tertiary']}")
-        print(f"Surface: {colors['m3surface']}")
-        print(f"Error: {colors['m3error']}")
+        return False
 
-        print(f"\nTerminal Colors:")
-        for i in range(16):
-            print(f"term{i}: {colors[f'term{i}']}")
 
-    def export_json(self, output_path=None, variant="CONTENT"):
-        """Export scheme to JSON"""
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
-        colors = self._extract_colors()
-        
-        # Save to ~/.config/m3-colors/output only
-        config_dir = Path.home() / ".config" / "m3-colors" / "output"
-        config_dir.mkdir(parents=True, exist_ok=True)
-        wallpaper_name = Path(self.wallpaper_path).stem
-        config_path = config_dir / f"{wallpaper_name}_{variant}_scheme.json"
-        
-        output = {
-            "wallpaper": self.wallpaper_path,
-            "mode": self.mode,
-            "variant": variant,
-            "source_color": (
-                hex_from_argb(self.source_color)
-                if isinstance(self.source_color, int)
-                else self.source_color
-            ),
-            "colors": colors,
-        }
-        
-        with open(config_path, "w") as f:
-            json.dump(output, f, indent=2)
-        
-        print(f"Exported to: {config_path}")
-        return str(config_path)
+# Active instrumentation (replaced per run by main() and the daemon)
+_instrumentation = Instrumentation()
 
-    def export_css(self, output_path=None, variant="CONTENT"):
-        """Export scheme to CSS variables"""
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
-        colors = self._extract_colors()
-        
-        # Save to ~/.config/m3-colors/output
-        config_dir = Path.home() / ".config" / "m3-colors" / "output"
-        config_dir.mkdir(parents=True, exist_ok=True)
-        wallpaper_name = Path(self.wallpaper_path).stem
-        
-        if output_path is None:
-            output_path = config_dir / f"{wallpaper_name}_{variant}_scheme.css"
-        
-        # Generate CSS content
-        css_content = f"""/* Material 3 Color Scheme - {variant} */
+
+def set_instrumentation(instrumentation):
+    """Make instrumentation the active one, returns it"""
+    global _instrumentation
+    _instrumentation = instrumentation
+    return instrumentation
+
+
+def stage(name):
+    """Time a pipeline stage with the active instrumentation"""
+    return _instrumentation.stage(name)
+
+
+def emit_event(event, **fields):
+    """Send an event to the active instrumentation's event stream"""
+    _instrumentation.emit(event, **fields)
+
+
+def json_lines_sink(stream):
+    """Event sink writing one JSON object per line (flushed)"""
+    def sink(message):
+        stream.write(json.dumps(message) + "\n")
+        stream.flush()
+    return sink
+
+
+class SchemeCache:
+    """Persistent scheme cache under cache_dir, evicted LRU by last access"""
+
+    # Approximate size per cache directory for this process: counted once,
+    # then kept up to date by put() so eviction only scans when it's due
+    _sizes = {}
+    _scanned = set()
+    _sizes_lock = threading.Lock()
+
+    def __init__(self, cache_dir, max_size_mb=50):
+        self.cache_dir = Path(cache_dir).expanduser() / "schemes"
+        self.max_size = int(float(max_size_mb) * 1024 * 1024)
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        """Return cached entry or None"""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Touch entry so eviction keeps recently used schemes
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return data
+
+    def contains(self, key):
+        return self._entry_path(key).exists()
+
+    def put(self, key, data):
+        """Store entry atomically, evicting once the size cap is crossed"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_name(f".{entry_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+            size = f.tell()
+        try:
+            size -= entry_path.stat().st_size
+        except OSError:
+            pass
+        os.replace(tmp_path, entry_path)
+
+        with self._sizes_lock:
+            cache_key = str(self.cache_dir)
+            total = self._sizes[cache_key] = self._sizes.get(cache_key, 0) + size
+            due = total > self.max_size or cache_key not in self._scanned
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until cache fits max_size
+
+        Trims to 90% of max_size, so the next scan is only due after
+        that much has been written again.
+        """
+        entries = []
+        total_size = 0
+        for entry_path in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total_size += stat.st_size
+
+        if total_size > self.max_size:
+            entries.sort()
+            for _, size, entry_path in entries:
+                if total_size <= self.max_size * 0.9:
+                    break
+                try:
+                    entry_path.unlink()
+                    total_size -= size
+                except OSError:
+                    pass
+
+        with self._sizes_lock:
+            self._sizes[str(self.cache_dir)] = total_size
+            self._scanned.add(str(self.cache_dir))
+
+
+def _has_alpha(img):
+    """Whether an opened image has transparency (alpha band or transparent color)"""
+    return "A" in img.getbands() or "transparency" in img.info
+
+
+def _resize_straight(img, resize):
+    """Apply resize() to an image, to color and alpha separately for RGBA
+
+    Pillow premultiplies alpha when resizing RGBA, which darkens the colors
+    of transparent areas; brightness and variant analysis expect the plain
+    RGB values. Fully opaque pixels come out the same either way.
+    """
+    if img.mode != "RGBA":
+        return resize(img)
+    result = resize(img.convert("RGB"))
+    result.putalpha(resize(img.getchannel("A")))
+    return result
+
+
+def _thumbnail(img, max_size):
+    thumbnail = img.copy()
+    thumbnail.thumbnail(max_size)
+    return thumbnail
+
+
+def _frame_bytes(size, mode):
+    """Memory Pillow needs for a decoded frame of this size and mode"""
+    bytes_per_pixel = {"1": 1, "L": 1, "P": 1, "I;16": 2}.get(mode, 4)
+    return size[0] * size[1] * bytes_per_pixel
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    import resource
+
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class PerceptualIndex:
+    """Perceptual hashes of cached wallpapers, keyed by content hash
+
+    Lets a resized or re-encoded copy of a wallpaper reuse the cache
+    entries of the original instead of being analyzed again.
+    """
+
+    def __init__(self, cache_dir):
+        self.path = Path(cache_dir).expanduser() / "phash_index.json"
+        self._entries = None
+
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def lookup(self, phash, color, max_distance, exclude=None):
+        """Closest entry within max_distance as (content_hash, entry, distance) or None"""
+        best = None
+        for content_hash, entry in self.entries().items():
+            if content_hash == exclude:
+                continue
+            if max(abs(a - b) for a, b in zip(color, entry["color"])) > PHASH_COLOR_TOLERANCE:
+                continue
+            distance = _hamming(phash, int(entry["hash"], 16))
+            if distance <= max_distance and (best is None or distance < best[2]):
+                best = (content_hash, entry, distance)
+        return best
+
+    def add(self, content_hash, phash, color, path):
+        self.update({content_hash: (phash, color, path)})
+
+    def update(self, records):
+        """Add {content_hash: (phash, color, path)} records and save"""
+        import fcntl
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Batch workers update the index concurrently: hold a lock
+            # across re-read, merge and replace so no update gets lost
+            with open(self.path.with_name(self.path.name + ".lock"), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._entries = None
+                entries = self.entries()
+                for content_hash, (phash, color, path) in records.items():
+                    entries[content_hash] = {"hash": f"{phash:016x}", "color": list(color), "path": str(path)}
+                write_if_changed(self.path, json.dumps(entries))
+        except OSError as e:
+            print(f"[CACHE] Failed to update perceptual index: {e}")
+
+
+# Process umask, for permissions of files created via temp-file + rename
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_if_changed(path, content):
+    """Atomically write content (str or bytes) unless the file already has it
+
+    Writes go to a temp file in the same directory followed by os.replace(),
+    so readers never see a partially written file. Symlinked destinations are
+    written through to their target.
+
+    Returns:
+        True if the file was written, False if it was already up to date
+    """
+    path = Path(path)
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    target = path.resolve() if path.is_symlink() else path
+
+    try:
+        with open(target, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    import tempfile
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            os.chmod(tmp_path, os.stat(target).st_mode & 0o7777)
+        except OSError:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+DEPLOY_STRATEGIES = ('atomic-copy', 'copy', 'symlink', 'hardlink', 'reflink')
+
+# Linux ioctl to share extents between files (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+
+def _replace_with(path, create):
+    """Build path atomically: create(tmp_path) next to it, then os.replace()"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        if tmp_path.is_symlink() or tmp_path.exists():
+            tmp_path.unlink()
+        create(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _reflink(src, dest):
+    """Clone src into new file dest without copying data (copy-on-write)"""
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+        fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+
+
+def _to_argb(color):
+    """ARGB/RGB int from an int or '#rrggbb' string"""
+    if isinstance(color, str):
+        return int(color.lstrip('#')[:6], 16)
+    return int(color)
+
+
+_preview_font_cache = None
+
+
+def _preview_font():
+    """Font for preview labels (loaded once)"""
+    global _preview_font_cache
+    if _preview_font_cache is None:
+        from PIL import ImageFont
+
+        for path in ("/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+                     "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"):
+            try:
+                _preview_font_cache = ImageFont.truetype(path, 12)
+                break
+            except OSError:
+                continue
+        else:
+            _preview_font_cache = ImageFont.load_default()
+    return _preview_font_cache
+
+
+# Anti-aliasing steps for label text (palette entries between background and label color)
+LABEL_LEVELS = 8
+
+
+def render_palette(sections, columns=16, cell_size=(80, 60), header_height=0, spacing=0,
+                   background=0xFFFFFF, outline=None, label_color=0xFFFFFF):
+    """Render swatch grids into one image, built as a NumPy index array
+
+    Args:
+        sections: List of (label or None, colors); colors are ARGB ints or
+            '#rrggbb' strings, None leaves a cell empty
+        columns: Swatches per row
+        cell_size: (width, height) of one swatch
+        header_height: Space above each grid for its label
+        spacing: Space after each section
+        background, outline, label_color: RGB ints (outline None = no grid lines)
+
+    Returns:
+        PIL image, palette mode ('P') when it has at most 256 colors
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    cell_w, cell_h = cell_size
+    width = columns * cell_w
+
+    layout = []
+    height = 0
+    for _, colors in sections:
+        rows = -(-len(colors) // columns)
+        layout.append((height + header_height, rows))
+        height += header_height + rows * cell_h + spacing
+
+    # Palette: background, outline, label ramp, then every distinct swatch color
+    def blend(level):
+        a = level / LABEL_LEVELS
+        return sum(
+            round(((background >> shift) & 0xFF) * (1 - a) + ((label_color >> shift) & 0xFF) * a) << shift
+            for shift in (16, 8, 0)
+        )
+
+    fixed = [background, background if outline is None else outline]
+    fixed += [blend(level) for level in range(1, LABEL_LEVELS + 1)]
+
+    values = np.array(
+        [background if c is None else _to_argb(c) for _, colors in sections for c in colors],
+        dtype=np.uint32,
+    ) & 0xFFFFFF
+    unique, inverse = np.unique(values, return_inverse=True)
+    palette = np.concatenate([np.array(fixed, dtype=np.uint32), unique])
+
+    index = np.zeros((height, width), dtype=np.uint16)
+    offset = 0
+    for (top, rows), (_, colors) in zip(layout, sections):
+        cells = np.zeros(rows * columns, dtype=np.uint16)
+        cells[:len(colors)] = inverse[offset:offset + len(colors)] + len(fixed)
+        offset += len(colors)
+
+        bottom = top + rows * cell_h
+        index[top:bottom] = cells.reshape(rows, columns).repeat(cell_h, axis=0).repeat(cell_w, axis=1)
+        if outline is not None:
+            index[top:bottom + 1:cell_h, :] = 1
+            index[top:bottom, ::cell_w] = 1
+
+    # All labels in one pass into a coverage mask, mapped onto the label ramp
+    if any(label for label, _ in sections):
+        mask = Image.new('L', (width, height), 0)
+        draw = ImageDraw.Draw(mask)
+        font = _preview_font()
+        for (top, _), (label, _) in zip(layout, sections):
+            if label:
+                draw.text((5, top - header_height + 3), label, fill=255, font=font)
+        levels = (np.asarray(mask, dtype=np.uint16) * LABEL_LEVELS + 127) // 255
+        index = np.where(levels > 0, levels + 1, index)
+
+    rgb = np.stack([(palette >> 16) & 0xFF, (palette >> 8) & 0xFF, palette & 0xFF], axis=-1).astype(np.uint8)
+    if len(palette) <= 256:
+        img = Image.fromarray(index.astype(np.uint8), 'P')
+        img.putpalette(rgb.tobytes())
+        return img
+    return Image.fromarray(rgb[index], 'RGB')
+
+
+class Scheme(Mapping):
+    """One light or dark color scheme, stored as uint32 ARGB values
+
+    Roles (SCHEME_ROLES) are addressed by name; other formats are computed
+    on first use and cached on the instance:
+
+        scheme.argb('m3primary')        0xffrrggbb
+        scheme.hex('m3primary')         '#rrggbb'
+        scheme.rgb('m3primary')         (r, g, b)
+        scheme.rgba('m3primary', 0.8)   'rgba(r, g, b, 0.8)'
+        scheme.hsl('m3primary')         (hue 0-360, saturation %, lightness %)
+        scheme.floats('m3primary')      (r, g, b) in 0.0-1.0
+
+    As a read-only mapping it has the keys of the former colors dict:
+    role -> '#rrggbb' and role_rgb -> 'r,g,b'.
+    """
+
+    __slots__ = ('_argb', '_formats')
+
+    _index = {role: i for i, role in enumerate(SCHEME_ROLES)}
+
+    def __init__(self, argb):
+        self._argb = array('I', argb)
+        if len(self._argb) != len(SCHEME_ROLES):
+            raise ValueError(f"Scheme needs {len(SCHEME_ROLES)} colors, got {len(self._argb)}")
+        self._formats = None
+
+    @classmethod
+    def from_colors(cls, colors):
+        """Scheme from a role -> color ('#rrggbb' or ARGB int) mapping"""
+        return cls(0xFF000000 | _to_argb(colors[role]) for role in SCHEME_ROLES)
+
+    def __reduce__(self):
+        return (Scheme, (list(self._argb),))
+
+    def _cached(self, fmt, role, compute):
+        formats = self._formats
+        if formats is None:
+            formats = self._formats = {}
+        key = (fmt, role)
+        value = formats.get(key)
+        if value is None:
+            value = formats[key] = compute(self._argb[self._index[role]])
+        return value
+
+    def argb(self, role):
+        return self._argb[self._index[role]]
+
+    def hex(self, role):
+        return f"#{self._argb[self._index[role]] & 0xFFFFFF:06x}"
+
+    def rgb(self, role):
+        return self._cached('rgb', role, lambda c: ((c >> 16) & 0xFF, (c >> 8) & 0xFF, c & 0xFF))
+
+    def rgba(self, role, alpha=1.0):
+        r, g, b = self.rgb(role)
+        return f"rgba({r}, {g}, {b}, {alpha:g})"
+
+    def floats(self, role):
+        return self._cached('floats', role, lambda c: tuple(v / 255 for v in self.rgb(role)))
+
+    def hsl(self, role):
+        import colorsys
+
+        def compute(c):
+            h, l, s = colorsys.rgb_to_hls(*self.floats(role))
+            return (h * 360, s * 100, l * 100)
+        return self._cached('hsl', role, compute)
+
+    def filtered(self, role, filters):
+        """Role color after a parsed placeholder filter chain (cached)"""
+        return self._cached(filters, role, lambda c: apply_filters(c, filters))
+
+    def argb_values(self):
+        """All colors as a list of ARGB ints (SCHEME_ROLES order)"""
+        return list(self._argb)
+
+    # Mapping interface: role -> hex, role_rgb -> 'r,g,b'
+    def __getitem__(self, key):
+        if key in self._index:
+            return self.hex(key)
+        if key.endswith('_rgb') and key[:-4] in self._index:
+            return self._cached('rgb_str', key[:-4], lambda c: ",".join(map(str, self.rgb(key[:-4]))))
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._index or (
+            isinstance(key, str) and key.endswith('_rgb') and key[:-4] in self._index)
+
+    def __iter__(self):
+        yield from SCHEME_ROLES
+        for role in SCHEME_ROLES:
+            yield f"{role}_rgb"
+
+    def __len__(self):
+        return 2 * len(SCHEME_ROLES)
+
+    def __eq__(self, other):
+        if isinstance(other, Scheme):
+            return self._argb == other._argb
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Scheme(primary={self.hex('m3primary')}, surface={self.hex('m3surface')})"
+
+
+def _color_tuple(value):
+    """(r, g, b, alpha) from an ARGB int or '#rrggbb' / '#rrggbbaa' string"""
+    if isinstance(value, int):
+        return ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF, 1.0)
+    if isinstance(value, str) and value.startswith('#') and len(value) in (7, 9):
+        try:
+            channels = [int(value[i:i + 2], 16) for i in range(1, len(value), 2)]
+        except ValueError:
+            pass
+        else:
+            alpha = channels[3] / 255 if len(channels) == 4 else 1.0
+            return (*channels[:3], alpha)
+    raise ValueError(f"not a color: {value!r}")
+
+
+def _filter_hex(color, arg):
+    r, g, b, a = color
+    return f"#{r:02x}{g:02x}{b:02x}" + (f"{round(a * 255):02x}" if a < 1 else "")
+
+
+def _filter_strip(color, arg):
+    return _filter_hex(color, arg)[1:]
+
+
+def _filter_rgb(color, arg):
+    return f"{color[0]},{color[1]},{color[2]}"
+
+
+def _filter_rgba(color, arg):
+    r, g, b, a = color
+    return f"rgba({r}, {g}, {b}, {a:g})"
+
+
+def _filter_hsl(color, arg):
+    import colorsys
+
+    r, g, b, a = color
+    h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+    hsl = f"{h * 360:.0f}, {s * 100:.0f}%, {l * 100:.0f}%"
+    return f"hsl({hsl})" if a >= 1 else f"hsla({hsl}, {a:g})"
+
+
+def _filter_alpha(color, arg):
+    return (*color[:3], arg)
+
+
+def _filter_lighten(color, arg):
+    import colorsys
+
+    r, g, b, a = color
+    h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+    l = min(1.0, max(0.0, l + arg / 100))
+    return (*(round(c * 255) for c in colorsys.hls_to_rgb(h, l, s)), a)
+
+
+def _filter_darken(color, arg):
+    return _filter_lighten(color, -arg)
+
+
+# Placeholder filters: name -> (function(color, arg), argument type or None).
+# Functions get (r, g, b, alpha) and return a color or a formatted string
+def _finite_float(arg):
+    """float() that rejects nan and inf"""
+    value = float(arg)
+    if not math.isfinite(value):
+        raise ValueError(f"not a finite number: {arg}")
+    return value
+
+
+def _alpha_float(arg):
+    """Alpha argument: a finite number between 0 and 1"""
+    value = _finite_float(arg)
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"alpha out of range 0-1: {arg}")
+    return value
+
+
+TEMPLATE_FILTERS = {
+    'hex': (_filter_hex, None),
+    'strip': (_filter_strip, None),
+    'rgb': (_filter_rgb, None),
+    'rgba': (_filter_rgba, None),
+    'hsl': (_filter_hsl, None),
+    'alpha': (_filter_alpha, _alpha_float),
+    'lighten': (_filter_lighten, _finite_float),
+    'darken': (_filter_darken, _finite_float),
+}
+
+
+def parse_filters(chain):
+    """Parse '|name:arg|name' into ((name, arg), ...), or None if invalid"""
+    filters = []
+    for spec in chain.split('|')[1:]:
+        name, sep, arg = spec.partition(':')
+        if name not in TEMPLATE_FILTERS:
+            return None
+        arg_type = TEMPLATE_FILTERS[name][1]
+        if bool(sep) != (arg_type is not None):
+            return None
+        if arg_type is not None:
+            try:
+                arg = arg_type(arg)
+            except ValueError:
+                return None
+        filters.append((name, arg if sep else None))
+    return tuple(filters)
+
+
+def apply_filters(value, filters):
+    """Apply parsed filters to a color; plain colors render as hex"""
+    color = _color_tuple(value)
+    for name, arg in filters:
+        if isinstance(color, str):
+            raise ValueError(f"'{name}' after a formatting filter")
+        color = TEMPLATE_FILTERS[name][0](color, arg)
+    return color if isinstance(color, str) else _filter_hex(color, None)
+
+
+def _filtered_value(colors, key, filters):
+    """Filtered value of key, cached on the Scheme when it is a scheme role"""
+    for mapping in getattr(colors, 'maps', [colors]):
+        if key in mapping:
+            if isinstance(mapping, Scheme) and key in SCHEME_ROLES:
+                return mapping.filtered(key, filters)
+            return apply_filters(mapping[key], filters)
+    return None
+
+
+class CompiledTemplate:
+    """Template parsed once into literal/placeholder segments
+
+    Rendering is a single pass with one dict lookup per placeholder.
+    Placeholders may carry filters ({{m3surface|alpha:0.8|rgba}}), which
+    are only evaluated for the placeholders that use them. Unknown
+    placeholders and invalid filters are left untouched in the output.
+    """
+
+    PLACEHOLDER = re.compile(r"\{\{([A-Za-z0-9_]+)((?:\|[A-Za-z]+(?::[^|{}]*)?)*)\}\}")
+
+    def __init__(self, text):
+        parts = self.PLACEHOLDER.split(text)
+        self.literals = parts[0::3]
+        self.keys = parts[1::3]
+        self.chains = parts[2::3]
+        self.filters = [parse_filters(chain) if chain else () for chain in self.chains]
+
+    def _value(self, colors, key, filters):
+        if not filters:
+            return None if filters is None else colors.get(key)
+        try:
+            return _filtered_value(colors, key, filters)
+        except ValueError:
+            return None
+
+    def render(self, colors):
+        """Render template with colors dict"""
+        out = [self.literals[0]]
+        for key, chain, filters, literal in zip(self.keys, self.chains, self.filters, self.literals[1:]):
+            value = self._value(colors, key, filters)
+            out.append(f"{{{{{key}{chain}}}}}" if value is None else str(value))
+            out.append(literal)
+        return "".join(out)
+
+    def unknown_keys(self, colors):
+        """Placeholders that colors has no value for (or whose filters fail)"""
+        return sorted({
+            key + chain for key, chain, filters in zip(self.keys, self.chains, self.filters)
+            if key not in colors or (chain and self._value(colors, key, filters) is None)
+        })
+
+
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
+
+def load_template(template_path):
+    """Load compiled template, cached by path + mtime"""
+    template_path = Path(template_path)
+    stat = template_path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cache_key = str(template_path)
+
+    with _template_cache_lock:
+        cached = _template_cache.get(cache_key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    with open(template_path, 'r') as f:
+        template = CompiledTemplate(f.read())
+
+    with _template_cache_lock:
+        _template_cache[cache_key] = (stamp, template)
+    return template
+
+
+def _export_json(document, scheme):
+    return json.dumps(document, indent=2)
+
+
+def _export_json_compact(document, scheme):
+    return json.dumps(document, separators=(',', ':'))
+
+
+def _export_css(document, scheme):
+    colors = document["colors"]
+    variant = document["variant"]
+    wallpaper_name = Path(document["wallpaper"]).stem
+    return f"""/* Material 3 Color Scheme - {variant} */
     /* Generated from: {wallpaper_name} */
-    /* Mode: {self.mode} */
+    /* Mode: {document['mode']} */
 
     :root {{
     /* Source Color */
-    --source-color: {hex_from_argb(self.source_color) if isinstance(self.source_color, int) else self.source_color};
+    --source-color: {document['source_color']};
     
     /* Primary Colors */
     --primary: {colors['m3primary']};
@@ -491,272 +1011,1170 @@ class M3Color:
     --scrim: {colors['m3scrim']};
     }}
     """
+
+
+def _export_scss(document, scheme):
+    lines = [
+        f"// Material 3 Color Scheme - {document['variant']} ({document['mode']})",
+        f"// Generated from: {Path(document['wallpaper']).stem}",
+        "",
+        f"$source-color: {document['source_color']};",
+    ]
+    for role in SCHEME_ROLES:
+        # m3onPrimaryContainer -> on-primary-container
+        name = re.sub(r"(?<!^)([A-Z])", r"-\1", role[2:] if role.startswith("m3") else role).lower()
+        lines.append(f"${name}: {scheme.hex(role)};")
+    return "\n".join(lines) + "\n"
+
+
+def _export_msgpack(document, scheme):
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("msgpack not installed. Install: pip install msgpack")
+    return msgpack.packb(document)
+
+
+def _export_argb(document, scheme):
+    # Little-endian uint32 ARGB per role, SCHEME_ROLES order
+    values = array('I', scheme.argb_values())
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+# Export formats: name -> (file suffix, writer(document, scheme) -> str | bytes, label)
+EXPORTERS = {
+    'json': ('_scheme.json', _export_json, 'JSON'),
+    'css': ('_scheme.css', _export_css, 'CSS'),
+    'scss': ('_scheme.scss', _export_scss, 'SCSS'),
+    'json-compact': ('_scheme.min.json', _export_json_compact, 'compact JSON'),
+    'msgpack': ('_scheme.msgpack', _export_msgpack, 'MessagePack'),
+    'argb': ('_scheme.argb', _export_argb, 'ARGB'),
+}
+
+
+class M3Color:
+    def __init__(self, wallpaper_path, config=None, use_cache=True, rebuild_cache=False):
+        self.wallpaper_path = wallpaper_path
+        self.theme = None
+        self.mode = None
+        self.source_color = None
+        self.config = config if config else self.load_config()
+        self.brightness_threshold = int(self.config.get('General', 'brightness_threshold', fallback='128'))
+        self.max_analysis_pixels = int(self.config.get('General', 'max_analysis_pixels',
+                                                       fallback=str(DEFAULT_MAX_ANALYSIS_PIXELS)))
+
+        # Memory ceiling for decoding; also caps the analysis resolution
+        self.max_memory_bytes = int(float(self.config.get(
+            'General', 'max_memory_mb', fallback=str(DEFAULT_MAX_MEMORY_MB))) * 1024 * 1024)
+        if self.max_memory_bytes:
+            budget_pixels = self.max_memory_bytes // ANALYSIS_BYTES_PER_PIXEL
+            if not self.max_analysis_pixels or self.max_analysis_pixels > budget_pixels:
+                self.max_analysis_pixels = budget_pixels
+
+        # Scheme cache
+        self.scheme_cache = None
+        self.rebuild_cache = rebuild_cache
+        self._wallpaper_hash = None
+        self._cache_identity = None
+        self._phash = None
+        self._source_hex = None
+
+        # Extracted schemes per variant (both modes, read-only), shared by all outputs
+        self._variant_memo = {}
+        self._scheme = None
+
+        # Output files written (content changed) during this run
+        self.changed_files = []
+
+        # Decoded wallpaper shared by all analysis stages
+        self._image = None
+        self._image_views = {}
+        if use_cache and self.config.getboolean('Cache', 'enabled', fallback=True):
+            cache_dir = self.config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')
+            max_size_mb = self.config.get('Cache', 'max_size_mb', fallback='50')
+            self.scheme_cache = SchemeCache(cache_dir, max_size_mb)
+
+        # Reuse cache entries of perceptually identical wallpapers (-1 = off)
+        self.perceptual_index = None
+        self.perceptual_distance = -1
+        if self.scheme_cache is not None and self.config.getboolean('Cache', 'perceptual_match', fallback=True):
+            self.perceptual_index = PerceptualIndex(cache_dir)
+            self.perceptual_distance = int(self.config.get('Cache', 'perceptual_distance', fallback='4'))
+
+    @staticmethod
+    def load_config():
+        """Load configuration from m3-colors.conf"""
+        import configparser
         
-        # Write to file
-        with open(output_path, "w") as f:
-            f.write(css_content)
+        config_file = Path.home() / ".config" / "m3-colors" / "m3-colors.conf"
         
-        print(f"Exported CSS to: {output_path}")
-        return str(output_path)
-
-    def generate_palette_preview(self, output_path=None):
-        """Generate color palette preview image"""
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
-        try:
-            from PIL import Image, ImageDraw, ImageFont
-        except ImportError:
-            print("PIL/Pillow not installed. Install: pip install Pillow")
-            return None
+        # Default config
+        defaults = {
+            'mode': 'auto',
+            'variant': 'auto',
+            'brightness_threshold': '128',
+            'operation_mode': 'full',  
+            'max_analysis_pixels': str(DEFAULT_MAX_ANALYSIS_PIXELS),
+            'max_memory_mb': str(DEFAULT_MAX_MEMORY_MB),
+            'templates_dir': 'templates',
+            'cache_dir': '~/.cache/m3-colors',
+            'config_dir': '~/.config/m3-colors',
+            'export_formats': 'json, css',
+            'set_wallpaper': 'true',
+            'apply_xresources': 'true',
+            'generate_palette_preview': 'true',
+            'run_post_script': 'true',
+            'create_symlink': 'true',
+            'script_path': 'm3wal-post.sh',
+            'scripts_dir': '~/.config/m3-colors/hooks',
+            'hook_scripts_enabled': 'false',
+            'hook_scripts': 'eww.sh',
+            'hook_max_parallel': '1',
+            'hook_timeout': '30',
+            'cache_enabled': 'true',
+            'cache_max_size_mb': '50',
+            'cache_perceptual_match': 'true',
+            'cache_perceptual_distance': '4',
+            'pipeline_parallel': 'true',
+            'pipeline_on_error': 'continue',
+            'pipeline_max_workers': '4',
+            'monitors_primary': 'first'
+        }
         
-        variant = self.variant if hasattr(self, 'variant') else 'CONTENT'
-        colors_dict = self._extract_colors()
+        config = configparser.ConfigParser()
         
-        # All sequence M3 color 
-        all_colors = [
-            # Primary colors
-            'm3primary', 'm3onPrimary', 'm3primaryContainer', 'm3onPrimaryContainer',
-            'm3primaryFixed', 'm3primaryFixedDim', 'm3onPrimaryFixed', 'm3onPrimaryFixedVariant',
+        if config_file.exists():
+            config.read(config_file)
+            
+            # Update missing options
+            if not config.has_option('General', 'operation_mode'):
+                if not config.has_section('General'):
+                    config.add_section('General')
+                config.set('General', 'operation_mode', defaults['operation_mode'])
             
-            # Secondary colors
-            'm3secondary', 'm3onSecondary', 'm3secondaryContainer', 'm3onSecondaryContainer',
-            'm3secondaryFixed', 'm3secondaryFixedDim', 'm3onSecondaryFixed', 'm3onSecondaryFixedVariant',
+            if not config.has_option('General', 'max_analysis_pixels'):
+                config.set('General', 'max_analysis_pixels', defaults['max_analysis_pixels'])
             
-            # Tertiary colors
-            'm3tertiary', 'm3onTertiary', 'm3tertiaryContainer', 'm3onTertiaryContainer',
-            'm3tertiaryFixed', 'm3tertiaryFixedDim', 'm3onTertiaryFixed', 'm3onTertiaryFixedVariant',
+            if not config.has_option('General', 'max_memory_mb'):
+                config.set('General', 'max_memory_mb', defaults['max_memory_mb'])
             
-            # Error colors
-            'm3error', 'm3onError', 'm3errorContainer', 'm3onErrorContainer',
+            # Add Hooks section if missing
+            if not config.has_section('Hooks'):
+                config.add_section('Hooks')
+                config.set('Hooks', 'scripts_dir', defaults['scripts_dir'])
             
-            # Surface colors
-            'm3surface', 'm3onSurface', 'm3surfaceVariant', 'm3onSurfaceVariant',
-            'm3surfaceDim', 'm3surfaceBright', 'm3surfaceContainerLowest', 'm3surfaceContainerLow',
-            'm3surfaceContainer', 'm3surfaceContainerHigh', 'm3surfaceContainerHighest',
+            # Add Hook.Scripts section if missing
+            if not config.has_section('Hook.Scripts'):
+                config.add_section('Hook.Scripts')
+                config.set('Hook.Scripts', 'enabled', defaults['hook_scripts_enabled'])
+                config.set('Hook.Scripts', 'scripts', defaults['hook_scripts'])
             
-            # Outline colors
-            'm3outline', 'm3outlineVariant',
+            if not config.has_option('Hook.Scripts', 'max_parallel'):
+                config.set('Hook.Scripts', 'max_parallel', defaults['hook_max_parallel'])
             
-            # Inverse colors
-            'm3inverseSurface', 'm3inverseOnSurface', 'm3inversePrimary',
+            if not config.has_option('Hook.Scripts', 'timeout'):
+                config.set('Hook.Scripts', 'timeout', defaults['hook_timeout'])
             
-            # Shadow & Scrim
-            'm3shadow', 'm3scrim',
-        ]
-        
-        # Terminal colors
-        all_colors.extend([f'term{i}' for i in range(16)])
-        
-        # Filter 
-        available_colors = [key for key in all_colors if colors_dict.get(key) is not None]
-        
-        # configuration grid
-        MAX_COLS = 16
-        cell_width = 80
-        cell_height = 60
-        
-        # count how many column/row that we need
-        total_colors = len(available_colors)
-        num_rows = (total_colors + MAX_COLS - 1) // MAX_COLS  # Ceiling division
-        
-        # make image
-        img_width = cell_width * MAX_COLS
-        img_height = cell_height * num_rows
-        img = Image.new('RGB', (img_width, img_height), 'white')
-        draw = ImageDraw.Draw(img)
-        
-        # Draw every color
-        for idx, color_key in enumerate(available_colors):
-            color_value = colors_dict.get(color_key)
-            if color_value is None:
-                continue
+            # Add Export section if missing
+            if not config.has_section('Export'):
+                config.add_section('Export')
+                config.set('Export', 'formats', defaults['export_formats'])
             
-            # count grid position
-            col_idx = idx % MAX_COLS
-            row_idx = idx // MAX_COLS
+            # Add Cache section if missing
+            if not config.has_section('Cache'):
+                config.add_section('Cache')
+                config.set('Cache', 'enabled', defaults['cache_enabled'])
+                config.set('Cache', 'max_size_mb', defaults['cache_max_size_mb'])
             
-            # Convert ARGB to hex
-            if isinstance(color_value, int):
-                hex_color = hex_from_argb(color_value)
-            else:
-                hex_color = color_value
+            if not config.has_option('Cache', 'perceptual_match'):
+                config.set('Cache', 'perceptual_match', defaults['cache_perceptual_match'])
+                config.set('Cache', 'perceptual_distance', defaults['cache_perceptual_distance'])
             
-            # Remove # if exists
-            color_clean = hex_color.replace('#', '')
-            # Convert hex to RGB
-            rgb = tuple(int(color_clean[j:j+2], 16) for j in (0, 2, 4))
+            # Add Pipeline section if missing
+            if not config.has_section('Pipeline'):
+                config.add_section('Pipeline')
+                config.set('Pipeline', 'parallel', defaults['pipeline_parallel'])
+                config.set('Pipeline', 'on_error', defaults['pipeline_on_error'])
+                config.set('Pipeline', 'max_workers', defaults['pipeline_max_workers'])
             
-            # Position
-            x = col_idx * cell_width
-            y = row_idx * cell_height
+            # Add Monitors section if missing
+            if not config.has_section('Monitors'):
+                config.add_section('Monitors')
+                config.set('Monitors', 'primary', defaults['monitors_primary'])
             
-            # Draw rectangle
-            draw.rectangle([x, y, x + cell_width, y + cell_height], fill=rgb)
-        
-        # Save
-        if output_path is None:
-            output_dir = Path.home() / ".config" / "m3-colors" / "sample"
-            output_dir.mkdir(parents=True, exist_ok=True)
-            wallpaper_name = Path(self.wallpaper_path).stem
-            output_path = output_dir / f"{wallpaper_name}_{variant}_palette.png"
-        
-        img.save(output_path)
-        print(f"Palette preview saved: {output_path}")
+            # Save updated config (only rewritten when options were added)
+            M3Color._save_config(config, config_file)
+        else:
+            # make default config
+            config['General'] = {
+                'mode': defaults['mode'],
+                'variant': defaults['variant'],
+                'brightness_threshold': defaults['brightness_threshold'],
+                'operation_mode': defaults['operation_mode'],
+                'max_analysis_pixels': defaults['max_analysis_pixels'],
+                'max_memory_mb': defaults['max_memory_mb']
+            }
+            config['Paths'] = {
+                'templates_dir': defaults['templates_dir'],
+                'cache_dir': defaults['cache_dir'],
+                'config_dir': defaults['config_dir']
+            }
+            config['Features'] = {
+                'set_wallpaper': defaults['set_wallpaper'],
+                'apply_xresources': defaults['apply_xresources'],
+                'generate_palette_preview': defaults['generate_palette_preview'],
+                'run_post_script': defaults['run_post_script'],
+                'create_symlink': defaults['create_symlink']
+            }
+            config['Hooks'] = {
+                'scripts_dir': defaults['scripts_dir']
+            }
+            config['Hook.Scripts'] = {
+                'enabled': defaults['hook_scripts_enabled'],
+                'scripts': defaults['hook_scripts'],
+                'max_parallel': defaults['hook_max_parallel'],
+                'timeout': defaults['hook_timeout']
+            }
+            config['PostScript'] = {
+                'script_path': defaults['script_path']
+            }
+            config['Export'] = {
+                'formats': defaults['export_formats']
+            }
+            config['Cache'] = {
+                'enabled': defaults['cache_enabled'],
+                'max_size_mb': defaults['cache_max_size_mb'],
+                'perceptual_match': defaults['cache_perceptual_match'],
+                'perceptual_distance': defaults['cache_perceptual_distance']
+            }
+            config['Pipeline'] = {
+                'parallel': defaults['pipeline_parallel'],
+                'on_error': defaults['pipeline_on_error'],
+                'max_workers': defaults['pipeline_max_workers']
+            }
+            config['Monitors'] = {
+                'primary': defaults['monitors_primary']
+            }
+            
+            M3Color._save_config(config, config_file)
         
-        return str(output_path)
+        return config
 
-    def generate_all_variants_preview(self, output_path=None):
-        """Generate preview semua variant dalam satu gambar"""
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
-        
-        try:
-            from PIL import Image, ImageDraw, ImageFont
-        except ImportError:
-            print("PIL/Pillow not installed. Install: pip install Pillow")
+    @staticmethod
+    def _save_config(config, config_file):
+        import io
+
+        buffer = io.StringIO()
+        config.write(buffer)
+        write_if_changed(config_file, buffer.getvalue())
+
+    def _content_hash(self):
+        """SHA-256 of the wallpaper file contents (computed once)"""
+        if self._wallpaper_hash is None:
+            import hashlib
+
+            digest = hashlib.sha256()
+            with open(self.wallpaper_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            self._wallpaper_hash = digest.hexdigest()
+        return self._wallpaper_hash
+
+    def _cache_key(self, *parts):
+        """Cache key from wallpaper identity, parts, decode bound and library version"""
+        return self._cache_key_for(self._wallpaper_identity(), *parts)
+
+    def _cache_key_for(self, identity, *parts):
+        return "-".join([identity, *[str(p) for p in parts],
+                         f"px{self.max_analysis_pixels}", _library_version()])
+
+    def _wallpaper_identity(self):
+        """Content hash used in cache keys
+
+        Normally the wallpaper's own hash; for a wallpaper that is not cached
+        yet, the hash of a perceptually identical cached one if there is one.
+        """
+        if self._cache_identity is None:
+            content_hash = self._content_hash()
+            self._cache_identity = self._perceptual_match(content_hash) or content_hash
+        return self._cache_identity
+
+    def perceptual_hash(self):
+        """64-bit dHash of the wallpaper and its mean RGB color"""
+        if self._phash is None:
+            import numpy as np
+            from PIL import Image
+
+            thumbnail = self.get_thumbnail(QUANTIZE_SIZE)
+            with stage("phash"):
+                gray = thumbnail.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.BOX)
+                gray = np.asarray(gray, dtype=np.int16)
+                bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+                phash = int("".join("1" if bit else "0" for bit in bits), 2)
+                color = np.asarray(thumbnail.convert("RGB")).reshape(-1, 3).mean(axis=0)
+            self._phash = (phash, tuple(int(round(c)) for c in color))
+        return self._phash
+
+    def _perceptual_match(self, content_hash):
+        """Content hash of a cached near-duplicate, or None
+
+        Only consulted when this wallpaper has no analysis entry of its own,
+        so exact cache hits never decode the image. Matches are remembered
+        in an alias entry, so later runs skip hashing as well.
+        """
+        if self.perceptual_index is None or self.rebuild_cache:
+            return None
+        if self.scheme_cache.contains(self._cache_key_for(content_hash, "analysis")):
+            return None
+
+        alias_key = self._cache_key_for(content_hash, "alias")
+        alias = self.scheme_cache.get(alias_key)
+        if alias and self.scheme_cache.contains(self._cache_key_for(alias["identity"], "analysis")):
+            return alias["identity"]
+
+        phash, color = self.perceptual_hash()
+        found = self.perceptual_index.lookup(phash, color, self.perceptual_distance,
+                                             exclude=content_hash)
+        if found and self.scheme_cache.contains(self._cache_key_for(found[0], "analysis")):
+            match, entry, distance = found
+            print(f"[CACHE] Perceptual match: reusing scheme of {Path(entry['path']).name} "
+                  f"(distance {distance})")
+            emit_event("perceptual_hit", path=entry["path"], distance=distance)
+            self._cache_put(alias_key, {"identity": match})
+            return match
+
+        self.perceptual_index.add(content_hash, phash, color, self.wallpaper_path)
+        return None
+
+    def _cache_get(self, key):
+        if self.scheme_cache is None or self.rebuild_cache:
             return None
+        data = self.scheme_cache.get(key)
+        emit_event("cache_hit" if data is not None else "cache_miss", key=key)
+        return data
+
+    def _cache_put(self, key, data):
+        if self.scheme_cache is None:
+            return
+        try:
+            self.scheme_cache.put(key, data)
+        except OSError as e:
+            print(f"[CACHE] Failed to write cache entry: {e}")
+
+    def _cache_update_analysis(self, **fields):
+        """Merge fields into the wallpaper's analysis cache entry"""
+        if self.scheme_cache is None:
+            return
+        key = self._cache_key("analysis")
+        entry = self.scheme_cache.get(key) or {}
+        entry.update(fields)
+        self._cache_put(key, entry)
+
+    def _open_image(self):
+        from PIL import Image
+
+        if self.max_memory_bytes:
+            # Checked against max_memory_mb before decoding instead, so huge
+            # JPEG panoramas (decoded at reduced scale) aren't rejected
+            Image.MAX_IMAGE_PIXELS = None
+        return Image.open(self.wallpaper_path)
+
+    def load_image(self):
+        """Decode wallpaper once and keep an RGB(A) copy for all analysis stages"""
+        if self._image is None:
+            with stage("decode"), self._open_image() as img:
+                self._image = self._decode_bounded(img, self.max_analysis_pixels,
+                                                   self.max_memory_bytes)
+            self._image_views = {}
+        return self._image
+
+    @staticmethod
+    def _decode_bounded(img, max_pixels, max_bytes=0, mode=None):
+        """Decode to RGB with at most max_pixels (0 = full resolution)
+
+        Images with transparency decode to RGBA: like theme_from_image(),
+        the quantizer ignores pixels that aren't fully opaque. mode forces
+        the output mode instead.
+
+        Raises MemoryError instead of decoding when the frame would need more
+        than max_bytes (0 = no limit).
+        """
+        mode = mode or ("RGBA" if _has_alpha(img) else "RGB")
+        width, height = img.size
+        if max_pixels and width * height > max_pixels:
+            scale = (max_pixels / (width * height)) ** 0.5
+            target = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+            # JPEG: let the decoder scale by 1/2, 1/4 or 1/8 so full-res is never decoded
+            if img.format == "JPEG":
+                img.draft("RGB", target)
+
+        # Integer box reduce factor for anything still over the bound
+        pixels = img.width * img.height
+        factor = 1
+        if max_pixels and pixels > max_pixels:
+            factor = math.ceil((pixels / max_pixels) ** 0.5)
+        output_size = (math.ceil(img.width / factor), math.ceil(img.height / factor))
+
+        needed = _frame_bytes(img.size, img.mode)
+        if factor > 1 or img.mode != mode:
+            needed += _frame_bytes(output_size, mode)
+        if max_bytes and needed > max_bytes:
+            raise MemoryError(
+                f"Decoding {width}x{height} ({img.format} {img.mode}) needs about "
+                f"{needed / (1024 * 1024):.0f} MB, above max_memory_mb "
+                f"({max_bytes / (1024 * 1024):.0f} MB)"
+            )
+
+        if factor == 1:
+            if img.mode == mode:
+                img.load()
+                return img
+            return img.convert(mode)
+
+        # RGB and L reduce to the same pixels before or after convert()
+        if mode == "RGB" and img.mode in ("RGB", "L"):
+            img = img.reduce(factor)
+            return img if img.mode == "RGB" else img.convert("RGB")
+
+        # Other modes (RGBA, P, CMYK, ...): convert + reduce in strips, so
+        # the decoded frame is never copied at full size
+        from PIL import Image
+
+        img.load()
+        result = Image.new(mode, output_size)
+        rows = factor * max(1, STRIP_PIXELS // (img.width * factor))
+        for top in range(0, img.height, rows):
+            strip = img.crop((0, top, img.width, min(img.height, top + rows)))
+            result.paste(_resize_straight(strip.convert(mode), lambda img: img.reduce(factor)),
+                         (0, top // factor))
+        return result
+
+    def get_thumbnail(self, max_size):
+        """Downsampled RGB(A) copy that fits in max_size (aspect ratio kept)"""
+        key = ("thumbnail", tuple(max_size))
+        if key not in self._image_views:
+            self._image_views[key] = _resize_straight(self.load_image(), lambda img: _thumbnail(img, max_size))
+        return self._image_views[key]
+
+    def get_quantize_thumbnail(self):
+        """128x128 quantizer input, built exactly like theme_from_image()
+
+        The library converts to RGBA before thumbnailing; resampling in RGB
+        rounds differently and can change which color scores highest.
+        """
+        key = ("quantize", QUANTIZE_SIZE)
+        if key not in self._image_views:
+            thumbnail = self.load_image().convert("RGBA")
+            thumbnail.thumbnail(QUANTIZE_SIZE)
+            self._image_views[key] = thumbnail
+        return self._image_views[key]
+
+    def compare_full_resolution(self):
+        """Report source color delta between bounded and full-resolution decode"""
+        from material_color_utilities import Hct, prominent_colors_from_image
+
+        bounded = prominent_colors_from_image(self.get_quantize_thumbnail())[0]
+        with self._open_image() as img:
+            full_size = img.size
+            # Thumbnail in place: no second full-resolution copy
+            full_image = self._decode_bounded(img, 0, self.max_memory_bytes, mode="RGBA")
+            full_image.thumbnail(QUANTIZE_SIZE)
+            full = prominent_colors_from_image(full_image)[0]
+            del full_image
+
+        bounded_hct, full_hct = Hct(bounded), Hct(full)
+        hue_delta = abs(bounded_hct.hue - full_hct.hue) % 360
+        bounded_rgb, full_rgb = self._argb_to_rgb(bounded), self._argb_to_rgb(full)
+
+        return {
+            "full_size": list(full_size),
+            "analysis_size": list(self.load_image().size),
+            "max_analysis_pixels": self.max_analysis_pixels,
+            "source_full": full,
+            "source_bounded": bounded,
+            "delta_hue": min(hue_delta, 360 - hue_delta),
+            "delta_chroma": abs(bounded_hct.chroma - full_hct.chroma),
+            "delta_tone": abs(bounded_hct.tone - full_hct.tone),
+            "delta_rgb": sum((a - b) ** 2 for a, b in zip(bounded_rgb, full_rgb)) ** 0.5,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def get_samples(self, max_samples=ANALYSIS_SAMPLES):
+        """Stratified pixel sample covering the whole image, as (N, 3) uint8
+
+        The image is split into a regular grid of about max_samples cells and
+        the center pixel of each cell is taken (nearest-neighbour resize).
+        """
+        import numpy as np
+        from PIL import Image
+
+        key = ("samples", max_samples)
+        if key not in self._image_views:
+            img = self.load_image()
+            width, height = img.size
+            if width * height > max_samples:
+                scale = (max_samples / (width * height)) ** 0.5
+                grid = (max(1, int(width * scale)), max(1, int(height * scale)))
+                img = img.resize(grid, Image.NEAREST)
+            self._image_views[key] = np.asarray(img.convert("RGB")).reshape(-1, 3)
+        return self._image_views[key]
+
+    def release_image(self):
+        """Drop full-resolution buffers, keeping small thumbnails"""
+        self._image = None
+        self._image_views = {
+            key: view for key, view in self._image_views.items()
+            if key[0] in ("thumbnail", "quantize", "samples") and key[1] is not None
+        }
+
+    def reset(self):
+        """Clear per-run scheme state, keeping decoded/quantized wallpaper data"""
+        self.theme = None
+        self.mode = None
+        self._scheme = None
+        self.changed_files = []
+
+    def _write_output(self, path, content):
+        """Write output if changed, recording it in changed_files"""
+        changed = write_if_changed(path, content)
+        if changed:
+            self._record_change(path)
+        return changed
+
+    def _record_change(self, path):
+        self.changed_files.append(str(path))
+        emit_event("file_written", path=str(path))
+
+    def _save_image(self, img, output_path):
+        """Save PIL image through _write_output (skips identical PNGs)"""
+        import io
+
+        # Image.registered_extensions() would load every PIL plugin
+        formats = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.webp': 'WEBP', '.bmp': 'BMP'}
+        fmt = formats.get(Path(output_path).suffix.lower(), 'PNG')
+        if fmt == 'JPEG' and img.mode == 'P':
+            img = img.convert('RGB')
+        options = {'compress_level': PNG_COMPRESS_LEVEL} if fmt == 'PNG' else {}
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, **options)
+        return self._write_output(output_path, buffer.getvalue())
+
+    def _require_scheme(self):
+        if self._scheme is None:
+            raise ValueError("Generate scheme first!")
+
+    def analyze_wallpaper(self):
+        """Extract dominant color & detect brightness"""
+        cached = self._cache_get(self._cache_key("analysis")) if self.scheme_cache else None
+        if cached and "brightness" in cached:
+            avg_brightness = cached["brightness"]
+            self.mode = "dark" if avg_brightness < self.brightness_threshold else "light"
+            return {"brightness": avg_brightness, "mode": self.mode}
+
+        import numpy as np
+
+        # Detect brightness for auto mode (ITU-R 601 luma, same as PIL "L")
+        pixels = self.get_samples()
+        luma = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        avg_brightness = float(luma.mean())
+        self._cache_update_analysis(brightness=avg_brightness)
+
+        # Auto select light/dark mode based on threshold
+        self.mode = "dark" if avg_brightness < self.brightness_threshold else "light"
+
+        return {"brightness": avg_brightness, "mode": self.mode}
+
+    def auto_select_variant(self):
+        """Auto-select best variant - IMPROVED VERSION"""
+        cached = self._cache_get(self._cache_key("analysis")) if self.scheme_cache else None
+        if cached and "auto_variant" in cached:
+            variant, reason = cached["auto_variant"]
+            return variant, reason
+
+        variant, reason = self._select_variant()
+        self._cache_update_analysis(auto_variant=[variant, reason])
+        return variant, reason
+
+    def _select_variant(self):
+        """Run variant selection heuristics on the wallpaper"""
+        import numpy as np
         
-        # Semua variant yang akan di-generate
-        variants = ['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL', 
-                    'FIDELITY', 'CONTENT', 'MONOCHROME']
+        # Stratified sample over the whole image
+        rgb = self.get_samples().astype(np.float32) / 255.0
         
-        # Konfigurasi - lebih rapat
-        cell_width = 45
-        cell_height = 35
-        colors_per_row = 16
-        variant_spacing = 15  # Lebih rapat
-        header_height = 18    # Lebih rapat
+        # Vectorized RGB -> HSV
+        max_c = rgb.max(axis=1)
+        min_c = rgb.min(axis=1)
+        delta = max_c - min_c
+        values = max_c
+        saturations = np.divide(delta, max_c, out=np.zeros_like(delta), where=max_c > 0)
         
-        # SEMUA warna M3
-        color_keys = [
-            # Primary
-            'm3primary', 'm3onPrimary', 'm3primaryContainer', 'm3onPrimaryContainer',
-            'm3primaryFixed', 'm3primaryFixedDim', 'm3onPrimaryFixed', 'm3onPrimaryFixedVariant',
-            # Secondary
-            'm3secondary', 'm3onSecondary', 'm3secondaryContainer', 'm3onSecondaryContainer',
-            'm3secondaryFixed', 'm3secondaryFixedDim', 'm3onSecondaryFixed', 'm3onSecondaryFixedVariant',
-            # Tertiary
-            'm3tertiary', 'm3onTertiary', 'm3tertiaryContainer', 'm3onTertiaryContainer',
-            'm3tertiaryFixed', 'm3tertiaryFixedDim', 'm3onTertiaryFixed', 'm3onTertiaryFixedVariant',
-            # Error
-            'm3error', 'm3onError', 'm3errorContainer', 'm3onErrorContainer',
-            # Surface
-            'm3surface', 'm3onSurface', 'm3surfaceVariant', 'm3onSurfaceVariant',
-            'm3surfaceDim', 'm3surfaceBright', 'm3surfaceContainerLowest', 'm3surfaceContainerLow',
-            'm3surfaceContainer', 'm3surfaceContainerHigh', 'm3surfaceContainerHighest',
-            # Outline
-            'm3outline', 'm3outlineVariant',
-            # Inverse
-            'm3inverseSurface', 'm3inverseOnSurface', 'm3inversePrimary',
-            # Shadow & Scrim
-            'm3shadow', 'm3scrim',
-        ]
+        r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+        safe_delta = np.where(delta > 0, delta, 1.0)
+        hues = np.select(
+            [max_c == r, max_c == g],
+            [((g - b) / safe_delta) % 6.0, (b - r) / safe_delta + 2.0],
+            (r - g) / safe_delta + 4.0,
+        ) / 6.0
         
-        # Tambah terminal colors
-        color_keys.extend([f'term{i}' for i in range(16)])
+        # Metrics
+        avg_sat = float(saturations.mean())
+        avg_val = float(values.mean())
+        sat_std = float(saturations.std())
         
-        rows_per_variant = (len(color_keys) + colors_per_row - 1) // colors_per_row
-        variant_height = header_height + (rows_per_variant * cell_height)
+        # Hue is circular: use circular variance (1 - mean resultant length),
+        # weighted by saturation so gray pixels don't pull toward red (h=0)
+        angles = hues * (2 * np.pi)
+        weight_sum = float(saturations.sum())
+        if weight_sum > 0:
+            resultant = np.hypot((saturations * np.cos(angles)).sum(),
+                                 (saturations * np.sin(angles)).sum()) / weight_sum
+            hue_variety = 1.0 - float(resultant)
+        else:
+            hue_variety = 0.0
         
-        # Total image size
-        img_width = cell_width * colors_per_row
-        img_height = len(variants) * (variant_height + variant_spacing)
+        # Decision logic
+        if avg_sat < 0.10:
+            return "MONOCHROME", f"Grayscale wallpaper (sat={avg_sat:.2f})"
         
-        # Create image
-        img = Image.new('RGB', (img_width, img_height), '#1a1a1a')
-        draw = ImageDraw.Draw(img)
+        if avg_sat < 0.30 and sat_std < 0.20:
+            return "NEUTRAL", f"Muted colors (sat={avg_sat:.2f}, consistent tone)"
         
-        # Try load font - lebih kecil
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/TTF/DejaVuSans-Bold.ttf", 12)
-        except:
-            try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 12)
-            except:
-                font = ImageFont.load_default()
+        if avg_sat > 0.40 and hue_variety > 0.50:
+            return "EXPRESSIVE", f"Diverse colors (sat={avg_sat:.2f}, hue_variety={hue_variety:.2f})"
         
-        # Generate untuk setiap variant
-        for v_idx, variant in enumerate(variants):
-            y_offset = v_idx * (variant_height + variant_spacing)
-            
-            # Generate scheme untuk variant ini
-            current_mode = self.mode
-            self.generate_scheme(mode=current_mode, variant=variant)
-            colors = self._extract_colors()
-            
-            # Draw header - lebih rapat
-            draw.text((5, y_offset + 3), f"{variant} ({current_mode})", 
-                    fill='white', font=font)
-            
-            # Draw colors
-            for c_idx, color_key in enumerate(color_keys):
-                if color_key not in colors:
-                    continue
-                
-                col = c_idx % colors_per_row
-                row = c_idx // colors_per_row
-                
-                x = col * cell_width
-                y = y_offset + header_height + (row * cell_height)
-                
-                # Convert to RGB
-                color_value = colors[color_key]
-                if isinstance(color_value, int):
-                    hex_color = hex_from_argb(color_value)
-                else:
-                    hex_color = color_value
-                
-                color_clean = hex_color.replace('#', '')
-                rgb = tuple(int(color_clean[j:j+2], 16) for j in (0, 2, 4))
-                
-                # Draw rectangle
-                draw.rectangle([x, y, x + cell_width, y + cell_height], 
-                            fill=rgb, outline='#ddd')
+        if 0.25 < avg_sat < 0.50 and sat_std < 0.25:
+            return "FIDELITY", f"Natural colors (sat={avg_sat:.2f}, preserve original)"
         
-        # Save
-        if output_path is None:
-            output_dir = Path.home() / ".config" / "m3-colors" / "sample"
-            output_dir.mkdir(parents=True, exist_ok=True)
-            wallpaper_name = Path(self.wallpaper_path).stem
-            output_path = output_dir / f"{wallpaper_name}_all_variants.png"
+        if avg_sat > 0.60:
+            return "VIBRANT", f"Bold colors (sat={avg_sat:.2f})"
         
-        img.save(output_path)
-        print(f"All variants preview saved: {output_path}")
+        return "CONTENT", f"Balanced (sat={avg_sat:.2f}, safe choice)"
+
+    def generate_scheme(self, mode=None, variant="CONTENT"):
+        """Generate Material 3 color scheme"""
+        if mode:
+            self.mode = mode
+
+        # Auto-select variant if requested
+        if variant.upper() == "AUTO":
+            variant, reason = self.auto_select_variant()
+            print(f"[AUTO] Selected variant: {variant}")
+            print(f"[AUTO] Reason: {reason}")
         
-        return str(output_path)
+        self.variant = variant
 
-class M3WAL(M3Color):
-    def __init__(self, wallpaper_path, config=None):
-        super().__init__(wallpaper_path, config)
+        entry = self._variant_schemes(variant)
+        if entry["cached"]:
+            print("[CACHE] Hit: reusing cached scheme")
 
-    def apply_all_templates(self, templates_dir=None, output_dir=None):
-        """Apply colors to all templates - OPTIMIZED VERSION with fallback"""
-        if not self.theme:
+        # theme is None when the scheme came from the cache
+        self.theme = entry["theme"]
+        self._scheme = entry["schemes"]
+        self.source_color = entry["source_color"]
+
+        return self._extract_colors()
+
+    def set_mode(self, mode):
+        """Switch between light/dark of the current scheme (no re-extraction)"""
+        self.mode = mode
+        return self._extract_colors()
+
+    def _variant_schemes(self, variant):
+        """Extract both modes of a variant once per wallpaper
+
+        Returns:
+            Dict with 'schemes' (mode -> Scheme), 'source_color',
+            'theme' (None on cache hit) and 'cached'
+        """
+        variant = variant.upper()
+        entry = self._variant_memo.get(variant)
+        if entry is not None:
+            return entry
+
+        cache_key = self._cache_key(variant) if self.scheme_cache is not None else None
+        cached = self._cache_get(cache_key) if cache_key else None
+
+        if cached:
+            theme = None
+            schemes = {mode: Scheme(cached["schemes"][mode]) for mode in MODES}
+            source_color = cached["source_color"]
+        else:
+            # Generate theme from the (single) quantized source color
+            from material_color_utilities import theme_from_color
+
+            theme = theme_from_color(self.quantize_source(), 0, self._variant_enum(variant))
+            schemes = {mode: self._colors_from_theme(theme, mode) for mode in MODES}
+            source_color = _to_hex(theme.source)
+
+            if cache_key is not None:
+                self._cache_put(cache_key, {
+                    "schemes": {mode: schemes[mode].argb_values() for mode in MODES},
+                    "source_color": source_color,
+                })
+
+        entry = {
+            "schemes": schemes,
+            "source_color": source_color,
+            "theme": theme,
+            "cached": bool(cached),
+        }
+        self._variant_memo[variant] = entry
+        return entry
+
+    @staticmethod
+    def _variant_enum(variant):
+        """Map variant name to Variant enum"""
+        from material_color_utilities import Variant
+
+        variant_map = {
+            "TONALSPOT": Variant.TONALSPOT,
+            "VIBRANT": Variant.VIBRANT,
+            "EXPRESSIVE": Variant.EXPRESSIVE,
+            "NEUTRAL": Variant.NEUTRAL,
+            "FIDELITY": Variant.FIDELITY,
+            "CONTENT": Variant.CONTENT,
+            "MONOCHROME": Variant.MONOCHROME,
+        }
+        return variant_map.get(variant.upper(), Variant.CONTENT)
+
+    def quantize_source(self):
+        """Quantize + score the wallpaper once and return its source color (hex)
+
+        Equivalent to theme_from_image() for wallpapers within
+        max_analysis_pixels: the top scored prominent color of the same
+        128x128 RGBA thumbnail. Every variant/mode is derived from it.
+        """
+        if self._source_hex is None:
+            cached = self._cache_get(self._cache_key("analysis")) if self.scheme_cache else None
+            if cached and "source_color" in cached:
+                self._source_hex = cached["source_color"]
+            else:
+                from material_color_utilities import prominent_colors_from_image
+
+                thumbnail = self.get_quantize_thumbnail()
+                with stage("quantize"):
+                    self._source_hex = prominent_colors_from_image(thumbnail)[0]
+                self._cache_update_analysis(source_color=self._source_hex)
+        return self._source_hex
+
+    def generate_schemes(self, variants=None, modes=None):
+        """Generate several variant/mode schemes from a single quantization pass
+
+        Args:
+            variants: Variant names (default: all 7, AUTO is resolved)
+            modes: 'light' and/or 'dark' (default: both)
+
+        Returns:
+            Dict mapping (variant, mode) to Scheme
+        """
+        variants = [v.upper() for v in (variants or VARIANTS)]
+        modes = list(modes or MODES)
+
+        schemes = {}
+        for variant in variants:
+            if variant == "AUTO":
+                variant, _ = self.auto_select_variant()
+
+            entry = self._variant_schemes(variant)
+            for mode in modes:
+                schemes[(variant, mode)] = entry["schemes"][mode]
+
+        return schemes
+
+    def _extract_colors(self):
+        """All M3 colors + 16 terminal colors for the current mode
+
+        Returns the shared Scheme (read-only mapping); copy it with dict() to modify.
+        """
+        if self._scheme is None:
             raise ValueError("Generate scheme first!")
+
+        return self._scheme["dark" if self.mode == "dark" else "light"]
+
+    def _template_colors(self):
+        """Colors plus wallpaper metadata for template rendering"""
+        from collections import ChainMap
+
+        metadata = {
+            "wallpaper_path": self.wallpaper_path,
+            "mode": self.mode,
+            "source_color": _to_hex(self.source_color),
+        }
+        return ChainMap(metadata, self._extract_colors())
+
+    def _colors_from_theme(self, theme, mode):
+        """Build the Scheme for one mode of a theme"""
+        # Select scheme based on mode
+        scheme = (
+            theme.schemes.dark if mode == "dark" else theme.schemes.light
+        )
+
+        m3_colors = {
+            # Primary
+            "m3primary": scheme.primary,
+            "m3onPrimary": scheme.on_primary,
+            "m3primaryContainer": scheme.primary_container,
+            "m3onPrimaryContainer": scheme.on_primary_container,
+            "m3primaryFixed": scheme.primary_fixed,
+            "m3primaryFixedDim": scheme.primary_fixed_dim,
+            "m3onPrimaryFixed": scheme.on_primary_fixed,
+            "m3onPrimaryFixedVariant": scheme.on_primary_fixed_variant,
+            # Secondary
+            "m3secondary": scheme.secondary,
+            "m3onSecondary": scheme.on_secondary,
+            "m3secondaryContainer": scheme.secondary_container,
+            "m3onSecondaryContainer": scheme.on_secondary_container,
+            "m3secondaryFixed": scheme.secondary_fixed,
+            "m3secondaryFixedDim": scheme.secondary_fixed_dim,
+            "m3onSecondaryFixed": scheme.on_secondary_fixed,
+            "m3onSecondaryFixedVariant": scheme.on_secondary_fixed_variant,
+            # Tertiary
+            "m3tertiary": scheme.tertiary,
+            "m3onTertiary": scheme.on_tertiary,
+            "m3tertiaryContainer": scheme.tertiary_container,
+            "m3onTertiaryContainer": scheme.on_tertiary_container,
+            "m3tertiaryFixed": scheme.tertiary_fixed,
+            "m3tertiaryFixedDim": scheme.tertiary_fixed_dim,
+            "m3onTertiaryFixed": scheme.on_tertiary_fixed,
+            "m3onTertiaryFixedVariant": scheme.on_tertiary_fixed_variant,
+            # Error
+            "m3error": scheme.error,
+            "m3onError": scheme.on_error,
+            "m3errorContainer": scheme.error_container,
+            "m3onErrorContainer": scheme.on_error_container,
+            # Surface
+            "m3surface": scheme.surface,
+            "m3onSurface": scheme.on_surface,
+            "m3surfaceVariant": scheme.surface_variant,
+            "m3onSurfaceVariant": scheme.on_surface_variant,
+            "m3surfaceDim": scheme.surface_dim,
+            "m3surfaceBright": scheme.surface_bright,
+            "m3surfaceContainerLowest": scheme.surface_container_lowest,
+            "m3surfaceContainerLow": scheme.surface_container_low,
+            "m3surfaceContainer": scheme.surface_container,
+            "m3surfaceContainerHigh": scheme.surface_container_high,
+            "m3surfaceContainerHighest": scheme.surface_container_highest,
+            # Background (deprecated in M3 but kept for compatibility)
+            "m3background": scheme.surface,
+            "m3onBackground": scheme.on_surface,
+            # Outline
+            "m3outline": scheme.outline,
+            "m3outlineVariant": scheme.outline_variant,
+            # Inverse
+            "m3inverseSurface": scheme.inverse_surface,
+            "m3inverseOnSurface": scheme.inverse_on_surface,
+            "m3inversePrimary": scheme.inverse_primary,
+            # Shadow & Scrim
+            "m3shadow": scheme.shadow,
+            "m3scrim": scheme.scrim,
+        }
+
+        # Generate terminal colors
+        terminal_colors = self._generate_terminal_colors(scheme, mode)
+
+        # Formats (hex, "r,g,b" for KDE, ...) are derived on demand
+        return Scheme.from_colors({**m3_colors, **terminal_colors})
+
+    def _generate_terminal_colors(self, scheme, mode=None):
+        """Generate 16 terminal colors from M3 palette with better contrast"""
+        if mode is None:
+            mode = self.mode
         
-        if output_dir is None:
-            output_dir = Path.home() / ".cache" / "m3-colors"
-        
-        # ===== TEMPLATE DISCOVERY WITH FALLBACK =====
-        config_path = Path.home() / ".config" / "m3-colors" / "templates"
-        
-        # Get bundled templates path
+        if mode == "dark":
+            # Dark mode: tetap gunakan mapping lama
+            return {
+                "term0": scheme.surface_dim,
+                "term1": scheme.on_error,
+                "term2": scheme.outline_variant,
+                "term3": scheme.on_primary_fixed_variant,
+                "term4": scheme.on_primary,
+                "term5": scheme.surface_container_highest,
+                "term6": scheme.secondary_container,
+                "term7": scheme.inverse_primary,
+                "term8": scheme.inverse_surface,
+                "term9": scheme.error,
+                "term10": scheme.tertiary_fixed,
+                "term11": scheme.primary_fixed,
+                "term12": scheme.primary,
+                "term13": scheme.tertiary,
+                "term14": scheme.tertiary_fixed_dim,
+                "term15": scheme.on_surface,
+            }
+        else:
+            # Light mode: gunakan warna yang lebih kontras
+            return {
+                "term0": scheme.surface_container_highest,  
+                "term1": scheme.error,                       
+                "term2": scheme.on_tertiary_fixed_variant,              
+                "term3": scheme.on_secondary_fixed_variant,          
+                "term4": scheme.primary,                  
+                "term5": scheme.secondary,                
+                "term6": scheme.outline,    
+                "term7": scheme.on_surface_variant,       
+                "term8": scheme.tertiary,          
+                "term9": scheme.on_error_container,       
+                "term10": scheme.tertiary_fixed_dim,      
+                "term11": scheme.on_primary_fixed_variant,
+                "term12": scheme.on_primary_container,    
+                "term13": scheme.on_secondary_container,     
+                "term14": scheme.primary_fixed_dim,
+                "term15": scheme.surface_dim,                
+            }
+
+    def _argb_to_rgb(self, argb_color):
+        """Convert ARGB integer to RGB tuple"""
+        color_clean = _to_hex(argb_color).replace('#', '')
+        return tuple(int(color_clean[j:j+2], 16) for j in (0, 2, 4))
+
+    def preview_colors(self):
+        """Print color preview"""
+        self._require_scheme()
+
+        colors = self._extract_colors()
+
+        print(f"\nColor Preview ({self.mode} mode):")
+        print(
+            f"Source: {_to_hex(self.source_color)}"
+        )
+        print(f"\nPrimary: {colors['m3primary']}")
+        print(f"Secondary: {colors['m3secondary']}")
+        print(f"Tertiary: {colors['m3tertiary']}")
+        print(f"Surface: {colors['m3surface']}")
+        print(f"Error: {colors['m3error']}")
+
+        print(f"\nTerminal Colors:")
+        for i in range(16):
+            print(f"term{i}: {colors[f'term{i}']}")
+
+    def output_dir(self):
+        """Export directory: [Paths] output_dir, else <config_dir>/output"""
+        output_dir = self.config.get('Paths', 'output_dir', fallback='')
+        if not output_dir:
+            config_dir = self.config.get('Paths', 'config_dir', fallback='~/.config/m3-colors')
+            output_dir = Path(config_dir) / "output"
+        return Path(output_dir).expanduser()
+
+    def export_formats(self):
+        """Formats enabled by [Export] formats"""
+        formats = self.config.get('Export', 'formats', fallback='json, css')
+        return [name.strip().lower() for name in formats.split(',') if name.strip()]
+
+    def _export_document(self, variant):
+        """Current scheme + metadata, shared by every export format"""
+        return {
+            "wallpaper": self.wallpaper_path,
+            "mode": self.mode,
+            "variant": variant,
+            "source_color": _to_hex(self.source_color),
+            "colors": dict(self._extract_colors()),
+        }
+
+    def _export_to(self, name, document, path):
+        """Serialize document with one exporter and write it (atomic, skipped if unchanged)"""
+        _, writer, label = EXPORTERS[name]
         try:
-            from importlib.resources import files
-            bundled_path = files('m3wal').joinpath('templates')
-        except:
-            bundled_path = None
+            content = writer(document, self._extract_colors())
+        except ImportError as e:
+            print(f"[EXPORT] Skipping {name}: {e}")
+            return None
+
+        if self._write_output(path, content):
+            print(f"Exported {label} to: {path}")
+        else:
+            print(f"Unchanged: {path}")
+        return str(path)
+
+    def export(self, formats=None, variant="CONTENT", output_dir=None):
+        """Export the current scheme to every enabled format in one pass
+
+        Args:
+            formats: Exporter names (default: [Export] formats)
+            variant: Variant name used in file names and metadata
+            output_dir: Directory (default: output_dir())
+
+        Returns:
+            Dict mapping format to written path
+        """
+        self._require_scheme()
+        output_dir = Path(output_dir).expanduser() if output_dir else self.output_dir()
+        wallpaper_name = Path(self.wallpaper_path).stem
+        document = self._export_document(variant)
+
+        paths = {}
+        for name in formats or self.export_formats():
+            if name not in EXPORTERS:
+                print(f"[EXPORT] Unknown format '{name}' (available: {', '.join(EXPORTERS)})")
+                continue
+            suffix = EXPORTERS[name][0]
+            path = self._export_to(name, document, output_dir / f"{wallpaper_name}_{variant}{suffix}")
+            if path:
+                paths[name] = path
+        return paths
+
+    def export_json(self, output_path=None, variant="CONTENT"):
+        """Export scheme to JSON"""
+        return self._export_single('json', output_path, variant)
+
+    def export_css(self, output_path=None, variant="CONTENT"):
+        """Export scheme to CSS variables"""
+        return self._export_single('css', output_path, variant)
+
+    def _export_single(self, name, output_path, variant):
+        self._require_scheme()
+        if output_path is None:
+            suffix = EXPORTERS[name][0]
+            output_path = self.output_dir() / f"{Path(self.wallpaper_path).stem}_{variant}{suffix}"
+        return self._export_to(name, self._export_document(variant), Path(output_path).expanduser())
+
+    def export_variants_json(self, variants=None, modes=None, output_path=None):
+        """Export several variants/modes to one JSON file (single quantization)"""
+        schemes = self.generate_schemes(variants, modes)
+
+        if output_path is None:
+            wallpaper_name = Path(self.wallpaper_path).stem
+            output_path = self.output_dir() / f"{wallpaper_name}_all_variants_scheme.json"
+
+        output = {
+            "wallpaper": self.wallpaper_path,
+            "source_color": self.quantize_source(),
+            "schemes": {},
+        }
+        for (variant, mode), colors in schemes.items():
+            output["schemes"].setdefault(variant, {})[mode] = dict(colors)
+
+        if self._write_output(output_path, json.dumps(output, indent=2)):
+            print(f"Exported {len(schemes)} schemes to: {output_path}")
+        else:
+            print(f"Unchanged: {output_path}")
+        return str(output_path)
+
+    def generate_palette_preview(self, output_path=None):
+        """Generate color palette preview image"""
+        self._require_scheme()
         
-        # Collect templates from both locations
-        template_files = {}  # Use dict to avoid duplicates, custom overrides bundled
+        variant = self.variant if hasattr(self, 'variant') else 'CONTENT'
+        colors = self._extract_colors()
         
-        # 1. Load bundled templates first (as fallback)
-        if bundled_path and Path(bundled_path).exists():
-            for template_file in Path(bundled_path).glob("*.template"):
-                template_files[template_file.name] = template_file
-            print(f"Found {len(template_files)} bundled template(s)")
+        # 16-column grid of every available color
+        swatches = [colors[key] for key in PREVIEW_COLOR_KEYS if colors.get(key) is not None]
         
-        # 2. Load custom templates (overrides bundled if same name)
+        if output_path is None:
+            output_dir = Path.home() / ".config" / "m3-colors" / "sample"
+            output_dir.mkdir(parents=True, exist_ok=True)
+            wallpaper_name = Path(self.wallpaper_path).stem
+            output_path = output_dir / f"{wallpaper_name}_{variant}_palette.png"
+        
+        # Cache hit: skip PIL/NumPy entirely if this exact preview is on disk
+        stamp_key = self._cache_key("preview", variant, self.mode) if self.scheme_cache else None
+        stamp = self._preview_stamp(output_path, swatches)
+        if stamp_key and stamp and self._cache_get(stamp_key) == stamp:
+            print(f"Palette preview unchanged: {output_path}")
+            return str(output_path)
+        
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            print("PIL/Pillow not installed. Install: pip install Pillow")
+            return None
+        
+        img = render_palette([(None, swatches)], columns=16, cell_size=(80, 60))
+        
+        if self._save_image(img, output_path):
+            print(f"Palette preview saved: {output_path}")
+        else:
+            print(f"Palette preview unchanged: {output_path}")
+        
+        if stamp_key:
+            self._cache_put(stamp_key, self._preview_stamp(output_path, swatches))
+        
+        return str(output_path)
+
+    @staticmethod
+    def _preview_stamp(output_path, swatches):
+        """Path, file stamp and colors of a rendered preview (None if missing)"""
+        try:
+            stat = Path(output_path).stat()
+        except OSError:
+            return None
+        return {"path": str(output_path), "file": [stat.st_mtime_ns, stat.st_size], "colors": swatches}
+
+    def generate_all_variants_preview(self, output_path=None):
+        """Generate preview semua variant dalam satu gambar"""
+        self._require_scheme()
+        
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            print("PIL/Pillow not installed. Install: pip install Pillow")
+            return None
+        
+        # Semua variant (satu kali quantize), generated before rendering
+        current_mode = self.mode or "light"
+        schemes = self.generate_schemes(VARIANTS, [current_mode])
+        
+        sections = [
+            (f"{variant} ({current_mode})", [schemes[(variant, current_mode)].get(key) for key in PREVIEW_COLOR_KEYS])
+            for variant in VARIANTS
+        ]
+        img = render_palette(sections, columns=16, cell_size=(45, 35), header_height=18, spacing=15,
+                             background=0x1A1A1A, outline=0xDDDDDD, label_color=0xFFFFFF)
+        
+        # Save
+        if output_path is None:
+            output_dir = Path.home() / ".config" / "m3-colors" / "sample"
+            output_dir.mkdir(parents=True, exist_ok=True)
+            wallpaper_name = Path(self.wallpaper_path).stem
+            output_path = output_dir / f"{wallpaper_name}_all_variants.png"
+        
+        if self._save_image(img, output_path):
+            print(f"All variants preview saved: {output_path}")
+        else:
+            print(f"All variants preview unchanged: {output_path}")
+        
+        return str(output_path)
+
+def parse_hook_groups(value):
+    """'a.sh, b.sh; c.sh' -> [['a.sh', 'b.sh'], ['c.sh']] (empty entries dropped)"""
+    groups = [[s.strip() for s in group.split(',') if s.strip()] for group in value.split(';')]
+    return [group for group in groups if group]
+
+
+class M3WAL(M3Color):
+    def __init__(self, wallpaper_path, config=None, use_cache=True, rebuild_cache=False):
+        super().__init__(wallpaper_path, config, use_cache, rebuild_cache)
+
+        # Multi-monitor: wallpapers of all outputs, in output order, for feh
+        self.monitor_wallpapers = None
+
+    def find_templates(self, templates_dir=None):
+        """Bundled templates, overridden by custom ones (and templates_dir)
+
+        Returns:
+            Dict mapping template file name to its path
+        """
+        config_path = Path.home() / ".config" / "m3-colors" / "templates"
+        
+        # Get bundled templates path
+        try:
+            from importlib.resources import files
+            bundled_path = files('m3wal').joinpath('templates')
+        except:
+            bundled_path = None
+        
+        # Collect templates from both locations
+        template_files = {}  # Use dict to avoid duplicates, custom overrides bundled
+        
+        # 1. Load bundled templates first (as fallback)
+        if bundled_path and Path(bundled_path).exists():
+            for template_file in Path(bundled_path).glob("*.template"):
+                template_files[template_file.name] = template_file
+            print(f"Found {len(template_files)} bundled template(s)")
+        
+        # 2. Load custom templates (overrides bundled if same name)
         if config_path.exists():
             custom_count = 0
             for template_file in config_path.glob("*.template"):
@@ -775,239 +2193,1987 @@ class M3WAL(M3Color):
                     template_files[template_file.name] = template_file
                 print(f"Using specified directory: {templates_dir}")
         
-        # Convert back to list
-        template_list = list(template_files.values())
+        return template_files
+
+    def _staging_dir(self):
+        """Where prefetch pre-renders this wallpaper/variant/mode's templates"""
+        cache_dir = Path(self.config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')).expanduser()
+        return cache_dir / "prefetch" / self._cache_key(self.variant.upper(), self.mode or "light")
+
+    def _staging_manifest(self, template_list):
+        """Identifies a pre-render: wallpaper, mode and every template's stat"""
+        templates = {}
+        for template_file in template_list:
+            st = Path(template_file).stat()
+            templates[Path(template_file).name] = [str(template_file), st.st_mtime_ns, st.st_size]
+        return {"wallpaper": self.wallpaper_path, "mode": self.mode, "templates": templates}
+
+    def prerender_templates(self, templates_dir=None):
+        """Render all templates into the prefetch staging dir (for a later switch)"""
+        self._require_scheme()
+        template_list = list(self.find_templates(templates_dir).values())
+        staging = self._staging_dir()
+        staging.mkdir(parents=True, exist_ok=True)
+        
+        colors = self._template_colors()
+        for template_file in template_list:
+            write_if_changed(staging / template_file.stem, load_template(template_file).render(colors))
+        
+        # Manifest last: a staging dir without one is never used
+        write_if_changed(staging / "manifest.json", json.dumps(self._staging_manifest(template_list)))
+        return staging
+
+    def _load_staged(self, template_list):
+        """Pre-rendered outputs matching template_list, or None"""
+        staging = self._staging_dir()
+        try:
+            manifest = json.loads((staging / "manifest.json").read_text())
+        except (OSError, ValueError):
+            return None
+        if manifest != self._staging_manifest(template_list):
+            return None
+        return staging
+
+    def apply_all_templates(self, templates_dir=None, output_dir=None):
+        """Apply colors to all templates - OPTIMIZED VERSION with fallback"""
+        self._require_scheme()
+        
+        if output_dir is None:
+            output_dir = Path.home() / ".cache" / "m3-colors"
+        
+        # ===== TEMPLATE DISCOVERY WITH FALLBACK =====
+        template_list = list(self.find_templates(templates_dir).values())
         
         if not template_list:
             print("No template files found!")
             return []
-        
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
-        
-        # ===== OPTIMIZATION: Extract colors ONCE =====
-        colors = self._extract_colors()
-        
-        # Add metadata
-        colors["wallpaper_path"] = self.wallpaper_path
-        colors["mode"] = self.mode
-        colors["source_color"] = (
-            hex_from_argb(self.source_color)
-            if isinstance(self.source_color, int)
-            else self.source_color
-        )
-        
-        # ===== OPTIMIZATION: Process templates in parallel =====
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        
-        def process_template(template_file):
-            """Process single template file"""
+        
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        
+        # ===== Pre-rendered by prefetch: only copy outputs into place =====
+        staging = None
+        if self.scheme_cache is not None and not self.rebuild_cache:
+            staging = self._load_staged(template_list)
+        if staging is not None:
+            print(f"Using {len(template_list)} pre-rendered template(s) from prefetch")
+        
+        # ===== OPTIMIZATION: Shared colors + metadata (no copy) =====
+        colors = self._template_colors()
+
+        # ===== OPTIMIZATION: Process templates in parallel =====
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        
+        def process_template(template_file):
+            """Process single template file"""
+            try:
+                # Compiled template (cached by path + mtime), single-pass render
+                template = load_template(template_file)
+                content = None
+                if staging is not None:
+                    try:
+                        content = (staging / template_file.stem).read_bytes()
+                    except OSError:
+                        # Pruned by a concurrent prefetch (_prune_staging)
+                        content = None
+                if content is None:
+                    content = template.render(colors)
+                unknown = template.unknown_keys(colors)
+                
+                # Write output
+                output_filename = template_file.stem
+                output_file = output_path / output_filename
+                
+                changed = self._write_output(output_file, content)
+                
+                return (True, template_file.name, str(output_file), unknown, changed)
+                
+            except Exception as e:
+                return (False, template_file.name, str(e), [], False)
+        
+        generated_files = []
+        
+        print(f"\nApplying colors to {len(template_list)} templates...")
+        
+        # Process with ThreadPoolExecutor (max 4 workers for I/O bound tasks)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # Submit all tasks
+            future_to_template = {
+                executor.submit(process_template, tf): tf 
+                for tf in template_list
+            }
+            
+            # Collect results as they complete
+            for future in as_completed(future_to_template):
+                success, name, result, unknown, changed = future.result()
+                
+                if success:
+                    generated_files.append(result)
+                    print(f"✓ {name} → {result}" + ("" if changed else " (unchanged)"))
+                    if unknown:
+                        print(f"  ⚠ unknown placeholders: {', '.join(unknown)}")
+                else:
+                    print(f"✗ {name}: {result}")
+        
+        return generated_files
+
+    def create_wallpaper_symlink(self):
+        """Create symlink to current wallpaper in ~/.config/m3-colors"""
+        config_dir = Path.home() / ".config" / "m3-colors"
+        config_dir.mkdir(parents=True, exist_ok=True)
+    
+        symlink_path = config_dir / "current_wallpaper"
+        wallpaper_path = Path(self.wallpaper_path).resolve()
+    
+        # Delete old symlink if exist
+        if symlink_path.exists() or symlink_path.is_symlink():
+            symlink_path.unlink()
+    
+        # Make new symlink 
+        symlink_path.symlink_to(wallpaper_path)
+        print(f"Created symlink → {symlink_path}")
+
+    def load_deploy_config(self):
+        """Load deployment mappings from config"""
+        config_file = Path.home() / ".config" / "m3-colors" / "deploy.json"
+        
+        default_config = {
+            "deployments": [
+                {"source": "colors-nvim.lua", "destination": "~/.config/nvim/lua/themes/material3.lua"},
+                {"source": "gtkrc", "destination": "~/.local/share/themes/FlatColor/gtk-2.0/gtkrc"},
+                {"source": "gtk.css", "destination": "~/.local/share/themes/FlatColor/gtk-3.0/gtk.css"},
+                {"source": "gtk.3.20", "destination": "~/.local/share/themes/FlatColor/gtk-3.20/gtk.css"}
+            ]
+        }
+        
+        if config_file.exists():
+            with open(config_file, 'r') as f:
+                return json.load(f)
+        else:
+            config_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(config_file, 'w') as f:
+                json.dump(default_config, f, indent=2)
+            return default_config
+
+    def deploy_configs(self):
+        """Deploy configs based on deploy.json (only destinations that differ)
+
+        Each deployment may set a "strategy" (default: top-level "strategy",
+        else atomic-copy):
+            atomic-copy: write a temp file and rename it over the destination
+            copy: rewrite the destination in place (keeps its inode)
+            symlink: destination links to the rendered file, never rewritten
+            hardlink: destination shares the rendered file's inode
+            reflink: copy-on-write clone (btrfs/XFS), falls back to atomic-copy
+        """
+        cache_dir = Path(self.config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')).expanduser()
+        config = self.load_deploy_config()
+        default_strategy = config.get("strategy", "atomic-copy")
+        
+        for item in config.get("deployments", []):
+            src = cache_dir / item["source"]
+            dest = Path(item["destination"]).expanduser()
+            strategy = item.get("strategy", default_strategy)
+            
+            if strategy not in DEPLOY_STRATEGIES:
+                print(f"⚠ {item['source']}: unknown strategy '{strategy}', using atomic-copy")
+                strategy = "atomic-copy"
+            
+            if not src.exists():
+                print(f"{item['source']} not found")
+                continue
+            
+            try:
+                changed = self._deploy_file(src, dest, strategy)
+            except OSError as e:
+                if strategy not in ("hardlink", "reflink"):
+                    print(f"✗ {item['source']} → {dest}: {e}")
+                    continue
+                # e.g. different filesystem or no copy-on-write support
+                print(f"⚠ {strategy} failed for {dest} ({e.strerror}), using atomic-copy")
+                strategy = "atomic-copy"
+                changed = self._deploy_file(src, dest, strategy)
+            
+            if changed:
+                print(f"{item['source']} → {dest} [{strategy}]")
+            else:
+                print(f"{item['source']} → {dest} [{strategy}] (unchanged)")
+
+    def _deploy_file(self, src, dest, strategy):
+        """Deploy one rendered file, returns True if dest changed"""
+        if strategy == "symlink":
+            target = src.resolve()
+            if dest.is_symlink() and Path(os.readlink(dest)) == target:
+                return False
+            _replace_with(dest, lambda tmp: tmp.symlink_to(target))
+
+        elif strategy == "hardlink":
+            # Templates are replaced atomically, so relink when the inode moved on
+            if dest.exists() and not dest.is_symlink() and os.path.samefile(src, dest):
+                return False
+            _replace_with(dest, lambda tmp: os.link(src, tmp))
+
+        else:
+            # Don't write through a link left by a previous symlink deployment
+            if dest.is_symlink() and dest.resolve() == src.resolve():
+                dest.unlink()
+
+            if strategy == "atomic-copy":
+                return self._write_output(dest, src.read_bytes())
+
+            content = src.read_bytes()
+            try:
+                if dest.read_bytes() == content:
+                    return False
+            except OSError:
+                pass
+
+            if strategy == "reflink":
+                _replace_with(dest, lambda tmp: _reflink(src, tmp))
+            else:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                with open(dest, 'wb') as f:
+                    f.write(content)
+
+        self._record_change(dest)
+        return True
+
+    def run_hook_scripts(self):
+        """Run external hook scripts with color env vars
+
+        Groups (separated by ';') run in order. Scripts in one group
+        (comma-separated) run concurrently, up to max_parallel at a time;
+        with the default max_parallel = 1 they run in order as well.
+        Each script is killed after its timeout ([Hook.Timeouts] overrides
+        the [Hook.Scripts] timeout per script).
+
+        Returns:
+            List of (script, group, status, seconds)
+        """
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not self.config.has_section('Hook.Scripts'):
+            return []
+        
+        if not self.config.getboolean('Hook.Scripts', 'enabled', fallback=False):
+            return []
+        
+        scripts_dir = Path(self.config.get('Hooks', 'scripts_dir', 
+                        fallback='~/.config/m3-colors/hooks')).expanduser()
+        
+        if not scripts_dir.exists():
+            return []
+        
+        groups = parse_hook_groups(self.config.get('Hook.Scripts', 'scripts', fallback=''))
+        
+        # 1 (default) runs every script in config order, like before groups
+        max_parallel = max(1, int(self.config.get('Hook.Scripts', 'max_parallel', fallback='1')))
+        default_timeout = float(self.config.get('Hook.Scripts', 'timeout', fallback='30'))
+        
+        # Prepare environment variables
+        colors = self._extract_colors()
+        env = os.environ.copy()
+        env.update({
+            'M3_MODE': self.mode,
+            'M3_WALLPAPER': self.wallpaper_path,
+            'M3_CHANGED_FILES': "\n".join(self.changed_files),
+            **{f'M3_{k.upper()}': str(v) for k, v in colors.items()}
+        })
+        
+        def run_hook(script_name):
+            script_path = scripts_dir / script_name
+            if not (script_path.exists() and script_path.is_file()):
+                return "missing", "", 0.0
+            
+            timeout = float(self.config.get('Hook.Timeouts', script_name, fallback=default_timeout))
+            start = time.perf_counter()
+            status, output = self._run_hook_script(script_path, env, timeout or None)
+            return status, output, time.perf_counter() - start
+        
+        results = []
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            for index, group in enumerate(groups, 1):
+                print(f"\n[HOOK] Running script(s): {', '.join(group)}")
+                # map() keeps config order; the group finishes before the next starts
+                for script_name, (status, output, seconds) in zip(group, executor.map(run_hook, group)):
+                    # Script output goes through print(), so it lands in the
+                    # stage's buffer instead of interleaving with other stages
+                    if output:
+                        print(output, end="" if output.endswith("\n") else "\n")
+                    print(f"{'✓' if status == 'ok' else '✗'} {script_name}: {status} ({seconds:.2f}s)")
+                    emit_event("hook", script=script_name, group=index, status=status,
+                               wall_ms=round(seconds * 1000, 3))
+                    results.append((script_name, index, status, seconds))
+        
+        if results:
+            print("\n[HOOK] Timings:")
+            for script_name, index, status, seconds in sorted(results, key=lambda r: r[3], reverse=True):
+                print(f"  {script_name:<24} group {index:<3} {status:<12} {seconds * 1000:8.1f} ms")
+        
+        return results
+
+    @staticmethod
+    def _run_hook_script(script_path, env, timeout=None):
+        """Run one hook script, capturing its stdout and stderr
+
+        Returns:
+            (status, output) with status 'ok', 'exit N', 'timeout' or 'error: ...'
+        """
+        import signal
+        import subprocess
+
+        try:
+            # Own session/process group, so a timeout also kills whatever
+            # the script started, not just bash
+            proc = subprocess.Popen(['bash', str(script_path)], env=env,
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    start_new_session=True)
+        except Exception as e:
+            return f"error: {e}", ""
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            output, _ = proc.communicate()
+            return "timeout", output.decode(errors="replace")
+        status = "ok" if proc.returncode == 0 else f"exit {proc.returncode}"
+        return status, output.decode(errors="replace")
+
+    def run_post_script(self, script_path=None):
+        """Run post-generation script"""
+        import subprocess
+
+        if script_path is None:
+            script_path = Path.home() / ".config" / "m3-colors" / "m3wal-post.sh"
+        
+        script = Path(script_path).expanduser()
+        if script.exists():
+            env = os.environ.copy()
+            env['M3_CHANGED_FILES'] = "\n".join(self.changed_files)
+            result = subprocess.run(["bash", str(script)], env=env,
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = result.stdout.decode(errors="replace")
+            if output:
+                print(output, end="" if output.endswith("\n") else "\n")
+            print(f"Executed {script.name}")    
+
+    def apply_xresources(self):
+        import subprocess
+
+        xresources = Path.home() / ".cache" / "m3-colors" / "colors.Xresources"
+        if xresources.exists():
+            subprocess.run(["xrdb", "-merge", str(xresources)])
+            print(f"Applied Xresources")
+
+    def set_wallpaper(self):
+        """Set wallpaper using feh"""
+        import subprocess
+
+        wallpapers = [Path(w).expanduser() for w in self.monitor_wallpapers or [self.wallpaper_path]]
+        if all(wallpaper.exists() for wallpaper in wallpapers):
+            # feh assigns one image per screen, in Xinerama order
+            subprocess.run(["feh", "--bg-fill", *map(str, wallpapers)])
+            print(f"Set wallpaper with feh")
+
+    def apply_template(self, template_path, output_path, colors=None):
+        """Apply colors to single template file
+        
+        Args:
+            template_path: Path to template file
+            output_path: Path to output file
+            colors: Optional pre-extracted colors mapping (untuk speed)
+        """
+        self._require_scheme()
+
+        # Use provided colors or the shared scheme + metadata
+        if colors is None:
+            colors = self._template_colors()
+
+        # Compiled template, single-pass render of all placeholders {{key}}
+        template = load_template(template_path)
+        unknown = template.unknown_keys(colors)
+        if unknown:
+            print(f"⚠ {Path(template_path).name}: unknown placeholders: {', '.join(unknown)}")
+
+        # Write output (skipped if unchanged)
+        self._write_output(output_path, template.render(colors))
+
+        return output_path
+
+class _StageOutput:
+    """sys.stdout proxy that buffers each stage thread's output
+
+    Stages print as one block when they finish instead of interleaving.
+    Writes from other threads go straight to the wrapped stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def begin(self):
+        self._local.buffer = []
+
+    def end(self):
+        text = "".join(self._local.buffer)
+        self._local.buffer = None
+        return text
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self.stream.flush()
+
+
+def ricing_stages(m3wal):
+    """Ricing stages of full mode as a dependency graph
+
+    Each stage lists the stages whose output it reads in 'inputs'
+    (e.g. deploy copies rendered templates, xrdb merges the rendered
+    colors.Xresources). Stages disabled in [Features] are left out.
+    """
+    config = m3wal.config
+
+    def templates():
+        print("\n[RICING] Applying templates...")
+        cache_dir = Path(config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')).expanduser()
+        generated_files = m3wal.apply_all_templates(output_dir=cache_dir)
+        if generated_files:
+            print(f"\nGenerated {len(generated_files)} config files")
+
+    def deploy():
+        print("\n[RICING] Deploying configs...")
+        m3wal.deploy_configs()
+
+    def hooks():
+        print("\n[RICING] Run Hook Scripts...")
+        m3wal.run_hook_scripts()
+
+    def xresources():
+        print("\n[RICING] Applying Xresources...")
+        m3wal.apply_xresources()
+
+    def wallpaper():
+        print("\n[RICING] Setting wallpaper...")
+        m3wal.set_wallpaper()
+
+    def symlink():
+        print("\n[RICING] Creating wallpaper symlink...")
+        m3wal.create_wallpaper_symlink()
+
+    def post_script():
+        script_path = config.get('PostScript', 'script_path', fallback='m3wal-post.sh')
+        # if relative path, merge with config_dir
+        if not Path(script_path).is_absolute():
+            config_dir = Path(config.get('Paths', 'config_dir', fallback='~/.config/m3-colors')).expanduser()
+            script_path = config_dir / script_path
+        
+        print("\n[RICING] Running post script...")
+        m3wal.run_post_script(script_path)
+
+    stages = [
+        {"name": "templates", "run": templates, "inputs": ()},
+        {"name": "deploy", "run": deploy, "inputs": ("templates",)},
+        {"name": "hooks", "run": hooks, "inputs": ("deploy",)},
+    ]
+    if config.getboolean('Features', 'apply_xresources', fallback=True):
+        stages.append({"name": "xresources", "run": xresources, "inputs": ("templates",)})
+    if config.getboolean('Features', 'set_wallpaper', fallback=True):
+        stages.append({"name": "wallpaper", "run": wallpaper, "inputs": ()})
+    if config.getboolean('Features', 'create_symlink', fallback=True):
+        stages.append({"name": "symlink", "run": symlink, "inputs": ()})
+    if config.getboolean('Features', 'run_post_script', fallback=True):
+        # Post script sees the final state of everything else, but (as before
+        # stages) still runs when one of them failed
+        stages.append({"name": "post_script", "run": post_script, "inputs": (),
+                       "after": ("deploy", "hooks", "xresources", "wallpaper", "symlink")})
+    return stages
+
+
+def run_stages(stages, max_workers=4, fail_fast=False):
+    """Run stages on a thread pool as soon as their inputs are done
+
+    Args:
+        stages: Dicts with 'name', 'run' (callable), 'inputs' (stage names;
+            names of stages not in the list are ignored) and optionally
+            'after' (stages to wait for whose failure does not skip it)
+        max_workers: Thread pool size (1 = sequential, in list order)
+        fail_fast: Stop starting new stages after the first failure and
+            re-raise it; otherwise only stages depending on it are skipped
+
+    Returns:
+        Dict mapping stage name to (status, seconds), status being
+        'ok', 'failed' or 'skipped'
+    """
+    import contextlib
+    import time
+    from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    names = {item["name"] for item in stages}
+    inputs = {item["name"]: [i for i in item["inputs"] if i in names] for item in stages}
+    after = {item["name"]: [i for i in item.get("after", ()) if i in names] for item in stages}
+    pending = list(stages)
+    running = {}
+    results = {}
+    first_error = None
+    output = _StageOutput(sys.stdout)
+
+    def run(item):
+        output.begin()
+        start = time.perf_counter()
+        error = None
+        try:
+            with stage(item["name"]):
+                item["run"]()
+        except Exception as e:
+            error = e
+        return error, time.perf_counter() - start, output.end()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output), ThreadPoolExecutor(max(1, max_workers)) as executor:
+        while pending or running:
+            for item in list(pending):
+                name = item["name"]
+                states = [results[i][0] if i in results else None for i in inputs[name]]
+                if first_error is not None or "failed" in states or "skipped" in states:
+                    pending.remove(item)
+                    results[name] = ("skipped", 0.0)
+                elif all(state == "ok" for state in states) and all(i in results for i in after[name]):
+                    pending.remove(item)
+                    if max_workers <= 1:
+                        # Sequential: run in this thread (visible to cProfile)
+                        future = Future()
+                        future.set_result(run(item))
+                        running[future] = name
+                        break
+                    running[executor.submit(run, item)] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Unresolvable stage inputs: {', '.join(s['name'] for s in pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error, seconds, text = future.result()
+                print(text, end="")
+                if error is None:
+                    results[name] = ("ok", seconds)
+                else:
+                    print(f"✗ Stage {name} failed: {error}")
+                    results[name] = ("failed", seconds)
+                    if fail_fast and first_error is None:
+                        first_error = error
+
+    elapsed = time.perf_counter() - start
+    total = sum(seconds for _, seconds in results.values())
+    print(f"\n[RICING] {len(results)} stage(s) in {elapsed:.2f}s (sequential sum {total:.2f}s)")
+    for item in stages:
+        status, seconds = results[item["name"]]
+        print(f"  {item['name']:<12} {status:<8} {seconds * 1000:8.1f} ms")
+
+    if first_error is not None:
+        raise first_error
+    return results
+
+
+def run_pipeline(m3wal, operation_mode, mode=None, variant=None, all_variants=False,
+                 sequential=False):
+    """Run CORE (and RICING in full mode) operations on an initialized instance
+
+    Args:
+        m3wal: M3Color (generator) or M3WAL (full) instance
+        operation_mode: 'generator' or 'full'
+        mode: 'light', 'dark' or 'auto' (None = config)
+        variant: Variant name or 'AUTO' (None = config)
+        all_variants: Also export every variant to JSON + preview
+        sequential: Run ricing stages one by one in this thread (profiling)
+    """
+    # Override config with CLI args if provided
+    if mode:
+        print(f"[INFO] Mode overridden by CLI: {mode}")
+    else:
+        mode = m3wal.config.get('General', 'mode', fallback='auto')
+    if variant:
+        print(f"[INFO] Variant overridden by CLI: {variant}")
+    else:
+        variant = m3wal.config.get('General', 'variant', fallback='CONTENT')
+    
+    print(f"\nOperation Mode: {operation_mode}")
+    print(f"="*50)
+    
+    # ===== CORE OPERATIONS (Always run) =====
+    print("\n[CORE] Analyzing wallpaper...")
+    with stage("analyze"):
+        analysis = m3wal.analyze_wallpaper()
+    print(f"Brightness: {analysis['brightness']:.1f} (threshold: {m3wal.brightness_threshold})")
+    print(f"Auto-detected mode: {analysis['mode']}")
+    
+    # Generate scheme
+    if mode == "auto":
+        mode = analysis["mode"]
+    
+    print(f"\n[CORE] Generating {mode} scheme with {variant} variant...")
+    with stage("scheme"):
+        colors = m3wal.generate_scheme(mode, variant)
+    m3wal.release_image()
+    print(f"Generated {len(colors)} colors")
+    
+    # Export to JSON
+    print("\n[CORE] Exporting color scheme...")
+    with stage("export"):
+        m3wal.export(variant=variant)
+
+    # Show preview
+    print("\n[CORE] Color Preview:")
+    m3wal.preview_colors()
+    
+    # Generate palette preview (if enabled)
+    if m3wal.config.getboolean('Features', 'generate_palette_preview', fallback=True):
+        print("\n[CORE] Generating palette preview...")
+        with stage("palette_preview"):
+            m3wal.generate_palette_preview()
+    
+    # Export every variant from a single quantization pass
+    if all_variants:
+        print("\n[CORE] Exporting all variants...")
+        with stage("all_variants"):
+            m3wal.export_variants_json()
+            m3wal.generate_all_variants_preview()
+    
+    # ===== RICING OPERATIONS (Only if full mode) =====
+    if operation_mode == 'full':
+        print(f"\n{'='*50}")
+        print("[RICING] Applying configurations...")
+        print(f"{'='*50}")
+        
+        config = m3wal.config
+        parallel = config.getboolean('Pipeline', 'parallel', fallback=True)
+        max_workers = int(config.get('Pipeline', 'max_workers', fallback='4')) if parallel and not sequential else 1
+        fail_fast = config.get('Pipeline', 'on_error', fallback='continue').strip().lower() == 'fail-fast'
+        
+        run_stages(ricing_stages(m3wal), max_workers, fail_fast)
+    
+    else:
+        print(f"\n{'='*50}")
+        print("[INFO] Generator-only mode: Ricing operations skipped")
+        print(f"Use --full flag or set operation_mode='full' in config")
+        print(f"to apply configurations to your system")
+        print(f"{'='*50}")
+    
+    # Summary of files whose content changed this run
+    print(f"\n[SUMMARY] {len(m3wal.changed_files)} file(s) changed")
+    for path in m3wal.changed_files:
+        print(f"  {path}")
+    
+    print(f"\nDone!")
+
+    return m3wal.changed_files
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff'}
+
+
+def find_wallpapers(source):
+    """Collect image files from a directory (recursive) or a glob pattern"""
+    import glob
+
+    source_path = Path(source).expanduser()
+    if source_path.is_dir():
+        candidates = source_path.rglob("*")
+    elif source_path.is_file():
+        candidates = [source_path]
+    else:
+        candidates = (Path(p) for p in glob.glob(str(source_path), recursive=True))
+
+    return sorted(
+        p.resolve() for p in candidates
+        if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+_batch_config = None
+
+
+def _batch_init(config):
+    """Process pool initializer: share the parent's config"""
+    global _batch_config
+    _batch_config = config
+
+
+def _batch_process(wallpaper, mode, variant, cache_only, previews=False):
+    """Analyze + generate one wallpaper in a worker process"""
+    import contextlib
+    import io
+
+    try:
+        # Worker output would interleave, keep it quiet
+        with contextlib.redirect_stdout(io.StringIO()):
+            m3 = M3Color(wallpaper, config=_batch_config)
+            analysis = m3.analyze_wallpaper()
+            scheme_mode = analysis["mode"] if mode == "auto" else mode
+            m3.generate_scheme(scheme_mode, variant)
+            if not cache_only:
+                m3.export(variant=variant)
+            if previews:
+                m3.generate_palette_preview()
+        return (True, wallpaper, None)
+    except Exception as e:
+        return (False, wallpaper, str(e))
+
+
+def _batch_state_key(wallpaper, mode, variant, cache_only, previews=False):
+    stat = os.stat(wallpaper)
+    key = f"{wallpaper}|{stat.st_size}|{stat.st_mtime_ns}|{mode}|{variant.upper()}|{int(cache_only)}"
+    return key + "|p" if previews else key
+
+
+def batch_main(argv):
+    """m3wal batch: process a whole wallpaper library with a process pool"""
+    import argparse
+    import time
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    parser = argparse.ArgumentParser(
+        prog='m3wal batch',
+        description='Generate schemes for every wallpaper in a directory or glob',
+    )
+    parser.add_argument('source', help='Wallpaper directory (searched recursively) or glob pattern')
+    parser.add_argument('--mode', '-m', choices=['light', 'dark', 'auto'],
+                        help='Color scheme mode (overrides config)')
+    parser.add_argument('--variant', '-v',
+                        choices=['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL',
+                                 'FIDELITY', 'CONTENT', 'MONOCHROME', 'AUTO'],
+                        help='Material 3 variant (overrides config)')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='Worker processes (default: available cores)')
+    parser.add_argument('--cache-only', action='store_true',
+                        help='Only populate the scheme cache, skip JSON/CSS exports')
+    parser.add_argument('--previews', action='store_true',
+                        help='Also render palette previews (cached schemes are reused)')
+    parser.add_argument('--force', action='store_true',
+                        help='Reprocess wallpapers already done by a previous batch run')
+    args = parser.parse_args(argv)
+
+    config = M3Color.load_config()
+    mode = args.mode or config.get('General', 'mode', fallback='auto')
+    variant = args.variant or config.get('General', 'variant', fallback='CONTENT')
+
+    if args.cache_only and not config.getboolean('Cache', 'enabled', fallback=True):
+        print("[BATCH] --cache-only needs [Cache] enabled = true")
+        return 1
+
+    wallpapers = find_wallpapers(args.source)
+    if not wallpapers:
+        print(f"[BATCH] No wallpapers found in {args.source}")
+        return 1
+
+    # Resume: skip wallpapers recorded as done with identical settings
+    cache_dir = Path(config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')).expanduser()
+    state_file = cache_dir / "batch_done.txt"
+    done = set()
+    if state_file.exists() and not args.force:
+        done = set(state_file.read_text().splitlines())
+
+    pending = {}
+    for wallpaper in wallpapers:
+        key = _batch_state_key(wallpaper, mode, variant, args.cache_only, args.previews)
+        if key not in done:
+            pending[str(wallpaper)] = key
+
+    skipped = len(wallpapers) - len(pending)
+    print(f"[BATCH] {len(wallpapers)} wallpaper(s), {skipped} already done, {len(pending)} to process")
+    if not pending:
+        return 0
+
+    if args.jobs:
+        jobs = args.jobs
+    elif hasattr(os, 'sched_getaffinity'):
+        jobs = len(os.sched_getaffinity(0))
+    else:
+        jobs = os.cpu_count() or 1
+    print(f"[BATCH] mode={mode} variant={variant} workers={jobs}")
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    completed = failed = 0
+    width = len(str(len(pending)))
+
+    with open(state_file, 'a') as state, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=_batch_init, initargs=(config,)) as executor:
+        futures = [
+            executor.submit(_batch_process, wallpaper, mode, variant, args.cache_only, args.previews)
+            for wallpaper in pending
+        ]
+        for future in as_completed(futures):
+            success, wallpaper, error = future.result()
+            completed += 1
+            rate = completed / (time.perf_counter() - start)
+            if success:
+                state.write(pending[wallpaper] + "\n")
+                state.flush()
+                print(f"[{completed:>{width}}/{len(pending)}] ✓ {Path(wallpaper).name} ({rate:.1f} img/s)")
+            else:
+                failed += 1
+                print(f"[{completed:>{width}}/{len(pending)}] ✗ {Path(wallpaper).name}: {error}")
+
+    # Workers only see their own writes: enforce the size cap once for all
+    if config.getboolean('Cache', 'enabled', fallback=True):
+        SchemeCache(cache_dir, config.get('Cache', 'max_size_mb', fallback='50')).evict()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n[BATCH] Processed {completed - failed} wallpaper(s), {failed} failed, "
+          f"{skipped} skipped in {elapsed:.1f}s ({completed / elapsed:.1f} img/s)")
+    return 1 if failed else 0
+
+
+def _image_size(path):
+    """Size of an image file as stored, read from its header (no decode)"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size
+
+
+def _dedupe_process(wallpaper):
+    """Perceptual hash + file info of one wallpaper in a worker process"""
+    try:
+        m3 = M3Color(wallpaper, config=_batch_config, use_cache=False)
+        phash, color = m3.perceptual_hash()
+        return (True, wallpaper, {
+            "hash": phash,
+            "color": color,
+            "content_hash": m3._content_hash(),
+            "size": list(_image_size(wallpaper)),
+            "bytes": os.path.getsize(wallpaper),
+        })
+    except Exception as e:
+        return (False, wallpaper, str(e))
+
+
+def find_duplicates(records, max_distance):
+    """Group wallpapers whose perceptual hashes are within max_distance
+
+    Args:
+        records: Dict path -> {'hash', 'color', ...}
+
+    Returns:
+        List of groups (lists of paths), largest file first, singletons dropped
+    """
+    paths = list(records)
+    parent = {path: path for path in paths}
+
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for i, a in enumerate(paths):
+        for b in paths[i + 1:]:
+            ra, rb = records[a], records[b]
+            if max(abs(x - y) for x, y in zip(ra["color"], rb["color"])) > PHASH_COLOR_TOLERANCE:
+                continue
+            if _hamming(ra["hash"], rb["hash"]) <= max_distance:
+                parent[find(b)] = find(a)
+
+    groups = {}
+    for path in paths:
+        groups.setdefault(find(path), []).append(path)
+
+    def pixels(path):
+        width, height = records[path]["size"]
+        return (width * height, records[path]["bytes"])
+
+    return [sorted(group, key=pixels, reverse=True) for group in groups.values() if len(group) > 1]
+
+
+def dedupe_main(argv):
+    """m3wal dedupe: report perceptual duplicates in a wallpaper library"""
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(
+        prog='m3wal dedupe',
+        description='Find resized/re-encoded copies of the same wallpaper (perceptual hash)',
+    )
+    parser.add_argument('source', help='Wallpaper directory (searched recursively) or glob pattern')
+    parser.add_argument('--distance', '-d', type=int, default=None,
+                        help='Max Hamming distance of the 64-bit hashes (default: [Cache] perceptual_distance)')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='Worker processes (default: available cores)')
+    parser.add_argument('--json', metavar='FILE', help='Write the report as JSON')
+    args = parser.parse_args(argv)
+
+    config = M3Color.load_config()
+    distance = args.distance
+    if distance is None:
+        distance = int(config.get('Cache', 'perceptual_distance', fallback='4'))
+
+    wallpapers = find_wallpapers(args.source)
+    if not wallpapers:
+        print(f"[DEDUPE] No wallpapers found in {args.source}")
+        return 1
+
+    records = {}
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_batch_init, initargs=(config,)) as executor:
+        for success, wallpaper, result in executor.map(_dedupe_process, map(str, wallpapers)):
+            if success:
+                records[wallpaper] = result
+            else:
+                print(f"✗ {Path(wallpaper).name}: {result}")
+
+    # Hashes are known now, let later runs reuse schemes across duplicates
+    if config.getboolean('Cache', 'enabled', fallback=True) and \
+            config.getboolean('Cache', 'perceptual_match', fallback=True):
+        index = PerceptualIndex(config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors'))
+        index.update({
+            record["content_hash"]: (record["hash"], record["color"], path)
+            for path, record in records.items()
+        })
+
+    groups = find_duplicates(records, distance)
+    reclaimable = 0
+    for group in groups:
+        keep = group[0]
+        width, height = records[keep]["size"]
+        print(f"\n{keep} ({width}x{height}, keep)")
+        for path in group[1:]:
+            record = records[path]
+            reclaimable += record["bytes"]
+            width, height = record["size"]
+            print(f"  {path} ({width}x{height}, "
+                  f"distance {_hamming(records[keep]['hash'], record['hash'])})")
+
+    duplicates = sum(len(group) - 1 for group in groups)
+    print(f"\n[DEDUPE] {len(records)} wallpaper(s), {len(groups)} duplicate group(s), "
+          f"{duplicates} duplicate(s), {reclaimable / (1024 * 1024):.1f} MB reclaimable")
+
+    if args.json:
+        report = {
+            "distance": distance,
+            "groups": [
+                [{"path": path, "size": records[path]["size"], "bytes": records[path]["bytes"],
+                  "hash": f"{records[path]['hash']:016x}"} for path in group]
+                for group in groups
+            ],
+        }
+        write_if_changed(Path(args.json).expanduser(), json.dumps(report, indent=2))
+    return 0
+
+
+def read_playlist(source):
+    """Wallpapers in playlist order
+
+    source is a text file with one path per line ('#' comments, paths
+    relative to the file) or anything find_wallpapers() accepts.
+    """
+    path = Path(source).expanduser()
+    if path.is_file() and path.suffix.lower() not in IMAGE_EXTENSIONS:
+        wallpapers = []
+        for line in path.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                wallpapers.append((path.parent / Path(line).expanduser()).resolve())
+        return wallpapers
+    return find_wallpapers(source)
+
+
+def upcoming_wallpapers(playlist, current, count):
+    """The count wallpapers after current in playlist (wrapping around)"""
+    if not playlist:
+        return []
+    current = Path(current).resolve() if current else None
+    start = playlist.index(current) + 1 if current in playlist else 0
+    count = min(count, len(playlist) - (1 if current in playlist else 0))
+    return [playlist[(start + i) % len(playlist)] for i in range(count)]
+
+
+def lower_priority():
+    """Run the rest of this process at idle CPU and I/O priority"""
+    import subprocess
+
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+    try:
+        # ionice -c3: idle I/O class (util-linux)
+        subprocess.run(['ionice', '-c', '3', '-p', str(os.getpid())],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        pass
+
+
+def _prune_staging(cache_dir, keep=16):
+    """Keep only the most recently written prefetch staging dirs"""
+    import shutil
+
+    root = Path(cache_dir).expanduser() / "prefetch"
+    if not root.exists():
+        return
+    dirs = sorted((d for d in root.iterdir() if d.is_dir()), key=lambda d: d.stat().st_mtime)
+    for old in dirs[:-keep] if keep else dirs:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def prefetch_main(argv):
+    """m3wal prefetch: precompute the next wallpapers of a playlist"""
+    import argparse
+
+    default_current = Path.home() / ".config" / "m3-colors" / "current_wallpaper"
+    parser = argparse.ArgumentParser(
+        prog='m3wal prefetch',
+        description='Cache schemes (and optionally rendered templates) of upcoming wallpapers',
+    )
+    parser.add_argument('playlist', help='Playlist file (one path per line), directory or glob')
+    parser.add_argument('--count', '-n', type=int, default=3,
+                        help='Number of upcoming wallpapers to prefetch (default: 3)')
+    parser.add_argument('--current', default=str(default_current),
+                        help='Current wallpaper (default: the current_wallpaper symlink)')
+    parser.add_argument('--mode', '-m', choices=['light', 'dark', 'auto'])
+    parser.add_argument('--variant', '-v',
+                        choices=['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL',
+                                 'FIDELITY', 'CONTENT', 'MONOCHROME', 'AUTO'])
+    parser.add_argument('--templates', action='store_true',
+                        help='Also pre-render templates so the switch only deploys them')
+    parser.add_argument('--no-nice', action='store_true',
+                        help='Keep normal CPU/I/O priority')
+    args = parser.parse_args(argv)
+
+    if not args.no_nice:
+        lower_priority()
+
+    config = M3Color.load_config()
+    if not config.getboolean('Cache', 'enabled', fallback=True):
+        print("[PREFETCH] Needs [Cache] enabled = true")
+        return 1
+
+    playlist = read_playlist(args.playlist)
+    current = Path(args.current).expanduser()
+    upcoming = upcoming_wallpapers(playlist, current if current.exists() else None, args.count)
+    if not upcoming:
+        print(f"[PREFETCH] No wallpapers found in {args.playlist}")
+        return 1
+
+    mode = args.mode or config.get('General', 'mode', fallback='auto')
+    variant = args.variant or config.get('General', 'variant', fallback='CONTENT')
+    failed = 0
+    for wallpaper in upcoming:
+        try:
+            m3wal = M3WAL(str(wallpaper), config)
+            analysis = m3wal.analyze_wallpaper()
+            scheme_mode = analysis["mode"] if mode == "auto" else mode
+            m3wal.generate_scheme(scheme_mode, variant)
+            if args.templates:
+                m3wal.prerender_templates()
+            print(f"[PREFETCH] ✓ {wallpaper.name} ({scheme_mode}, {m3wal.variant})")
+        except Exception as e:
+            failed += 1
+            print(f"[PREFETCH] ✗ {wallpaper.name}: {e}")
+
+    if args.templates:
+        _prune_staging(config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors'),
+                       keep=max(16, 2 * args.count))
+    return 1 if failed else 0
+
+
+# How the primary (system-wide) scheme is picked in multi-monitor mode;
+# an output name is accepted as well
+PRIMARY_RULES = ('first', 'largest', 'brightest', 'darkest', 'colorful', 'majority')
+
+
+def parse_monitors(specs):
+    """Parse OUTPUT=WALLPAPER arguments into an ordered {output: wallpaper} dict
+
+    A bare wallpaper path gets the output name monitorN.
+    """
+    monitors = {}
+    for index, spec in enumerate(specs):
+        output, sep, wallpaper = spec.partition('=')
+        if not sep or '/' in output:
+            output, wallpaper = f"monitor{index}", spec
+        if output in monitors:
+            raise ValueError(f"Output given twice: {output}")
+        monitors[output] = str(Path(wallpaper).expanduser().resolve())
+    return monitors
+
+
+def _analyze_monitor(m3, mode, variant):
+    """Analyze + generate the scheme of one monitor's wallpaper"""
+    analysis = m3.analyze_wallpaper()
+    scheme_mode = analysis["mode"] if mode == "auto" else mode
+    m3.generate_scheme(scheme_mode, variant)
+    m3.release_image()
+    return analysis
+
+
+def select_primary(rule, outputs):
+    """Pick the output whose scheme becomes the primary one
+
+    Args:
+        rule: One of PRIMARY_RULES or an output name
+        outputs: Ordered dict output -> {'m3', 'analysis', 'scheme_id'}
+
+    Returns:
+        Output name (ties go to the first listed output)
+    """
+    if rule in outputs:
+        return rule
+
+    if rule == 'largest':
+        def score(output):
+            with outputs[output]["m3"]._open_image() as img:
+                return img.width * img.height
+    elif rule == 'brightest':
+        def score(output):
+            return outputs[output]["analysis"]["brightness"]
+    elif rule == 'darkest':
+        def score(output):
+            return -outputs[output]["analysis"]["brightness"]
+    elif rule == 'colorful':
+        from material_color_utilities import Hct
+
+        def score(output):
+            return Hct(_to_hex(outputs[output]["m3"].source_color)).chroma
+    elif rule == 'majority':
+        from collections import Counter
+
+        counts = Counter(info["scheme_id"] for info in outputs.values())
+
+        def score(output):
+            return counts[outputs[output]["scheme_id"]]
+    else:
+        if rule != 'first':
+            print(f"[MULTI] Unknown primary rule '{rule}', using 'first'")
+        return next(iter(outputs))
+
+    return max(outputs, key=score)
+
+
+def multi_main(argv):
+    """m3wal multi: one wallpaper per output, schemes analyzed concurrently"""
+    import argparse
+    import contextlib
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(
+        prog='m3wal multi',
+        description='Generate schemes for several monitors in one run',
+    )
+    parser.add_argument('monitors', nargs='+', metavar='OUTPUT=WALLPAPER',
+                        help='Output name and its wallpaper (e.g. DP-1=~/walls/a.jpg)')
+    parser.add_argument('--mode', '-m', choices=['light', 'dark', 'auto'],
+                        help='Color scheme mode (overrides config)')
+    parser.add_argument('--variant', '-v',
+                        choices=['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL',
+                                 'FIDELITY', 'CONTENT', 'MONOCHROME', 'AUTO'],
+                        help='Material 3 variant (overrides config)')
+    parser.add_argument('--primary', '-p',
+                        help=f"Rule picking the primary scheme: {', '.join(PRIMARY_RULES)} "
+                             f"or an output name (default: [Monitors] primary)")
+    parser.add_argument('--generator-only', '-g', action='store_true',
+                        help='Only generate colors, skip ricing')
+    parser.add_argument('--full', '-f', action='store_true',
+                        help='Apply all configurations')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the scheme cache')
+    args = parser.parse_args(argv)
+
+    try:
+        monitors = parse_monitors(args.monitors)
+    except ValueError as e:
+        parser.error(str(e))
+
+    config = M3Color.load_config()
+    mode = args.mode or config.get('General', 'mode', fallback='auto')
+    variant = args.variant or config.get('General', 'variant', fallback='CONTENT')
+    rule = args.primary or config.get('Monitors', 'primary', fallback='first')
+    if args.generator_only:
+        operation_mode = 'generator'
+    elif args.full:
+        operation_mode = 'full'
+    else:
+        operation_mode = config.get('General', 'operation_mode', fallback='full')
+
+    # Outputs showing the same wallpaper share one instance
+    cls = M3WAL if operation_mode == 'full' else M3Color
+    instances = {}
+    for wallpaper in monitors.values():
+        if wallpaper not in instances:
+            instances[wallpaper] = cls(wallpaper, config, use_cache=not args.no_cache)
+
+    print(f"[MULTI] {len(monitors)} output(s), {len(instances)} wallpaper(s), "
+          f"mode={mode} variant={variant}")
+
+    # ===== Analyze all wallpapers concurrently (decode/NumPy release the GIL) =====
+    output = _StageOutput(sys.stdout)
+
+    def analyze(m3):
+        output.begin()
+        try:
+            return _analyze_monitor(m3, mode, variant), None, output.end()
+        except Exception as e:
+            return None, e, output.end()
+
+    with stage("analyze"), contextlib.redirect_stdout(output), \
+            ThreadPoolExecutor(max_workers=len(instances)) as executor:
+        analyses = dict(zip(instances, executor.map(analyze, instances.values())))
+
+    outputs = {}
+    failed = 0
+    shown = set()
+    for name, wallpaper in monitors.items():
+        analysis, error, text = analyses[wallpaper]
+        print(f"\n[MULTI] {name}: {Path(wallpaper).name}")
+        if text and wallpaper not in shown:
+            print(text, end="")
+        shown.add(wallpaper)
+        if error is not None:
+            failed += 1
+            print(f"✗ {error}")
+            continue
+        m3 = instances[wallpaper]
+        scheme_id = f"{m3.variant.upper()}-{m3.mode}-{_to_hex(m3.source_color).lstrip('#')}"
+        outputs[name] = {"m3": m3, "analysis": analysis, "scheme_id": scheme_id}
+        print(f"✓ {m3.mode} {m3.variant} (source {_to_hex(m3.source_color)})")
+
+    if not outputs:
+        return 1
+
+    primary = select_primary(rule, outputs)
+    primary_m3 = outputs[primary]["m3"]
+    print(f"\n[MULTI] Primary: {primary} (rule: {rule})")
+
+    # ===== Exports: once per wallpaper =====
+    print("\n[CORE] Exporting color schemes...")
+    with stage("export"):
+        exported = set()
+        for info in outputs.values():
+            if id(info["m3"]) not in exported:
+                exported.add(id(info["m3"]))
+                info["m3"].export(variant=variant)
+
+    if config.getboolean('Features', 'generate_palette_preview', fallback=True):
+        print("\n[CORE] Generating palette preview...")
+        with stage("palette_preview"):
+            primary_m3.generate_palette_preview()
+
+    # ===== Templates: once per distinct scheme =====
+    # The primary scheme goes through the normal ricing pipeline; every
+    # other scheme is rendered into monitors/<scheme>, and each output gets
+    # a monitors/<output> link to the directory holding its scheme
+    cache_dir = Path(config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')).expanduser()
+    monitors_dir = cache_dir / "monitors"
+    primary_id = outputs[primary]["scheme_id"]
+    scheme_dirs = {primary_id: cache_dir}
+    if operation_mode == 'full':
+        for info in outputs.values():
+            scheme_id = info["scheme_id"]
+            if scheme_id in scheme_dirs:
+                continue
+            scheme_dirs[scheme_id] = monitors_dir / scheme_id
+            print(f"\n[MULTI] Rendering templates for scheme {scheme_id}...")
+            with stage("templates"):
+                info["m3"].apply_all_templates(output_dir=scheme_dirs[scheme_id])
+
+        monitors_dir.mkdir(parents=True, exist_ok=True)
+        for name, info in outputs.items():
+            target = scheme_dirs[info["scheme_id"]]
+            _replace_with(monitors_dir / name, lambda tmp, target=target: os.symlink(target, tmp))
+
+        # Drop links and scheme directories of outputs that are gone
+        keep = set(outputs) | {path.name for path in scheme_dirs.values()}
+        for entry in monitors_dir.iterdir():
+            if entry.name not in keep and entry.name != "monitors.json":
+                if entry.is_dir() and not entry.is_symlink():
+                    shutil.rmtree(entry, ignore_errors=True)
+                else:
+                    entry.unlink()
+
+    summary = {
+        "primary": primary,
+        "rule": rule,
+        "outputs": {
+            name: {
+                "wallpaper": info["m3"].wallpaper_path,
+                "mode": info["m3"].mode,
+                "variant": info["m3"].variant,
+                "source_color": _to_hex(info["m3"].source_color),
+                "scheme": info["scheme_id"],
+            }
+            for name, info in outputs.items()
+        },
+    }
+    write_if_changed(monitors_dir / "monitors.json", json.dumps(summary, indent=2))
+
+    # ===== Ricing with the primary scheme, feh gets every output's wallpaper =====
+    if operation_mode == 'full':
+        print(f"\n{'='*50}")
+        print(f"[RICING] Applying configurations ({primary})...")
+        print(f"{'='*50}")
+        primary_m3.monitor_wallpapers = list(monitors.values())
+        parallel = config.getboolean('Pipeline', 'parallel', fallback=True)
+        max_workers = int(config.get('Pipeline', 'max_workers', fallback='4')) if parallel else 1
+        fail_fast = config.get('Pipeline', 'on_error', fallback='continue').strip().lower() == 'fail-fast'
+        run_stages(ricing_stages(primary_m3), max_workers, fail_fast)
+
+    changed = [path for m3 in instances.values() for path in m3.changed_files]
+    print(f"\n[SUMMARY] {len(changed)} file(s) changed")
+    for path in changed:
+        print(f"  {path}")
+    return 1 if failed else 0
+
+
+def default_socket_path():
+    """Daemon socket: $XDG_RUNTIME_DIR/m3wal.sock, else per-user file in /tmp"""
+    import tempfile
+
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return Path(runtime_dir) / "m3wal.sock"
+    return Path(tempfile.gettempdir()) / f"m3wal-{os.getuid()}.sock"
+
+
+class _SocketStream:
+    """File-like object that forwards printed lines to a client as JSON messages"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.send({"type": "progress", "line": line})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def send(self, message):
+        try:
+            self.conn.sendall((json.dumps(message) + "\n").encode('utf-8'))
+        except OSError:
+            # Client went away, finish the run anyway
+            pass
+
+
+class _ResidentBase:
+    """Shared state of long-running modes: config reloaded on change and
+    recently used wallpapers kept warm in memory"""
+
+    def __init__(self, max_recent=16):
+        self.max_recent = max_recent
+        self.running = False
+        self.config = None
+        self._config_stamp = None
+        # Recently used wallpapers, with their decoded thumbnails/source color
+        self.recent = {}
+
+    def _load_config(self):
+        """(Re)load config only when m3-colors.conf changed"""
+        config_file = Path.home() / ".config" / "m3-colors" / "m3-colors.conf"
+        try:
+            stamp = config_file.stat().st_mtime_ns
+        except OSError:
+            stamp = None
+        if self.config is None or stamp != self._config_stamp:
+            self.config = M3Color.load_config()
+            self._config_stamp = config_file.stat().st_mtime_ns
+            self.recent.clear()
+        return self.config
+
+    def _get_instance(self, wallpaper, use_cache=True, rebuild_cache=False):
+        config = self._load_config()
+        if not use_cache or rebuild_cache:
+            return M3WAL(wallpaper, config, use_cache, rebuild_cache)
+
+        stat = os.stat(wallpaper)
+        key = (wallpaper, stat.st_size, stat.st_mtime_ns)
+        instance = self.recent.pop(key, None)
+        if instance is None:
+            instance = M3WAL(wallpaper, config)
+        else:
+            instance.reset()
+
+        # Most recent last; drop the oldest beyond max_recent
+        self.recent[key] = instance
+        while len(self.recent) > self.max_recent:
+            self.recent.pop(next(iter(self.recent)))
+        return instance
+
+
+class M3WalDaemon(_ResidentBase):
+    """Resident process serving pipeline runs over a UNIX domain socket
+
+    Protocol: the client sends one JSON line, e.g.
+        {"command": "run", "wallpaper": "/abs/path.jpg", "mode": "dark",
+         "variant": "AUTO", "operation_mode": "full"}
+    and receives JSON lines {"type": "progress", "line": ...} followed by
+    {"type": "done", "ok": true, "changed_files": [...]}.
+    Other commands: "ping", "stop".
+    """
+
+    def __init__(self, socket_path=None, max_recent=16):
+        super().__init__(max_recent)
+        self.socket_path = Path(socket_path) if socket_path else default_socket_path()
+
+    def handle(self, conn):
+        """Serve one client connection"""
+        import contextlib
+
+        stream = _SocketStream(conn)
+        with conn, conn.makefile('r', encoding='utf-8') as reader:
+            try:
+                request = json.loads(reader.readline() or "{}")
+            except ValueError as e:
+                stream.send({"type": "done", "ok": False, "error": f"Bad request: {e}"})
+                return
+
+            command = request.get("command", "run")
+            if command == "ping":
+                stream.send({"type": "done", "ok": True, "pid": os.getpid()})
+                return
+            if command == "stop":
+                self.running = False
+                stream.send({"type": "done", "ok": True})
+                return
+
+            sink = None
+            if request.get("events"):
+                sink = lambda message: stream.send({"type": "event", **message})
+            instrumentation = set_instrumentation(Instrumentation(sink))
+
+            try:
+                with contextlib.redirect_stdout(stream):
+                    wallpaper = request["wallpaper"]
+                    m3wal = self._get_instance(
+                        wallpaper,
+                        not request.get("no_cache", False),
+                        request.get("rebuild_cache", False),
+                    )
+                    operation_mode = request.get("operation_mode") or \
+                        m3wal.config.get('General', 'operation_mode', fallback='full')
+                    changed_files = run_pipeline(
+                        m3wal, operation_mode,
+                        request.get("mode"), request.get("variant"),
+                        request.get("all_variants", False),
+                    )
+                    m3wal.release_image()
+                    if request.get("timings"):
+                        instrumentation.print_report()
+                stream.send({"type": "done", "ok": True, "changed_files": changed_files})
+            except Exception as e:
+                stream.send({"type": "done", "ok": False, "error": f"{type(e).__name__}: {e}"})
+
+    def serve(self):
+        """Bind socket and serve requests one at a time until stopped"""
+        import signal
+        import socket
+
+        if self.socket_path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.socket_path))
+                raise RuntimeError(f"Daemon already running on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Stale socket from a previous daemon
+                self.socket_path.unlink()
+            finally:
+                probe.close()
+
+        # Warm up: config and heavy imports before the first request
+        import importlib
+
+        self._load_config()
+        for module in ("numpy", "PIL.Image", "material_color_utilities"):
+            importlib.import_module(module)
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Created 0600: with the /tmp fallback, a chmod() after bind() would
+        # leave a window where other users can connect
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(str(self.socket_path))
+        finally:
+            os.umask(old_umask)
+        server.listen(8)
+        server.settimeout(1.0)
+
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'running', False))
+        self.running = True
+        print(f"[DAEMON] Listening on {self.socket_path} (pid {os.getpid()})")
+        try:
+            while self.running:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                conn.settimeout(None)
+                self.handle(conn)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            try:
+                self.socket_path.unlink()
+            except OSError:
+                pass
+            print("[DAEMON] Stopped")
+
+
+def daemon_main(argv):
+    """m3wal daemon: keep m3wal warm and serve requests over a UNIX socket"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='m3wal daemon',
+        description='Resident m3wal process serving requests over a UNIX domain socket',
+    )
+    parser.add_argument('--socket', help=f'Socket path (default: {default_socket_path()})')
+    parser.add_argument('--max-recent', type=int, default=16,
+                        help='Wallpapers kept warm in memory (default: 16)')
+    args = parser.parse_args(argv)
+
+    try:
+        M3WalDaemon(args.socket, args.max_recent).serve()
+    except RuntimeError as e:
+        print(f"[DAEMON] {e}")
+        return 1
+    return 0
+
+
+def client_main(argv):
+    """m3wal client: send a request to the daemon and stream its output"""
+    import argparse
+    import socket
+
+    parser = argparse.ArgumentParser(
+        prog='m3wal client',
+        description='Send a request to a running m3wal daemon',
+    )
+    parser.add_argument('wallpaper', nargs='?', help='Path to wallpaper image')
+    parser.add_argument('--mode', '-m', choices=['light', 'dark', 'auto'])
+    parser.add_argument('--variant', '-v',
+                        choices=['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL',
+                                 'FIDELITY', 'CONTENT', 'MONOCHROME', 'AUTO'])
+    parser.add_argument('--generator-only', '-g', action='store_true')
+    parser.add_argument('--full', '-f', action='store_true')
+    parser.add_argument('--all-variants', action='store_true')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--rebuild-cache', action='store_true')
+    parser.add_argument('--timings', action='store_true', help='Print per-stage timings')
+    parser.add_argument('--events', metavar='FILE',
+                        help="Write JSON-lines events to FILE ('-' = stderr)")
+    parser.add_argument('--ping', action='store_true', help='Check that the daemon is running')
+    parser.add_argument('--stop', action='store_true', help='Stop the daemon')
+    parser.add_argument('--socket', help=f'Socket path (default: {default_socket_path()})')
+    args = parser.parse_args(argv)
+
+    if args.ping:
+        request = {"command": "ping"}
+    elif args.stop:
+        request = {"command": "stop"}
+    elif args.wallpaper:
+        request = {
+            "command": "run",
+            "wallpaper": str(Path(args.wallpaper).expanduser().resolve()),
+            "mode": args.mode,
+            "variant": args.variant,
+            "operation_mode": 'generator' if args.generator_only else ('full' if args.full else None),
+            "all_variants": args.all_variants,
+            "no_cache": args.no_cache,
+            "rebuild_cache": args.rebuild_cache,
+            "timings": args.timings,
+            "events": bool(args.events),
+        }
+    else:
+        parser.error("wallpaper is required (or use --ping / --stop)")
+
+    socket_path = args.socket or str(default_socket_path())
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        print(f"[CLIENT] Daemon not running on {socket_path} (start it with: m3wal daemon)")
+        return 1
+
+    events = _open_events(args.events) if args.events else None
+
+    with conn, conn.makefile('r', encoding='utf-8') as reader:
+        conn.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        for line in reader:
+            message = json.loads(line)
+            if message["type"] == "progress":
+                print(message["line"], flush=True)
+            elif message["type"] == "event":
+                del message["type"]
+                events.write(json.dumps(message) + "\n")
+                events.flush()
+            elif message["type"] == "done":
+                if not message["ok"]:
+                    print(f"[CLIENT] Failed: {message.get('error')}")
+                    return 1
+                if args.ping:
+                    print(f"[CLIENT] Daemon running (pid {message['pid']})")
+                return 0
+
+    print("[CLIENT] Connection closed before the request finished")
+    return 1
+
+
+def _open_events(path):
+    """Event stream target: '-' is stderr, anything else a file (or FIFO)"""
+    if path == '-':
+        return sys.stderr
+    return open(os.path.expanduser(path), 'a', buffering=1, encoding='utf-8')
+
+
+class _Inotify:
+    """Minimal inotify(7) binding through ctypes (no extra dependency)"""
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self):
+        import ctypes
+
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+
+    def add_watch(self, directory):
+        """Watch a directory for completed writes, renames and new symlinks"""
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch {directory}: {os.strerror(errno)}")
+        self._watches[wd] = Path(directory)
+
+    def read(self, timeout):
+        """Paths with events within timeout seconds (empty list if none)"""
+        import select
+        import struct
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            offset += 16 + length
+            if wd in self._watches and name:
+                path = self._watches[wd] / os.fsdecode(name)
+                # A created file may still be written (IN_CLOSE_WRITE follows);
+                # only symlinks (ln -s, no rename) are complete on creation
+                if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO) or path.is_symlink():
+                    paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollWatch:
+    """Polling fallback with the same interface as _Inotify"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._snapshot = {}
+
+    def _scan(self, directory):
+        entries = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries[Path(entry.path)] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        except OSError:
+            pass
+        return entries
+
+    def add_watch(self, directory):
+        self._snapshot[Path(directory)] = self._scan(directory)
+
+    def read(self, timeout):
+        import time
+
+        time.sleep(min(timeout, self.interval))
+        paths = []
+        for directory, old in self._snapshot.items():
+            new = self._scan(directory)
+            paths.extend(path for path, state in new.items() if old.get(path) != state)
+            self._snapshot[directory] = new
+        return paths
+
+    def close(self):
+        pass
+
+
+class WallpaperWatcher(_ResidentBase):
+    """Re-run the pipeline in-process when a wallpaper changes
+
+    target may be a wallpaper file, a directory (the most recently written
+    image wins) or a symlink such as ~/.config/m3-colors/current_wallpaper.
+    Bursts of events are debounced and runs never overlap: events arriving
+    during a run are coalesced into the next one.
+    """
+
+    def __init__(self, target, mode=None, variant=None, operation_mode=None,
+                 debounce=0.5, poll=False, interval=1.0, max_recent=16,
+                 prefetch=0, playlist=None):
+        super().__init__(max_recent)
+        self.target = Path(target).expanduser()
+        self.mode = mode
+        self.variant = variant
+        self.operation_mode = operation_mode
+        self.debounce = debounce
+        self.poll = poll
+        self.interval = interval
+        # (path, size, mtime) of the last successful run
+        self._last = None
+        # Background prefetch of the next wallpapers after each run
+        self.prefetch = prefetch
+        self.playlist = playlist or (str(self.target) if self.target.is_dir() else None)
+        self._prefetch_proc = None
+
+    def _load_config(self):
+        config = super()._load_config()
+        # A watched symlink is the input: runs must not re-point it (in memory only)
+        if self.target.is_symlink():
+            if not config.has_section('Features'):
+                config.add_section('Features')
+            config.set('Features', 'create_symlink', 'false')
+        return config
+
+    def _open_watch(self):
+        if not self.poll:
             try:
-                # Read template
-                with open(template_file, 'r') as f:
-                    content = f.read()
-                
-                # Replace all placeholders
-                for key, value in colors.items():
-                    content = content.replace(f'{{{{{key}}}}}', str(value))
-                
-                # Write output
-                output_filename = template_file.stem
-                output_file = output_path / output_filename
-                
-                with open(output_file, 'w') as f:
-                    f.write(content)
-                
-                return (True, template_file.name, str(output_file))
-                
-            except Exception as e:
-                return (False, template_file.name, str(e))
-        
-        generated_files = []
-        
-        print(f"\nApplying colors to {len(template_list)} templates...")
-        
-        # Process with ThreadPoolExecutor (max 4 workers for I/O bound tasks)
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # Submit all tasks
-            future_to_template = {
-                executor.submit(process_template, tf): tf 
-                for tf in template_list
-            }
-            
-            # Collect results as they complete
-            for future in as_completed(future_to_template):
-                success, name, result = future.result()
-                
-                if success:
-                    generated_files.append(result)
-                    print(f"✓ {name} → {result}")
-                else:
-                    print(f"✗ {name}: {result}")
-        
-        return generated_files
+                return _Inotify()
+            except (OSError, AttributeError) as e:
+                print(f"[WATCH] inotify unavailable ({e}), polling every {self.interval}s")
+        return _PollWatch(self.interval)
 
-    def create_wallpaper_symlink(self):
-        """Create symlink to current wallpaper in ~/.config/m3-colors"""
-        config_dir = Path.home() / ".config" / "m3-colors"
-        config_dir.mkdir(parents=True, exist_ok=True)
-    
-        symlink_path = config_dir / "current_wallpaper"
-        wallpaper_path = Path(self.wallpaper_path).resolve()
-    
-        # Delete old symlink if exist
-        if symlink_path.exists() or symlink_path.is_symlink():
-            symlink_path.unlink()
-    
-        # Make new symlink 
-        symlink_path.symlink_to(wallpaper_path)
-        print(f"Created symlink → {symlink_path}")
+    def _watch_dirs(self):
+        """Directories to watch: the target (or its parent) and a symlink's target dir"""
+        if self.target.is_dir():
+            return {self.target}
+        dirs = {self.target.parent}
+        if self.target.is_symlink() and self.target.exists():
+            dirs.add(self.target.resolve().parent)
+        return dirs
 
-    def load_deploy_config(self):
-        """Load deployment mappings from config"""
-        config_file = Path.home() / ".config" / "m3-colors" / "deploy.json"
-        
-        default_config = {
-            "deployments": [
-                {"source": "colors-nvim.lua", "destination": "~/.config/nvim/lua/themes/material3.lua"},
-                {"source": "gtkrc", "destination": "~/.local/share/themes/FlatColor/gtk-2.0/gtkrc"},
-                {"source": "gtk.css", "destination": "~/.local/share/themes/FlatColor/gtk-3.0/gtk.css"},
-                {"source": "gtk.3.20", "destination": "~/.local/share/themes/FlatColor/gtk-3.20/gtk.css"}
-            ]
-        }
-        
-        if config_file.exists():
-            with open(config_file, 'r') as f:
-                return json.load(f)
-        else:
-            config_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(config_file, 'w') as f:
-                json.dump(default_config, f, indent=2)
-            return default_config
+    def _relevant(self, paths):
+        if self.target.is_dir():
+            return [p for p in paths if p.parent == self.target and p.suffix.lower() in IMAGE_EXTENSIONS]
+        interest = {self.target}
+        if self.target.is_symlink() and self.target.exists():
+            interest.add(self.target.resolve())
+        return [p for p in paths if p in interest]
 
-    def deploy_configs(self):
-        """Deploy configs based on deploy.json"""
-        import shutil
-        
-        cache_dir = Path.home() / ".cache" / "m3-colors"
-        config = self.load_deploy_config()
-        
-        for item in config.get("deployments", []):
-            src = cache_dir / item["source"]
-            dest = Path(item["destination"]).expanduser()
-            
-            if src.exists():
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src, dest)
-                print(f"{item['source']} → {dest}")
-            else:
-                print(f"{item['source']} not found")
+    def _pick(self, paths):
+        """Wallpaper to apply for a burst of changed paths"""
+        if self.target.is_dir():
+            existing = [p for p in paths if p.is_file()]
+            return existing[-1] if existing else None
+        return self.target.resolve() if self.target.exists() else None
 
-    def run_hook_scripts(self):
-        """Run external hook scripts with color env vars"""
-        if not self.config.has_section('Hook.Scripts'):
-            return
-        
-        if not self.config.getboolean('Hook.Scripts', 'enabled', fallback=False):
-            return
-        
-        scripts_dir = Path(self.config.get('Hooks', 'scripts_dir', 
-                        fallback='~/.config/m3-colors/hooks')).expanduser()
-        
-        if not scripts_dir.exists():
-            return
-        
-        scripts = self.config.get('Hook.Scripts', 'scripts', fallback='').split(',')
-        scripts = [s.strip() for s in scripts if s.strip()]
-        
-        # Prepare environment variables
-        colors = self._extract_colors()
-        env = os.environ.copy()
-        env.update({
-            'M3_MODE': self.mode,
-            'M3_WALLPAPER': self.wallpaper_path,
-            **{f'M3_{k.upper()}': str(v) for k, v in colors.items()}
-        })
-        
-        for script_name in scripts:
-            script_path = scripts_dir / script_name
-            if script_path.exists() and script_path.is_file():
-                print(f"\n[HOOK] Running script: {script_name}")
-                try:
-                    subprocess.run(['bash', str(script_path)], env=env, check=True)
-                    print(f"✓ Success")
-                except Exception as e:
-                    print(f"✗ Failed: {e}")
+    def run_once(self, wallpaper):
+        """Run the pipeline for wallpaper unless it was just applied"""
+        wallpaper = Path(wallpaper).resolve()
+        try:
+            st = wallpaper.stat()
+        except OSError as e:
+            print(f"[WATCH] Skipped {wallpaper}: {e}")
+            return False
 
-    def run_post_script(self, script_path=None):
-        """Run post-generation script"""
-        import subprocess
+        key = (str(wallpaper), st.st_size, st.st_mtime_ns)
+        if key == self._last:
+            return False
 
-        if script_path is None:
-            script_path = Path.home() / ".config" / "m3-colors" / "m3wal-post.sh"
-        
-        script = Path(script_path).expanduser()
-        if script.exists():
-            subprocess.run(["bash", str(script)])
-            print(f"Executed {script.name}")    
+        print(f"\n[WATCH] Wallpaper changed: {wallpaper}")
+        try:
+            m3wal = self._get_instance(str(wallpaper))
+            operation_mode = self.operation_mode or \
+                m3wal.config.get('General', 'operation_mode', fallback='full')
+            run_pipeline(m3wal, operation_mode, self.mode, self.variant)
+            m3wal.release_image()
+        except Exception as e:
+            # e.g. a partially written image; the next event retries
+            print(f"[WATCH] Failed: {type(e).__name__}: {e}")
+            return False
 
-    def apply_xresources(self):
+        self._last = key
+        self._start_prefetch(wallpaper)
+        return True
+
+    def _start_prefetch(self, wallpaper):
+        """Prefetch the wallpapers after this one in a low-priority process"""
         import subprocess
 
-        xresources = Path.home() / ".cache" / "m3-colors" / "colors.Xresources"
-        if xresources.exists():
-            subprocess.run(["xrdb", "-merge", str(xresources)])
-            print(f"Applied Xresources")
+        if not (self.prefetch and self.playlist):
+            return
+        # Position changed: a still running prefetch is obsolete
+        if self._prefetch_proc is not None and self._prefetch_proc.poll() is None:
+            self._prefetch_proc.terminate()
 
-    def set_wallpaper(self):
-        """Set wallpaper using feh"""
-        import subprocess
+        command = [sys.executable, '-m', 'm3wal.m3wal', 'prefetch', self.playlist,
+                   '--count', str(self.prefetch), '--current', str(wallpaper), '--templates']
+        if self.mode:
+            command += ['--mode', self.mode]
+        if self.variant:
+            command += ['--variant', self.variant]
+        self._prefetch_proc = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                               stderr=subprocess.DEVNULL, start_new_session=True)
 
-        wallpaper = Path(self.wallpaper_path).expanduser()
-        if wallpaper.exists():
-            subprocess.run(["feh", "--bg-fill", str(wallpaper)])
-            print(f"Set wallpaper with feh")
+    def find_initial(self):
+        """Paths considered for the --initial run"""
+        if self.target.is_dir():
+            images = [p for p in self.target.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS]
+            return sorted(images, key=lambda p: p.stat().st_mtime)
+        return [self.target]
 
-    def apply_template(self, template_path, output_path, colors=None):
-        """Apply colors to single template file
-        
-        Args:
-            template_path: Path to template file
-            output_path: Path to output file
-            colors: Optional pre-extracted colors dict (untuk speed)
-        """
-        if not self.theme:
-            raise ValueError("Generate scheme first!")
+    def watch(self, initial=False):
+        """Watch until SIGTERM / Ctrl-C"""
+        import signal
 
-        # Use provided colors or extract new
-        if colors is None:
-            colors = self._extract_colors()
-            
-            # Add metadata
-            colors["wallpaper_path"] = self.wallpaper_path
-            colors["mode"] = self.mode
-            colors["source_color"] = (
-                hex_from_argb(self.source_color)
-                if isinstance(self.source_color, int)
-                else self.source_color
-            )
+        if not (self.target.exists() or self.target.is_symlink()):
+            raise RuntimeError(f"Nothing to watch at {self.target}")
 
-        # Read template
-        with open(template_path, "r") as f:
-            template = f.read()
+        self._load_config()
+        watcher = self._open_watch()
+        watched = set()
 
-        # Replace all placeholders {{key}}
-        for key, value in colors.items():
-            template = template.replace(f"{{{{{key}}}}}", str(value))
+        def refresh_watches():
+            # A retargeted symlink may point into a new directory
+            for directory in self._watch_dirs() - watched:
+                watcher.add_watch(directory)
+                watched.add(directory)
 
-        # Write output
-        with open(output_path, "w") as f:
-            f.write(template)
+        refresh_watches()
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'running', False))
+        self.running = True
+        print(f"[WATCH] Watching {self.target} (debounce {self.debounce}s, pid {os.getpid()})")
+
+        if initial:
+            wallpaper = self._pick(self.find_initial())
+            if wallpaper is not None:
+                self.run_once(wallpaper)
+
+        try:
+            while self.running:
+                changed = self._relevant(watcher.read(1.0))
+                if not changed:
+                    continue
+
+                # Debounce: wait until the watched directories are quiet for
+                # self.debounce seconds (tools like ln -sf go through temp names)
+                while True:
+                    events = watcher.read(self.debounce)
+                    if not events:
+                        break
+                    changed.extend(self._relevant(events))
+
+                wallpaper = self._pick(changed)
+                if wallpaper is not None:
+                    self.run_once(wallpaper)
+                refresh_watches()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            print("[WATCH] Stopped")
+
+
+def watch_main(argv):
+    """m3wal watch: regenerate whenever the wallpaper changes"""
+    import argparse
+
+    default_target = Path.home() / ".config" / "m3-colors" / "current_wallpaper"
+    parser = argparse.ArgumentParser(
+        prog='m3wal watch',
+        description='Watch a wallpaper file, directory or symlink and re-run m3wal on changes',
+    )
+    parser.add_argument('target', nargs='?', default=str(default_target),
+                        help=f'File, directory or symlink to watch (default: {default_target})')
+    parser.add_argument('--mode', '-m', choices=['light', 'dark', 'auto'])
+    parser.add_argument('--variant', '-v',
+                        choices=['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL',
+                                 'FIDELITY', 'CONTENT', 'MONOCHROME', 'AUTO'])
+    parser.add_argument('--generator-only', '-g', action='store_true')
+    parser.add_argument('--full', '-f', action='store_true')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='Quiet period before running, in seconds (default: 0.5)')
+    parser.add_argument('--initial', action='store_true',
+                        help='Apply the current wallpaper once at startup')
+    parser.add_argument('--poll', action='store_true', help='Poll instead of using inotify')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='Polling interval in seconds (default: 1.0)')
+    parser.add_argument('--max-recent', type=int, default=16,
+                        help='Wallpapers kept warm in memory (default: 16)')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='N',
+                        help='After each run, prefetch the next N playlist wallpapers in the background')
+    parser.add_argument('--playlist',
+                        help='Playlist file or directory for --prefetch (default: the watched directory)')
+    args = parser.parse_args(argv)
+
+    operation_mode = 'generator' if args.generator_only else ('full' if args.full else None)
+    watcher = WallpaperWatcher(args.target, args.mode, args.variant, operation_mode,
+                               args.debounce, args.poll, args.interval, args.max_recent,
+                               args.prefetch, args.playlist)
+    try:
+        watcher.watch(args.initial)
+    except RuntimeError as e:
+        print(f"[WATCH] {e}")
+        return 1
+    return 0
+
+
+SUBCOMMANDS = {
+    'batch': batch_main,
+    'daemon': daemon_main,
+    'client': client_main,
+    'watch': watch_main,
+    'prefetch': prefetch_main,
+    'dedupe': dedupe_main,
+    'multi': multi_main,
+}
 
-        return output_path
 
 def main():
     import argparse
+
+    # Subcommands (a wallpaper file with the same name still wins)
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS and not Path(sys.argv[1]).is_file():
+        sys.exit(SUBCOMMANDS[sys.argv[1]](sys.argv[2:]))
     
     # Setup argument parser
     parser = argparse.ArgumentParser(
@@ -1026,6 +4192,8 @@ def main():
                             choices=['TONALSPOT', 'VIBRANT', 'EXPRESSIVE', 'NEUTRAL', 
                                     'FIDELITY', 'CONTENT', 'MONOCHROME', 'AUTO'],
                             help='Material 3 variant (use AUTO for auto-detection, overrides config)')
+    color_group.add_argument('--all-variants', action='store_true',
+                            help='Also export every variant (light + dark) to JSON and an all-variants preview')
 
     # Execution modes
     mode_group = parser.add_argument_group('execution modes')
@@ -1033,131 +4201,98 @@ def main():
                         help='Only generate colors, skip ricing')
     mode_group.add_argument('--full', '-f', action='store_true',
                         help='Apply all configurations')
+
+    # Scheme cache
+    cache_group = parser.add_argument_group('scheme cache')
+    cache_group.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the scheme cache')
+    cache_group.add_argument('--rebuild-cache', action='store_true',
+                        help='Ignore cached schemes and regenerate them')
+
+    # Analysis
+    analysis_group = parser.add_argument_group('analysis')
+    analysis_group.add_argument('--resolution-report', action='store_true',
+                        help='Compare source color at max_analysis_pixels against full resolution, then exit')
+
+    # Instrumentation
+    instrument_group = parser.add_argument_group('instrumentation')
+    instrument_group.add_argument('--timings', action='store_true',
+                        help='Print wall time, CPU time and peak RSS per stage')
+    instrument_group.add_argument('--profile', nargs='?', const='m3wal.pstats', metavar='FILE',
+                        help='Run under cProfile and dump stats to FILE (default: m3wal.pstats); '
+                             'ricing stages run sequentially')
+    instrument_group.add_argument('--events', metavar='FILE',
+                        help="Write JSON-lines events (stages, cache hits, written files) to FILE ('-' = stderr)")
     
     args = parser.parse_args()
+    instrumentation = set_instrumentation(
+        Instrumentation(json_lines_sink(_open_events(args.events)) if args.events else None)
+    )
+    cache_options = {'use_cache': not args.no_cache, 'rebuild_cache': args.rebuild_cache}
     
     # Initialize - gunakan class sesuai mode
     wallpaper = args.wallpaper
     
+    # Config is loaded once and shared
+    config = M3Color.load_config()
+    
     # Determine operation mode
     if args.generator_only:
         operation_mode = 'generator'
-        m3wal = M3Color(wallpaper)
+        m3wal = M3Color(wallpaper, config, **cache_options)
         print("[INFO] Using --generator-only flag")
     elif args.full:
         operation_mode = 'full'
-        m3wal = M3WAL(wallpaper)
+        m3wal = M3WAL(wallpaper, config, **cache_options)
         print("[INFO] Using --full flag")
     else:
         # Use config default
         config_file = Path.home() / ".config" / "m3-colors" / "m3-colors.conf"
         print(f"[INFO] Using default config: {config_file}")
         
-        temp_config = M3Color(wallpaper).config
-        operation_mode = temp_config.get('General', 'operation_mode', fallback='full')
+        operation_mode = config.get('General', 'operation_mode', fallback='full')
         
         if operation_mode == 'generator':
-            m3wal = M3Color(wallpaper)
+            m3wal = M3Color(wallpaper, config, **cache_options)
         else:
-            m3wal = M3WAL(wallpaper)
+            m3wal = M3WAL(wallpaper, config, **cache_options)
         
         print(f"[INFO] Config operation_mode: {operation_mode}")
     
-    # Override config with CLI args if provided
-    mode = args.mode if args.mode else m3wal.config.get('General', 'mode', fallback='auto')
-    variant = args.variant if args.variant else m3wal.config.get('General', 'variant', fallback='CONTENT')
-    
-    if args.mode:
-        print(f"[INFO] Mode overridden by CLI: {mode}")
-    if args.variant:
-        print(f"[INFO] Variant overridden by CLI: {variant}")
-    
-    print(f"\nOperation Mode: {operation_mode}")
-    print(f"="*50)
-    
-    # ===== CORE OPERATIONS (Always run) =====
-    print("\n[CORE] Analyzing wallpaper...")
-    analysis = m3wal.analyze_wallpaper()
-    print(f"Brightness: {analysis['brightness']:.1f} (threshold: {m3wal.brightness_threshold})")
-    print(f"Auto-detected mode: {analysis['mode']}")
-    
-    # Generate scheme
-    if mode == "auto":
-        mode = analysis["mode"]
-    
-    print(f"\n[CORE] Generating {mode} scheme with {variant} variant...")
-    colors = m3wal.generate_scheme(mode, variant)
-    print(f"Generated {len(colors)} colors")
-    
-    # Export to JSON
-    print("\n[CORE] Exporting color scheme...")
-    output = m3wal.export_json(variant=variant)
-    output_css = m3wal.export_css(variant=variant)
+    try:
+        if args.resolution_report:
+            report = m3wal.compare_full_resolution()
+            print("\n[REPORT] Source color: bounded vs full resolution")
+            print(f"Full size: {report['full_size'][0]}x{report['full_size'][1]}")
+            print(f"Analysis size: {report['analysis_size'][0]}x{report['analysis_size'][1]} "
+                  f"(max_analysis_pixels: {report['max_analysis_pixels']})")
+            print(f"Source (full): {report['source_full']}")
+            print(f"Source (bounded): {report['source_bounded']}")
+            print(f"Delta: hue={report['delta_hue']:.2f} chroma={report['delta_chroma']:.2f} "
+                  f"tone={report['delta_tone']:.2f} rgb={report['delta_rgb']:.2f}")
+            print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+            return
+
+        if args.profile:
+            import cProfile
+            import pstats
+
+            profiler = cProfile.Profile()
+            profiler.runcall(run_pipeline, m3wal, operation_mode, args.mode, args.variant,
+                             args.all_variants, sequential=True)
+            profiler.dump_stats(args.profile)
+            print(f"\n[PROFILE] Stats written to: {args.profile}")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        else:
+            run_pipeline(m3wal, operation_mode, args.mode, args.variant, args.all_variants)
+
+        if args.timings:
+            instrumentation.print_report()
+    except MemoryError as e:
+        # Over max_memory_mb: fail cleanly instead of risking the OOM killer
+        print(f"[MEMORY] {e}")
+        sys.exit(1)
 
-    # Show preview
-    print("\n[CORE] Color Preview:")
-    m3wal.preview_colors()
-    
-    # Generate palette preview (if enabled)
-    if m3wal.config.getboolean('Features', 'generate_palette_preview', fallback=True):
-        print("\n[CORE] Generating palette preview...")
-        m3wal.generate_palette_preview()
-    
-    # ===== RICING OPERATIONS (Only if full mode) =====
-    if operation_mode == 'full':
-        print(f"\n{'='*50}")
-        print("[RICING] Applying configurations...")
-        print(f"{'='*50}")
-        
-        # Apply to all templates
-        cache_dir = Path(m3wal.config.get('Paths', 'cache_dir', fallback='~/.cache/m3-colors')).expanduser()
-        generated_files = m3wal.apply_all_templates(output_dir=cache_dir)
-        
-        if generated_files:
-            print(f"\nGenerated {len(generated_files)} config files")
-        
-        # Deploy configs
-        print("\n[RICING] Deploying configs...")
-        m3wal.deploy_configs()
-        
-        # Run hook script
-        print("\n[RICING] Run Hook Scripts...")
-        m3wal.run_hook_scripts()
-        
-        # Apply Xresources
-        if m3wal.config.getboolean('Features', 'apply_xresources', fallback=True):
-            print("\n[RICING] Applying Xresources...")
-            m3wal.apply_xresources()
-        
-        # Set wallpaper
-        if m3wal.config.getboolean('Features', 'set_wallpaper', fallback=True):
-            print("\n[RICING] Setting wallpaper...")
-            m3wal.set_wallpaper()
-        
-        # Create wallpaper symlink
-        if m3wal.config.getboolean('Features', 'create_symlink', fallback=True):
-            print("\n[RICING] Creating wallpaper symlink...")
-            m3wal.create_wallpaper_symlink()
-        
-        # Run post script
-        if m3wal.config.getboolean('Features', 'run_post_script', fallback=True):
-            script_path = m3wal.config.get('PostScript', 'script_path', fallback='m3wal-post.sh')
-            # if relative path, merge with config_dir
-            if not Path(script_path).is_absolute():
-                config_dir = Path(m3wal.config.get('Paths', 'config_dir', fallback='~/.config/m3-colors')).expanduser()
-                script_path = config_dir / script_path
-            
-            print("\n[RICING] Running post script...")
-            m3wal.run_post_script(script_path)
-    
-    else:
-        print(f"\n{'='*50}")
-        print("[INFO] Generator-only mode: Ricing operations skipped")
-        print(f"Use --full flag or set operation_mode='full' in config")
-        print(f"to apply configurations to your system")
-        print(f"{'='*50}")
-    
-    print(f"\nDone!")
 
 if __name__ == "__main__":
     main()
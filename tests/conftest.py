@@ -0,0 +1,44 @@
+import configparser
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    """Point HOME at a scratch directory so no test touches the real config"""
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    return home
+
+
+@pytest.fixture
+def config(tmp_path):
+    """In-memory config with the scheme cache disabled"""
+    config = configparser.ConfigParser()
+    config.read_dict({
+        "General": {"mode": "auto", "variant": "CONTENT", "brightness_threshold": "128"},
+        "Paths": {"cache_dir": str(tmp_path / "cache")},
+        "Cache": {"enabled": "false"},
+    })
+    return config
+
+
+@pytest.fixture
+def make_wallpaper(tmp_path):
+    """Factory writing smooth random color fields (below the analysis bound)"""
+    import numpy as np
+    from PIL import Image
+
+    def make(name="wall.png", seed=0, size=(1280, 720), alpha=False):
+        rng = np.random.default_rng(seed)
+        field = rng.integers(0, 256, size=(6, 10, 3), dtype=np.uint8)
+        img = Image.fromarray(field).resize(size, Image.BICUBIC)
+        if alpha:
+            ramp = np.linspace(0, 510, size[0]).clip(0, 255).astype(np.uint8)
+            img.putalpha(Image.fromarray(np.broadcast_to(ramp, (size[1], size[0])).copy()))
+        path = tmp_path / name
+        img.save(path)
+        return str(path)
+
+    return make
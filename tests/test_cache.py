@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import m3wal.m3wal as m3wal_module
+from m3wal.m3wal import M3Color, SchemeCache
+
+
+def fill(cache, count, size=1000):
+    """Put count entries of about size bytes, oldest first"""
+    for i in range(count):
+        cache.put(f"k{i}", {"data": "x" * size})
+        os.utime(cache._entry_path(f"k{i}"), (1000 + i, 1000 + i))
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = SchemeCache(tmp_path)
+    cache.put("key", {"schemes": [1, 2, 3]})
+
+    assert cache.contains("key")
+    assert cache.get("key") == {"schemes": [1, 2, 3]}
+    assert cache.get("missing") is None
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = SchemeCache(tmp_path)
+    cache.put("key", {})
+    cache._entry_path("key").write_text("{not json")
+
+    assert cache.get("key") is None
+
+
+def test_evicts_least_recently_used_to_90_percent(tmp_path):
+    cache = SchemeCache(tmp_path, max_size_mb=10_000 / (1024 * 1024))
+    fill(cache, 9)
+    cache.get("k0")  # touched: now the most recently used
+
+    cache.put("new", {"data": "x" * 3000})
+
+    remaining = {path.stem for path in cache.cache_dir.glob("*.json")}
+    assert "k0" in remaining and "new" in remaining
+    assert "k1" not in remaining and "k2" not in remaining
+    assert sum(path.stat().st_size for path in cache.cache_dir.glob("*.json")) <= cache.max_size * 0.9
+
+
+def test_size_is_tracked_without_rescanning(tmp_path, monkeypatch):
+    cache = SchemeCache(tmp_path, max_size_mb=1)
+    cache.put("first", {})  # first put in this process counts the directory
+
+    scans = []
+    monkeypatch.setattr(SchemeCache, "evict", lambda self: scans.append(self))
+    for _ in range(3):
+        cache.put("first", {"data": "x" * 100})  # rewrite: no growth
+    fill(cache, 20)
+
+    assert scans == []
+    actual = sum(path.stat().st_size for path in cache.cache_dir.glob("*.json"))
+    assert SchemeCache._sizes[str(cache.cache_dir)] == actual
+
+
+def test_crossing_the_cap_triggers_a_scan(tmp_path, monkeypatch):
+    cache = SchemeCache(tmp_path, max_size_mb=5000 / (1024 * 1024))
+    cache.put("first", {})
+
+    scans = []
+    monkeypatch.setattr(SchemeCache, "evict", lambda self: scans.append(self))
+    fill(cache, 6)
+
+    assert scans
+
+
+@pytest.fixture
+def cached_config(config):
+    config.set("Cache", "enabled", "true")
+    config.set("Cache", "perceptual_match", "false")
+    return config
+
+
+def test_key_depends_on_parts_and_library_version(cached_config, make_wallpaper, monkeypatch):
+    m3 = M3Color(make_wallpaper(), config=cached_config)
+
+    assert m3._cache_key("CONTENT") != m3._cache_key("VIBRANT")
+    assert m3._cache_key("preview", "CONTENT", "dark") != m3._cache_key("preview", "CONTENT", "light")
+
+    key = m3._cache_key("CONTENT")
+    monkeypatch.setattr(m3wal_module, "_library_version_string", "c0-other-versions")
+    assert m3._cache_key("CONTENT") != key
+
+
+def test_second_run_hits_the_cache(cached_config, make_wallpaper):
+    path = make_wallpaper()
+    first = M3Color(path, config=cached_config)
+    colors = dict(first.generate_scheme("dark", "CONTENT"))
+
+    second = M3Color(path, config=cached_config)
+    entry = second._variant_schemes("CONTENT")
+    assert entry["cached"]
+    assert dict(second.generate_scheme("dark", "CONTENT")) == colors
@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+from m3wal.m3wal import M3WAL
+
+
+@pytest.fixture
+def cache_dir(config, tmp_path):
+    path = tmp_path / "cache"
+    path.mkdir()
+    (path / "colors.css").write_text("a { color: #336699; }\n")
+    return path
+
+
+@pytest.fixture
+def deploy(home, config, cache_dir, tmp_path):
+    """deploy(strategy) -> destination after deploying colors.css with it"""
+    dest = tmp_path / "dest" / "nested" / "colors.css"
+
+    def run(strategy=None, source="colors.css"):
+        item = {"source": source, "destination": str(dest)}
+        if strategy:
+            item["strategy"] = strategy
+        config_file = home / ".config" / "m3-colors" / "deploy.json"
+        config_file.parent.mkdir(parents=True, exist_ok=True)
+        config_file.write_text(json.dumps({"deployments": [item]}))
+
+        m3wal = M3WAL("unused.png", config=config, use_cache=False)
+        m3wal.deploy_configs()
+        run.changed = list(m3wal.changed_files)
+        return dest
+
+    return run
+
+
+def render(cache_dir, text):
+    """Replace the rendered file atomically, as template rendering does"""
+    tmp = cache_dir / ".colors.css.tmp"
+    tmp.write_text(text)
+    os.replace(tmp, cache_dir / "colors.css")
+
+
+@pytest.mark.parametrize("strategy", [None, "atomic-copy", "copy", "symlink", "hardlink", "reflink", "bogus"])
+def test_every_strategy_deploys_the_rendered_content(deploy, cache_dir, strategy):
+    dest = deploy(strategy)
+
+    assert dest.read_text() == (cache_dir / "colors.css").read_text()
+    assert deploy.changed == [str(dest)]
+
+
+@pytest.mark.parametrize("strategy", ["atomic-copy", "copy", "symlink", "hardlink", "reflink"])
+def test_unchanged_destination_is_not_rewritten(deploy, strategy):
+    dest = deploy(strategy)
+    before = os.lstat(dest)
+
+    deploy(strategy)
+
+    after = os.lstat(dest)
+    assert deploy.changed == []
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+
+@pytest.mark.parametrize("strategy", ["atomic-copy", "copy", "symlink", "hardlink", "reflink"])
+def test_new_render_is_deployed(deploy, cache_dir, strategy):
+    deploy(strategy)
+    render(cache_dir, "a { color: #ffffff; }\n")
+
+    dest = deploy(strategy)
+
+    assert dest.read_text() == "a { color: #ffffff; }\n"
+    # A symlink already shows the new render and is never rewritten
+    assert deploy.changed == ([] if strategy == "symlink" else [str(dest)])
+
+
+def test_copy_keeps_the_destination_inode(deploy, cache_dir):
+    inode = deploy("copy").stat().st_ino
+    render(cache_dir, "changed\n")
+
+    assert deploy("copy").stat().st_ino == inode
+
+
+def test_atomic_copy_replaces_the_destination(deploy, cache_dir):
+    inode = deploy("atomic-copy").stat().st_ino
+    render(cache_dir, "changed\n")
+
+    assert deploy("atomic-copy").stat().st_ino != inode
+
+
+def test_symlink_and_hardlink_point_at_the_rendered_file(deploy, cache_dir):
+    dest = deploy("symlink")
+    assert dest.is_symlink() and dest.resolve() == (cache_dir / "colors.css").resolve()
+
+    dest = deploy("hardlink")
+    assert not dest.is_symlink() and os.path.samefile(dest, cache_dir / "colors.css")
+
+
+def test_switching_away_from_symlink_does_not_write_through(deploy, cache_dir):
+    deploy("symlink")
+    dest = deploy("copy")
+
+    assert not dest.is_symlink()
+    assert (cache_dir / "colors.css").read_text() == "a { color: #336699; }\n"
+
+
+def test_missing_source_is_skipped(deploy, capsys):
+    dest = deploy("atomic-copy", source="missing.css")
+
+    assert not dest.exists()
+    assert "missing.css not found" in capsys.readouterr().out
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+from m3wal.m3wal import M3WAL, SCHEME_ROLES, Scheme, parse_hook_groups
+
+
+@pytest.mark.parametrize("value, groups", [
+    ("a.sh", [["a.sh"]]),
+    ("a.sh, b.sh", [["a.sh", "b.sh"]]),
+    ("a.sh, b.sh; c.sh", [["a.sh", "b.sh"], ["c.sh"]]),
+    (" a.sh ;; ,b.sh, ;", [["a.sh"], ["b.sh"]]),
+    ("", []),
+])
+def test_parse_hook_groups(value, groups):
+    assert parse_hook_groups(value) == groups
+
+
+@pytest.fixture
+def scripts_dir(tmp_path):
+    path = tmp_path / "hooks"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def run_hooks(config, scripts_dir, tmp_path):
+    """run_hooks(scripts, **options) -> results of run_hook_scripts()"""
+    def run(scripts, **options):
+        config.read_dict({
+            "Hooks": {"scripts_dir": str(scripts_dir)},
+            "Hook.Scripts": {"enabled": "true", "scripts": scripts, **options},
+        })
+        m3wal = M3WAL(str(tmp_path / "wall.png"), config=config, use_cache=False)
+        m3wal.mode = "dark"
+        m3wal._scheme = {mode: Scheme([0xFF336699] * len(SCHEME_ROLES)) for mode in ("light", "dark")}
+        return m3wal.run_hook_scripts()
+    return run
+
+
+def alive(pid):
+    """Whether pid is running (a killed orphan may linger as a zombie)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def write_script(scripts_dir, name, body):
+    (scripts_dir / name).write_text(body)
+
+
+def logging_script(scripts_dir, name, log, seconds=0.2):
+    """Script logging its start and end to log"""
+    write_script(scripts_dir, name, f"echo start {name} >> {log}\nsleep {seconds}\necho end {name} >> {log}\n")
+
+
+def test_scripts_run_in_order_by_default(run_hooks, scripts_dir, tmp_path):
+    log = tmp_path / "log"
+    for name in ("a.sh", "b.sh", "c.sh"):
+        logging_script(scripts_dir, name, log, 0.05)
+
+    results = run_hooks("a.sh, b.sh, c.sh")
+
+    assert [status for _, _, status, _ in results] == ["ok"] * 3
+    assert log.read_text().split("\n")[:-1] == [
+        "start a.sh", "end a.sh", "start b.sh", "end b.sh", "start c.sh", "end c.sh"]
+
+
+def test_groups_run_concurrently_when_opted_in(run_hooks, scripts_dir, tmp_path):
+    log = tmp_path / "log"
+    for name in ("a.sh", "b.sh", "c.sh"):
+        logging_script(scripts_dir, name, log)
+
+    run_hooks("a.sh, b.sh; c.sh", max_parallel="2")
+
+    lines = log.read_text().split("\n")[:-1]
+    assert set(lines[:2]) == {"start a.sh", "start b.sh"}
+    assert lines[4:] == ["start c.sh", "end c.sh"]
+
+
+def test_hook_environment(run_hooks, scripts_dir, tmp_path):
+    out = tmp_path / "env"
+    write_script(scripts_dir, "env.sh", f'echo "$M3_MODE $M3_M3PRIMARY $M3_M3PRIMARY_RGB" > {out}\n')
+
+    run_hooks("env.sh")
+
+    assert out.read_text() == "dark #336699 51,102,153\n"
+
+
+def test_statuses(run_hooks, scripts_dir):
+    write_script(scripts_dir, "fail.sh", "exit 3\n")
+
+    results = {name: status for name, _, status, _ in run_hooks("fail.sh, missing.sh")}
+
+    assert results == {"fail.sh": "exit 3", "missing.sh": "missing"}
+
+
+def test_script_output_goes_through_sys_stdout(run_hooks, scripts_dir, capsys):
+    # Printed via sys.stdout, so run_stages can buffer it with the hooks stage
+    write_script(scripts_dir, "talk.sh", "echo out\necho err >&2\n")
+
+    run_hooks("talk.sh")
+
+    out = capsys.readouterr().out
+    assert "out\nerr\n" in out
+    assert out.index("err") < out.index("✓ talk.sh")
+
+
+def test_timeout_kills_processes_the_script_started(run_hooks, scripts_dir, tmp_path):
+    pid_file = tmp_path / "pid"
+    write_script(scripts_dir, "slow.sh", f"sleep 30 &\necho $! > {pid_file}\nwait\n")
+
+    start = time.perf_counter()
+    results = run_hooks("slow.sh", timeout="0.5")
+
+    assert results[0][2] == "timeout"
+    assert time.perf_counter() - start < 10
+    pid = int(pid_file.read_text())
+    deadline = time.perf_counter() + 5
+    while alive(pid) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    assert not alive(pid)
+
+
+def test_disabled_hooks_do_not_run(run_hooks, scripts_dir, tmp_path):
+    logging_script(scripts_dir, "a.sh", tmp_path / "log")
+
+    assert run_hooks("a.sh", enabled="false") == []
+    assert not (tmp_path / "log").exists()
@@ -0,0 +1,32 @@
+import pytest
+from PIL import Image
+from material_color_utilities import Variant, theme_from_image
+
+from m3wal.m3wal import MODES, VARIANTS, M3Color
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_source_matches_theme_from_image(config, make_wallpaper, seed):
+    path = make_wallpaper(f"{seed}.png", seed)
+    expected = theme_from_image(Image.open(path), 0, Variant.CONTENT).source
+
+    assert M3Color(path, config=config, use_cache=False).quantize_source() == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_source_ignores_transparent_pixels(config, make_wallpaper, seed):
+    path = make_wallpaper(f"{seed}.png", seed, alpha=True)
+    expected = theme_from_image(Image.open(path), 0, Variant.CONTENT).source
+
+    assert M3Color(path, config=config, use_cache=False).quantize_source() == expected
+
+
+def test_single_pass_schemes_match_theme_from_image(config, make_wallpaper):
+    path = make_wallpaper(seed=7)
+    m3 = M3Color(path, config=config, use_cache=False)
+    schemes = m3.generate_schemes(VARIANTS, MODES)
+
+    for variant in VARIANTS:
+        theme = theme_from_image(Image.open(path), 0, m3._variant_enum(variant))
+        for mode in MODES:
+            assert dict(schemes[(variant, mode)]) == dict(m3._colors_from_theme(theme, mode)), (variant, mode)
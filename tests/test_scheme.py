@@ -0,0 +1,69 @@
+import pickle
+
+import pytest
+
+from m3wal.m3wal import SCHEME_ROLES, Scheme
+
+
+@pytest.fixture
+def colors():
+    """Role -> '#rrggbb' dict like the one schemes used to be"""
+    return {role: f"#{(i * 0x0A1B2C) & 0xFFFFFF:06x}" for i, role in enumerate(SCHEME_ROLES)}
+
+
+def test_mapping_matches_former_colors_dict(colors):
+    scheme = Scheme.from_colors(colors)
+    expected = dict(colors)
+    for role, value in colors.items():
+        r, g, b = (int(value[i:i + 2], 16) for i in (1, 3, 5))
+        expected[f"{role}_rgb"] = f"{r},{g},{b}"
+
+    assert dict(scheme) == expected
+    assert len(scheme) == len(expected)
+    assert list(scheme)[:len(SCHEME_ROLES)] == list(SCHEME_ROLES)
+    assert scheme == expected
+
+
+def test_lookup(colors):
+    scheme = Scheme.from_colors(colors)
+
+    assert scheme["m3primary"] == colors["m3primary"]
+    assert "m3primary_rgb" in scheme and "term15" in scheme
+    assert "m3bogus" not in scheme and "m3bogus_rgb" not in scheme and 5 not in scheme
+    assert scheme.get("m3bogus") is None
+    with pytest.raises(KeyError):
+        scheme["m3bogus_rgb"]
+
+
+def test_formats():
+    scheme = Scheme([0xFF336699] * len(SCHEME_ROLES))
+
+    assert scheme.argb("m3primary") == 0xFF336699
+    assert scheme.hex("m3primary") == "#336699"
+    assert scheme.rgb("m3primary") == (51, 102, 153)
+    assert scheme.rgba("m3primary", 0.8) == "rgba(51, 102, 153, 0.8)"
+    assert scheme.floats("m3primary") == (0.2, 0.4, 0.6)
+    h, s, l = scheme.hsl("m3primary")
+    assert (round(h), round(s), round(l)) == (210, 50, 40)
+
+
+def test_argb_roundtrip_and_pickle(colors):
+    scheme = Scheme.from_colors(colors)
+
+    assert Scheme(scheme.argb_values()) == scheme
+    assert pickle.loads(pickle.dumps(scheme)) == scheme
+    assert scheme != Scheme([0xFF000000] * len(SCHEME_ROLES))
+
+
+def test_wrong_length_is_rejected():
+    with pytest.raises(ValueError):
+        Scheme([0xFF000000] * (len(SCHEME_ROLES) - 1))
+
+
+def test_read_only(colors):
+    scheme = Scheme.from_colors(colors)
+
+    with pytest.raises(TypeError):
+        scheme["m3primary"] = "#000000"
+    with pytest.raises(AttributeError):
+        scheme.extra = 1
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from m3wal.m3wal import run_stages
+
+
+def make_stages(log, specs, fail=()):
+    """Stages from (name, inputs[, after]) specs that log when they run"""
+    lock = threading.Lock()
+
+    def runner(name):
+        def run():
+            time.sleep(0.01)
+            with lock:
+                log.append(name)
+            if name in fail:
+                raise RuntimeError(f"{name} failed")
+        return run
+
+    stages = []
+    for spec in specs:
+        name, inputs = spec[:2]
+        stage = {"name": name, "run": runner(name), "inputs": inputs}
+        if len(spec) > 2:
+            stage["after"] = spec[2]
+        stages.append(stage)
+    return stages
+
+
+PIPELINE = [
+    ("templates", ()),
+    ("deploy", ("templates",)),
+    ("hooks", ("deploy",)),
+    ("xresources", ("templates",)),
+    ("wallpaper", ()),
+    ("post_script", (), ("deploy", "hooks", "xresources", "wallpaper")),
+]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_stages_run_after_their_inputs(workers):
+    log = []
+    results = run_stages(make_stages(log, PIPELINE), max_workers=workers)
+
+    assert all(status == "ok" for status, _ in results.values())
+    for name, inputs, *after in PIPELINE:
+        for dependency in (*inputs, *(after[0] if after else ())):
+            assert log.index(dependency) < log.index(name)
+    assert log[-1] == "post_script"
+
+
+def test_sequential_runs_in_list_order():
+    log = []
+    run_stages(make_stages(log, PIPELINE), max_workers=1)
+
+    assert log == [spec[0] for spec in PIPELINE]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_failure_skips_only_dependent_stages(workers):
+    log = []
+    results = run_stages(make_stages(log, PIPELINE, fail={"deploy"}), max_workers=workers)
+
+    assert results["deploy"][0] == "failed"
+    assert results["hooks"][0] == "skipped"
+    assert "hooks" not in log
+    assert {results[name][0] for name in ("templates", "xresources", "wallpaper")} == {"ok"}
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_after_dependencies_run_even_when_they_failed(workers):
+    log = []
+    results = run_stages(make_stages(log, PIPELINE, fail={"wallpaper", "deploy"}), max_workers=workers)
+
+    assert results["post_script"][0] == "ok"
+    assert log[-1] == "post_script"
+
+
+def test_fail_fast_stops_and_reraises():
+    log = []
+    stages = make_stages(log, [("a", ()), ("b", ("a",)), ("c", ("b",))], fail={"a"})
+
+    with pytest.raises(RuntimeError, match="a failed"):
+        run_stages(stages, max_workers=1, fail_fast=True)
+    assert log == ["a"]
+
+
+def test_unknown_inputs_are_ignored():
+    log = []
+    results = run_stages(make_stages(log, [("a", ("disabled",))]), max_workers=2)
+
+    assert results["a"][0] == "ok"
+
+
+def test_independent_stages_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+    stages = [{"name": name, "run": barrier.wait, "inputs": ()} for name in ("a", "b")]
+
+    results = run_stages(stages, max_workers=2)
+
+    assert results["a"][0] == results["b"][0] == "ok"
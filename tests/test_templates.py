@@ -0,0 +1,107 @@
+from pathlib import Path
+
+import pytest
+
+from m3wal.m3wal import SCHEME_ROLES, CompiledTemplate, Scheme
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "m3wal" / "templates"
+
+
+@pytest.fixture
+def colors():
+    scheme = Scheme([0xFF000000 | (i * 0x030507) & 0xFFFFFF for i in range(len(SCHEME_ROLES))])
+    return {**scheme, "wallpaper_path": "/walls/a.jpg", "m3test": "#336699"}
+
+
+def replace_render(text, colors):
+    """Rendering as the original str.replace() loop did it"""
+    for key, value in colors.items():
+        text = text.replace(f"{{{{{key}}}}}", str(value))
+    return text
+
+
+@pytest.mark.parametrize("template", sorted(TEMPLATES_DIR.glob("*.template")), ids=lambda p: p.name)
+def test_bundled_templates_render_like_str_replace(template, colors):
+    text = template.read_text()
+
+    assert CompiledTemplate(text).render(colors) == replace_render(text, colors)
+
+
+def test_unknown_placeholders_are_kept_and_reported(colors):
+    template = CompiledTemplate("a {{m3primary}} b {{m3primaryy}} c {{ m3primary }}")
+
+    assert template.render(colors) == f"a {colors['m3primary']} b {{{{m3primaryy}}}} c {{{{ m3primary }}}}"
+    assert template.unknown_keys(colors) == ["m3primaryy"]
+
+
+@pytest.mark.parametrize("placeholder, expected", [
+    ("m3test|hex", "#336699"),
+    ("m3test|strip", "336699"),
+    ("m3test|rgb", "51,102,153"),
+    ("m3test|alpha:0.8|rgba", "rgba(51, 102, 153, 0.8)"),
+    ("m3test|hsl", "hsl(210, 50%, 40%)"),
+    ("m3test|alpha:0.8", "#336699cc"),
+    ("m3test|alpha:0|hex", "#33669900"),
+    ("m3test|alpha:1", "#336699"),
+    ("m3test|lighten:10|strip", "407fbf"),
+    ("m3test|darken:10", "#264c73"),
+])
+def test_filters(colors, placeholder, expected):
+    assert CompiledTemplate(f"{{{{{placeholder}}}}}").render(colors) == expected
+
+
+@pytest.mark.parametrize("placeholder", [
+    "m3test|alpha:nan",
+    "m3test|alpha:inf",
+    "m3test|alpha:-inf",
+    "m3test|alpha:1.5",
+    "m3test|alpha:-0.1",
+    "m3test|alpha:x",
+    "m3test|alpha",
+    "m3test|lighten:nan",
+    "m3test|darken:inf",
+    "m3test|hex:1",
+    "m3test|bogus",
+    "m3test|rgb|alpha:0.5",
+    "wallpaper_path|rgb",
+])
+def test_invalid_filter_chains_are_kept_and_reported(colors, placeholder):
+    template = CompiledTemplate(f"x {{{{{placeholder}}}}} y")
+
+    assert template.render(colors) == f"x {{{{{placeholder}}}}} y"
+    assert template.unknown_keys(colors) == [placeholder]
+
+
+def test_filters_on_scheme_roles_are_cached_per_chain():
+    scheme = Scheme([0xFF336699] * len(SCHEME_ROLES))
+    template = CompiledTemplate("{{m3primary|alpha:0.5}} {{m3primary|alpha:0.5}} {{m3primary|rgb}}")
+
+    assert template.render(scheme) == "#33669980 #33669980 51,102,153"
+
+
+def test_pruned_prefetch_staging_falls_back_to_rendering(config, make_wallpaper, tmp_path, monkeypatch):
+    import shutil
+
+    from m3wal.m3wal import M3WAL
+
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "colors.css.template").write_text("{{m3primary}}\n")
+    config.read_dict({"Cache": {"enabled": "true"}})
+    m3wal = M3WAL(make_wallpaper(), config=config)
+    m3wal.mode, m3wal.variant = "dark", "CONTENT"
+    m3wal._scheme = {mode: Scheme([0xFF336699] * len(SCHEME_ROLES)) for mode in ("light", "dark")}
+    m3wal.prerender_templates(templates)
+
+    # Prefetch prunes the staging dir between the manifest check and the read
+    load_staged = m3wal._load_staged
+
+    def load_and_prune(template_list):
+        staging = load_staged(template_list)
+        shutil.rmtree(staging)
+        return staging
+
+    monkeypatch.setattr(m3wal, "_load_staged", load_and_prune)
+    m3wal.apply_all_templates(templates, tmp_path / "out")
+
+    assert (tmp_path / "out" / "colors.css").read_text() == "#336699\n"
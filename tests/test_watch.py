@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+from m3wal.m3wal import _Inotify
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+
+
+@pytest.fixture
+def inotify(tmp_path):
+    watcher = _Inotify()
+    watcher.add_watch(tmp_path)
+    yield watcher
+    watcher.close()
+
+
+def test_file_is_reported_once_written(inotify, tmp_path):
+    with open(tmp_path / "wall.png", "wb") as f:
+        f.write(b"partial")
+        f.flush()
+        assert inotify.read(0.2) == []
+
+    assert inotify.read(0.2) == [tmp_path / "wall.png"]
+
+
+def test_renamed_file_is_reported(inotify, tmp_path):
+    (tmp_path / ".wall.tmp").write_bytes(b"data")
+    inotify.read(0.2)
+
+    os.rename(tmp_path / ".wall.tmp", tmp_path / "wall.png")
+
+    assert inotify.read(0.2) == [tmp_path / "wall.png"]
+
+
+def test_new_symlink_is_reported(inotify, tmp_path):
+    os.symlink("/nonexistent/wall.png", tmp_path / "current_wallpaper")
+
+    assert inotify.read(0.2) == [tmp_path / "current_wallpaper"]
+
+
+def test_new_directory_is_not_reported(inotify, tmp_path):
+    (tmp_path / "subdir").mkdir()
+
+    assert inotify.read(0.2) == []